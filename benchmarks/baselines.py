@@ -0,0 +1,57 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+"""Saving benchmark results as JSON baselines, & comparing later results to them"""
+
+import json
+from typing import Any, Dict, List
+
+Results = Dict[str, Dict[str, float]]
+"""Metrics by benchmark case (or execution mode)"""
+
+
+def write_results(path: str, config: Dict[str, Any], results: Results) -> None:
+    with open(path, "w") as f:
+        json.dump({"config": config, "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def read_results(path: str) -> Dict[str, Any]:
+    """The `config` & `results` written by `write_results`"""
+    with open(path) as f:
+        return dict(json.load(f))
+
+
+def find_regressions(
+    results: Results, baseline: Results, metrics: Dict[str, bool], max_regression: float
+) -> List[str]:
+    """Describe each metric that is worse than in the baseline by more than `max_regression` (a fraction).
+    `metrics` are the names of the compared metrics, mapped to whether higher values are better.
+    Cases missing from either results are skipped
+    """
+    regressions = []
+    for case, stats in results.items():
+        baseline_stats = baseline.get(case)
+        if baseline_stats is None:
+            continue
+        for metric, higher_is_better in metrics.items():
+            if metric not in stats or not baseline_stats.get(metric):
+                continue
+            change = stats[metric] / baseline_stats[metric] - 1
+            if (-change if higher_is_better else change) > max_regression:
+                regressions.append(
+                    f"{case}: {metric} {baseline_stats[metric]:.4g} -> {stats[metric]:.4g} ({change:+.0%})"
+                )
+    return regressions
@@ -0,0 +1,71 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+"""Measures connections & TLS handshakes per job with and without keep-alive connection pooling.
+
+Usage: poetry run benchmark_connection_pool [--jobs N]
+"""
+
+import argparse
+import os
+import time
+from typing import Any, Dict
+from unittest import mock
+
+from compute_modules.client.internal_query_client import InternalQueryService
+
+from .runtime_stand_in import LocalRuntime
+
+
+def _echo(context: Any, event: Any) -> Any:
+    return event
+
+
+def _run(num_jobs: int, pool_size: int) -> Dict[str, float]:
+    with LocalRuntime() as runtime:
+        environ = {**runtime.environ(), "CONNECTION_POOL_SIZE": str(pool_size)}
+        with mock.patch.dict(os.environ, environ):
+            service = InternalQueryService(
+                registered_functions={"echo": _echo},
+                function_schemas=[],
+                function_schema_conversions={},
+                is_function_context_typed={"echo": False},
+            )
+        for i in range(num_jobs):
+            runtime.enqueue_job("echo", {"i": i})
+        start = time.perf_counter()
+        for _ in range(num_jobs):
+            service.handle_query()
+        elapsed = time.perf_counter() - start
+        assert runtime.wait_for_results(num_jobs, timeout=10), "Not all results were reported"
+        return {
+            "jobs_per_second": num_jobs / elapsed,
+            "connections_per_job": runtime.connections / num_jobs,
+            "full_handshakes_per_job": runtime.full_handshakes / num_jobs,
+            "resumed_handshakes_per_job": runtime.resumed_handshakes / num_jobs,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=500, help="Number of jobs to run per configuration")
+    args = parser.parse_args()
+    for label, pool_size in (("no pooling", 0), ("pooled", 2)):
+        stats = _run(num_jobs=args.jobs, pool_size=pool_size)
+        print(f"{label:<12} " + "  ".join(f"{key}={value:.3f}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
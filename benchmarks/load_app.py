@@ -0,0 +1,61 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+"""Compute Module used by `load_benchmark`: echoes its payload after spending `cost_ms` either
+busy on the CPU or sleeping, depending on LOAD_COST_KIND. `work_async` always sleeps
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+
+from compute_modules import add_function, start_compute_module
+from compute_modules.context import QueryContext
+
+COST_KIND = os.environ.get("LOAD_COST_KIND", "cpu")
+
+
+@dataclass
+class LoadInput:
+    payload: str
+    cost_ms: float
+
+
+def _spin(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def work(context: QueryContext, event: LoadInput) -> str:
+    if COST_KIND == "cpu":
+        _spin(event.cost_ms / 1000)
+    else:
+        time.sleep(event.cost_ms / 1000)
+    return event.payload
+
+
+async def work_async(context: QueryContext, event: LoadInput) -> str:
+    await asyncio.sleep(event.cost_ms / 1000)
+    return event.payload
+
+
+add_function(work)
+# How I/O bound functions are written for the asyncio execution mode
+add_function(work_async)
+
+if __name__ == "__main__":
+    start_compute_module()
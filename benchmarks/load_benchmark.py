@@ -0,0 +1,178 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+"""End-to-end load test: runs `benchmarks.load_app` with `start_compute_module` against the local runtime stand-in
+in each execution mode, and reports throughput, latency percentiles & the CPU & memory used by the Compute Module.
+
+The runtime keeps `--in-flight` jobs queued or executing until `--jobs` jobs have completed. Latency is measured
+by the runtime, from the time it hands a job out to the time the job's result is posted.
+
+Results can be saved with `--output` and compared to a previous run (e.g. of the last release) with `--baseline`,
+exiting with status 1 if throughput or p99 latency regressed by more than `--max-regression`.
+
+Usage: poetry run benchmark_load [--jobs N] [--payload-bytes N] [--cost-ms N] [--cost-kind cpu|sleep]
+                                 [--workers N] [--coroutines N] [--modes multiprocessing,asyncio]
+                                 [--output results.json] [--baseline results.json]
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from compute_modules.client.system_stats import get_cpu_seconds, get_descendant_pids, get_rss_bytes
+
+from .baselines import find_regressions, read_results, write_results
+from .runtime_stand_in import LocalRuntime
+
+EXECUTION_MODES = ("multiprocessing", "asyncio")
+JOBS_TIMEOUT_SECONDS = 600
+RSS_SAMPLE_INTERVAL_SECONDS = 0.2
+# Metrics compared to the baseline, & whether higher values are better
+COMPARED_METRICS = {"jobs_per_second": True, "p99_latency_ms": False}
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def _process_tree(pid: int) -> List[int]:
+    return [pid, *get_descendant_pids(pid)]
+
+
+def _cpu_seconds(pids: List[int]) -> float:
+    return sum(get_cpu_seconds(pid) or 0.0 for pid in pids)
+
+
+def _rss_bytes(pids: List[int]) -> int:
+    return sum(get_rss_bytes(pid) or 0 for pid in pids)
+
+
+def _run_jobs(
+    runtime: LocalRuntime, query_type: str, query: Any, num_jobs: int, in_flight: int, pids: List[int]
+) -> int:
+    """Run `num_jobs` jobs, keeping `in_flight` of them queued or executing.
+    Returns the peak memory of the processes `pids`, sampled while the jobs run
+    """
+    enqueued = 0
+    peak_rss = _rss_bytes(pids)
+    last_sample = time.perf_counter()
+    deadline = last_sample + JOBS_TIMEOUT_SECONDS
+    while len(runtime.results) < num_jobs:
+        assert time.perf_counter() < deadline, "Jobs timed out"
+        while enqueued < num_jobs and enqueued - len(runtime.results) < in_flight:
+            runtime.enqueue_job(query_type, query)
+            enqueued += 1
+        runtime.wait_for_results(len(runtime.results) + 1, timeout=RSS_SAMPLE_INTERVAL_SECONDS)
+        if time.perf_counter() - last_sample >= RSS_SAMPLE_INTERVAL_SECONDS:
+            peak_rss = max(peak_rss, _rss_bytes(pids))
+            last_sample = time.perf_counter()
+    return max(peak_rss, _rss_bytes(pids))
+
+
+def _run(mode: str, args: argparse.Namespace, environ: Dict[str, str]) -> Dict[str, float]:
+    query_type = "work_async" if mode == "asyncio" and args.cost_kind == "sleep" else "work"
+    query = {"payload": "x" * args.payload_bytes, "cost_ms": args.cost_ms}
+    with LocalRuntime() as runtime:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.load_app"],
+            env={
+                **os.environ,
+                **runtime.environ(),
+                "EXECUTION_MODE": mode,
+                "MAX_CONCURRENT_TASKS": str(args.workers),
+                "MAX_CONCURRENT_COROUTINES": str(args.coroutines),
+                "LOAD_COST_KIND": args.cost_kind,
+                **environ,
+            },
+        )
+        try:
+            # Warm up until the workers have started & executed jobs
+            _run_jobs(runtime, query_type, query, args.workers * 4, args.in_flight, [])
+            runtime.reset()
+            pids = _process_tree(process.pid)
+            cpu_before = _cpu_seconds(pids)
+            start = time.perf_counter()
+            peak_rss = _run_jobs(runtime, query_type, query, args.jobs, args.in_flight, pids)
+            elapsed = time.perf_counter() - start
+            cpu_seconds = _cpu_seconds(pids) - cpu_before
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+        latencies = runtime.latencies
+    return {
+        "jobs_per_second": args.jobs / elapsed,
+        "p50_latency_ms": _percentile(latencies, 50) * 1000,
+        "p99_latency_ms": _percentile(latencies, 99) * 1000,
+        "cpu_cores": cpu_seconds / elapsed,
+        "cpu_ms_per_job": cpu_seconds / args.jobs * 1000,
+        "peak_rss_mb": peak_rss / 2**20,
+    }
+
+
+def _parse_environ(assignments: Optional[List[str]]) -> Dict[str, str]:
+    environ = {}
+    for assignment in assignments or []:
+        key, separator, value = assignment.partition("=")
+        if not separator:
+            raise SystemExit(f"--env must be given as KEY=VALUE, got {assignment}")
+        environ[key] = value
+    return environ
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=2000, help="Number of jobs to run per execution mode")
+    parser.add_argument("--payload-bytes", type=int, default=1024, help="Size of the payload echoed by each job")
+    parser.add_argument("--cost-ms", type=float, default=1.0, help="Time each job spends in its function")
+    parser.add_argument("--cost-kind", choices=("cpu", "sleep"), default="cpu", help="Spin on the CPU or sleep")
+    parser.add_argument("--workers", type=int, default=4, help="MAX_CONCURRENT_TASKS")
+    parser.add_argument("--coroutines", type=int, default=16, help="MAX_CONCURRENT_COROUTINES in asyncio mode")
+    parser.add_argument("--in-flight", type=int, default=64, help="Number of jobs queued or executing at once")
+    parser.add_argument("--modes", default=",".join(EXECUTION_MODES), help="Comma-separated execution modes")
+    parser.add_argument("--env", action="append", help="KEY=VALUE environment variable of the Compute Module")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the results to those written to this JSON file by --output")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="Tolerated regression, as a fraction")
+    args = parser.parse_args()
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown_modes = set(modes) - set(EXECUTION_MODES)
+    if unknown_modes:
+        raise SystemExit(f"Unknown execution modes {sorted(unknown_modes)}, must be among {list(EXECUTION_MODES)}")
+    environ = _parse_environ(args.env)
+    results = {}
+    for mode in modes:
+        results[mode] = _run(mode, args, environ)
+        print(f"{mode:<16} " + "  ".join(f"{key}={value:.2f}" for key, value in results[mode].items()))
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "max_regression")}
+    if args.output:
+        write_results(args.output, config, results)
+    if args.baseline:
+        baseline = read_results(args.baseline)
+        if baseline["config"] != config:
+            print(f"Warning: the baseline was run with a different configuration: {baseline['config']}")
+        regressions = find_regressions(results, baseline["results"], COMPARED_METRICS, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+"""Micro-benchmarks of the per-job Python overhead: job decoding, payload conversion, result encoding, schema parsing,
+`QueryContext` construction & updating the job ID of loggers.
+
+Each case is timed with `timeit`, taking the fastest of `--repeat` runs (with GC disabled) as its time per call.
+Payloads are generated from a fixed seed so runs are comparable.
+
+Usage: poetry run benchmark_micro run [--filter convert_payload] [--output results.json] [--baseline baseline.json]
+       poetry run benchmark_micro compare baseline.json results.json [--max-regression 0.1]
+"""
+
+import argparse
+import dataclasses
+import datetime
+import json
+import platform
+import random
+import statistics
+import sys
+import timeit
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from compute_modules.client.json_codec import create_json_codec
+from compute_modules.context.types import QueryContext
+from compute_modules.function_registry.columns import Columns
+from compute_modules.function_registry.function_payload_converter import compile_payload_converter
+from compute_modules.function_registry.function_result_encoder import compile_result_encoder
+from compute_modules.function_registry.function_schema_parser import parse_function_schema
+from compute_modules.function_registry.types import FloatArray
+from compute_modules.logging.common import COMPUTE_MODULES_ADAPTER_MANAGER
+from compute_modules.logging.internal import get_internal_logger
+from compute_modules.logging.public import get_logger
+
+from .baselines import Results, find_regressions, read_results, write_results
+
+LARGE_SIZE = 100_000
+# Metrics compared to the baseline, & whether higher values are better
+COMPARED_METRICS = {"seconds_per_call": False}
+_random = random.Random(0)
+
+
+@dataclass
+class Leaf:
+    name: str
+    value: float
+    tags: List[str]
+    created: datetime.datetime
+
+
+@dataclass
+class Branch:
+    id: int
+    leaves: List[Leaf]
+    attributes: Dict[str, str]
+    parent: Optional[int]
+
+
+@dataclass
+class Tree:
+    name: str
+    branches: List[Branch]
+    metadata: Dict[str, int]
+
+
+@dataclass
+class ForestInput:
+    trees: List[Tree]
+    updated: datetime.date
+
+
+@dataclass
+class Record:
+    id: int
+    name: str
+    score: float
+
+
+@dataclass
+class RecordsInput:
+    records: List[Record]
+
+
+@dataclass
+class RecordColumnsInput:
+    records: Columns[Record]
+
+
+@dataclass
+class FloatsInput:
+    values: List[float]
+
+
+@dataclass
+class FloatArrayInput:
+    values: FloatArray
+
+
+@dataclass
+class MapInput:
+    entries: Dict[str, int]
+
+
+@dataclass
+class TimestampsInput:
+    timestamps: List[datetime.datetime]
+
+
+def _forest_payload(num_trees: int = 5, num_branches: int = 10, num_leaves: int = 10) -> Dict[str, Any]:
+    def leaf(i: int) -> Dict[str, Any]:
+        return {
+            "name": f"leaf-{i}",
+            "value": _random.random(),
+            "tags": [f"tag-{j}" for j in range(3)],
+            "created": 1_700_000_000_000 + i,
+        }
+
+    def branch(i: int) -> Dict[str, Any]:
+        return {
+            "id": i,
+            "leaves": [leaf(j) for j in range(num_leaves)],
+            "attributes": {f"key-{j}": f"value-{j}" for j in range(5)},
+            "parent": i - 1 if i else None,
+        }
+
+    return {
+        "trees": [
+            {"name": f"tree-{i}", "branches": [branch(j) for j in range(num_branches)], "metadata": {"depth": 3}}
+            for i in range(num_trees)
+        ],
+        "updated": "2024-01-01",
+    }
+
+
+def _class_tree(input_class: type) -> Any:
+    def function(context: QueryContext, event: input_class) -> str:  # type: ignore[valid-type]
+        return ""
+
+    return parse_function_schema(function, "benchmark").class_node
+
+
+def _converter(input_class: type, payload: Dict[str, Any]) -> Callable[[], Any]:
+    converter = compile_payload_converter(_class_tree(input_class))
+    return lambda: converter(payload)
+
+
+def _lazy_converter(input_class: type, payload: Dict[str, Any], read: Callable[[Any], Any]) -> Callable[[], Any]:
+    converter = compile_payload_converter(_class_tree(input_class), lazy=True)
+    return lambda: read(converter(payload))
+
+
+def _records(size: int) -> List[Record]:
+    return [Record(id=i, name=f"record-{i}", score=_random.random()) for i in range(size)]
+
+
+def _encoder(output_type: Any, result: Any, json_codec: str = "stdlib") -> Callable[[], Any]:
+    encoder = compile_result_encoder(output_type, dumps=create_json_codec(json_codec).dumps)
+    return lambda: encoder(result)
+
+
+def _decoder(payload: Dict[str, Any], json_codec: str) -> Callable[[], Any]:
+    # "auto" is the fastest codec installed, the standard library if neither orjson nor msgspec is
+    codec = create_json_codec(json_codec)
+    job = json.dumps({"computeModuleJobV1": {"jobId": "job", "queryType": "benchmark", "query": payload}}).encode()
+    return lambda: codec.loads(job)
+
+
+def _manual_encoder(records: List[Record]) -> Callable[[], Any]:
+    # What functions had to do before results were encoded from their return type
+    return lambda: json.dumps([dataclasses.asdict(record) for record in records]).encode("utf-8")
+
+
+def _parse_schema() -> Callable[[], Any]:
+    def function(context: QueryContext, event: ForestInput) -> List[Record]:
+        return []
+
+    return lambda: parse_function_schema(function, "benchmark")
+
+
+def _construct_query_context() -> Callable[[], Any]:
+    query_context = {"jobId": "job", "tempCredsAuthToken": "token", "authHeader": "Bearer token", "sources": {}}
+    return lambda: QueryContext(**query_context)
+
+
+def _update_job_id() -> Callable[[], Any]:
+    # The internal logger & a couple of loggers of the Compute Module's own modules
+    get_internal_logger()
+    get_logger("benchmark.app")
+    get_logger("benchmark.model")
+    job_ids = ["3f2b6a0e-8a57-4c1b-9d0e-0b1f2c3d4e5f", ""]
+    return lambda: [COMPUTE_MODULES_ADAPTER_MANAGER.update_job_id(job_id) for job_id in job_ids]
+
+
+CASES: Dict[str, Callable[[], Callable[[], Any]]] = {
+    "convert_payload.deep_dataclass_tree": lambda: _converter(ForestInput, _forest_payload()),
+    "convert_payload.list_100k_floats": lambda: _converter(
+        FloatsInput, {"values": [_random.random() for _ in range(LARGE_SIZE)]}
+    ),
+    "convert_payload.float_array_100k": lambda: _converter(
+        FloatArrayInput, {"values": [_random.random() for _ in range(LARGE_SIZE)]}
+    ),
+    "convert_payload.list_100k_dataclasses": lambda: _converter(
+        RecordsInput,
+        {"records": [{"id": i, "name": f"record-{i}", "score": _random.random()} for i in range(LARGE_SIZE)]},
+    ),
+    "convert_payload.lazy_deep_dataclass_tree_one_field": lambda: _lazy_converter(
+        ForestInput, _forest_payload(), lambda event: event.trees[0].branches[0].leaves[0].value
+    ),
+    "convert_payload.lazy_list_100k_dataclasses_one_field": lambda: _lazy_converter(
+        RecordsInput,
+        {"records": [{"id": i, "name": f"record-{i}", "score": _random.random()} for i in range(LARGE_SIZE)]},
+        lambda event: event.records[0].name,
+    ),
+    "convert_payload.columns_100k_rows": lambda: _converter(
+        RecordColumnsInput,
+        {"records": [{"id": i, "name": f"record-{i}", "score": _random.random()} for i in range(LARGE_SIZE)]},
+    ),
+    "convert_payload.map_100k": lambda: _converter(MapInput, {"entries": {f"key-{i}": i for i in range(LARGE_SIZE)}}),
+    "convert_payload.timestamps_100k": lambda: _converter(
+        TimestampsInput, {"timestamps": [1_700_000_000_000 + i for i in range(LARGE_SIZE)]}
+    ),
+    "encode_result.list_100k_dataclasses": lambda: _encoder(List[Record], _records(LARGE_SIZE)),
+    "encode_result.list_100k_dataclasses_manual_asdict": lambda: _manual_encoder(_records(LARGE_SIZE)),
+    "encode_result.list_100k_floats": lambda: _encoder(
+        List[float], [_random.random() for _ in range(LARGE_SIZE)]
+    ),
+    "encode_result.list_100k_floats_auto_codec": lambda: _encoder(
+        List[float], [_random.random() for _ in range(LARGE_SIZE)], json_codec="auto"
+    ),
+    "decode_job.list_100k_records_stdlib_codec": lambda: _decoder(
+        {"records": [{"id": i, "name": f"record-{i}", "score": _random.random()} for i in range(LARGE_SIZE)]}, "stdlib"
+    ),
+    "decode_job.list_100k_records_auto_codec": lambda: _decoder(
+        {"records": [{"id": i, "name": f"record-{i}", "score": _random.random()} for i in range(LARGE_SIZE)]}, "auto"
+    ),
+    "parse_function_schema.deep_dataclass_tree": _parse_schema,
+    "query_context.construct": _construct_query_context,
+    "logging.update_job_id": _update_job_id,
+}
+
+
+def _time(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(function)
+    # Enough calls per run to take at least 0.2s
+    number, _ = timer.autorange()
+    seconds_per_call = [seconds / number for seconds in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "seconds_per_call": min(seconds_per_call),
+        "median_seconds_per_call": statistics.median(seconds_per_call),
+    }
+
+
+def _format_duration(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3f}{unit}"
+    return f"{seconds / 1e-9:.1f}ns"
+
+
+def run(cases: List[str], repeat: int) -> Results:
+    results = {}
+    for case in cases:
+        results[case] = _time(CASES[case](), repeat)
+        print(
+            f"{case:<45} {_format_duration(results[case]['seconds_per_call']):>10}/call"
+            f"  (median {_format_duration(results[case]['median_seconds_per_call'])})"
+        )
+    return results
+
+
+def _report_regressions(results: Results, baseline: Results, max_regression: float) -> None:
+    regressions = find_regressions(results, baseline, COMPARED_METRICS, max_regression)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regression beyond {max_regression:.0%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--filter", default="", help="Only run the cases whose name contains this")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs of each case")
+    run_parser.add_argument("--output", help="Write the results to this JSON file, e.g. to use as a baseline")
+    run_parser.add_argument("--baseline", help="Compare the results to those written to this JSON file")
+    compare_parser = commands.add_parser("compare", help="Compare results to a baseline")
+    compare_parser.add_argument("baseline", help="JSON file of the baseline results")
+    compare_parser.add_argument("results", help="JSON file of the results to compare")
+    for command_parser in (run_parser, compare_parser):
+        command_parser.add_argument(
+            "--max-regression", type=float, default=0.1, help="Tolerated slowdown of a case, as a fraction"
+        )
+    args = parser.parse_args()
+    if args.command == "compare":
+        baseline = read_results(args.baseline)["results"]
+        _report_regressions(read_results(args.results)["results"], baseline, args.max_regression)
+        return
+    cases = [case for case in CASES if args.filter in case]
+    if not cases:
+        raise SystemExit(f"No case matches {args.filter}, the cases are: {list(CASES)}")
+    results = run(cases, args.repeat)
+    if args.output:
+        config = {"python": platform.python_version(), "machine": platform.machine(), "repeat": args.repeat}
+        write_results(args.output, config, results)
+    if args.baseline:
+        _report_regressions(results, read_results(args.baseline)["results"], args.max_regression)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+"""Compute Module used by `preload_benchmark`: serves lookups from a large read-only table,
+loaded either by a preload hook or lazily by each worker on first use
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from compute_modules import add_function, add_preload_hook, start_compute_module
+from compute_modules.context import QueryContext
+
+TABLE_ROWS = int(os.environ.get("BENCHMARK_TABLE_ROWS", 500_000))
+_table: Optional[Dict[int, List[str]]] = None
+
+
+def _load_table() -> None:
+    global _table
+    _table = {i: [f"name-{i}", f"value-{i}"] for i in range(TABLE_ROWS)}
+
+
+@dataclass
+class LookupInput:
+    key: int
+
+
+def lookup(context: QueryContext, event: LookupInput) -> str:
+    """Returns the worker's pid, so the benchmark can find the worker processes"""
+    if _table is None:
+        _load_table()
+    assert _table is not None
+    _table[event.key % TABLE_ROWS]
+    return str(os.getpid())
+
+
+add_function(lookup)
+if os.environ.get("BENCHMARK_PRELOAD") == "1":
+    add_preload_hook(_load_table)
+
+if __name__ == "__main__":
+    start_compute_module()
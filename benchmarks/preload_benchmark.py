@@ -0,0 +1,96 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+"""Measures the memory unique to each worker process (USS) with and without a preload hook.
+
+Each configuration starts `benchmarks.preload_app` with several workers, sends jobs until every worker
+has loaded its lookup table, then reads the workers' memory from /proc (Linux only).
+
+Usage: poetry run benchmark_preload [--workers N] [--rows N]
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+from typing import Dict, Set
+
+from compute_modules.client.system_stats import get_rss_bytes, get_unique_memory_bytes
+
+from .runtime_stand_in import LocalRuntime
+
+CONFIGURATIONS = {
+    "lazy, fork": {"BENCHMARK_PRELOAD": "0", "WORKER_START_METHOD": "fork"},
+    "preload, fork": {"BENCHMARK_PRELOAD": "1", "WORKER_START_METHOD": "fork"},
+    "preload, forkserver": {"BENCHMARK_PRELOAD": "1", "WORKER_START_METHOD": "forkserver"},
+}
+MAX_BATCHES = 20
+
+
+def _worker_pids(runtime: LocalRuntime, num_workers: int) -> Set[int]:
+    """Send batches of jobs until every worker has executed at least one"""
+    pids: Set[int] = set()
+    for _ in range(MAX_BATCHES):
+        runtime.results.clear()
+        for i in range(num_workers * 4):
+            runtime.enqueue_job("lookup", {"key": i})
+        assert runtime.wait_for_results(num_workers * 4, timeout=120), "Not all results were reported"
+        pids.update(int(json.loads(result)) for result in runtime.results.values())
+        if len(pids) >= num_workers:
+            break
+    return pids
+
+
+def _run(num_workers: int, rows: int, environ: Dict[str, str]) -> Dict[str, float]:
+    with LocalRuntime() as runtime:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.preload_app"],
+            env={
+                **os.environ,
+                **runtime.environ(),
+                **environ,
+                "MAX_CONCURRENT_TASKS": str(num_workers),
+                "BENCHMARK_TABLE_ROWS": str(rows),
+            },
+        )
+        try:
+            pids = _worker_pids(runtime, num_workers)
+            unique = [get_unique_memory_bytes(pid) or 0 for pid in pids]
+            rss = [get_rss_bytes(pid) or 0 for pid in pids]
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+    return {
+        "workers": len(pids),
+        "mean_worker_uss_mb": sum(unique) / len(unique) / 2**20,
+        "total_worker_uss_mb": sum(unique) / 2**20,
+        "mean_worker_rss_mb": sum(rss) / len(rss) / 2**20,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes")
+    parser.add_argument("--rows", type=int, default=500_000, help="Number of rows in the lookup table")
+    args = parser.parse_args()
+    for label, environ in CONFIGURATIONS.items():
+        stats = _run(num_workers=args.workers, rows=args.rows, environ=environ)
+        print(f"{label:<20} " + "  ".join(f"{key}={value:.1f}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
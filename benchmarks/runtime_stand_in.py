@@ -0,0 +1,240 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import json
+import os
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any, Deque, Dict, List, Optional, Tuple, Type
+
+GET_JOB_PATH = "/job"
+POST_RESULT_PATH = "/results"
+POST_SCHEMA_PATH = "/schemas"
+AUTH_TOKEN = "local-runtime-token"
+
+
+def _generate_self_signed_cert(directory: str) -> Tuple[str, str]:
+    """Generates a throwaway certificate for localhost with the openssl CLI"""
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-keyout",
+            key_path,
+            "-out",
+            cert_path,
+            "-days",
+            "1",
+            "-subj",
+            "/CN=localhost",
+            "-addext",
+            "subjectAltName=DNS:localhost,IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert_path, key_path
+
+
+class _TLSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, runtime: "LocalRuntime", ssl_context: ssl.SSLContext) -> None:
+        super().__init__(("127.0.0.1", 0), _RuntimeRequestHandler)
+        self.runtime = runtime
+        self.ssl_context = ssl_context
+
+    def get_request(self) -> Tuple[socket.socket, Any]:
+        sock, address = self.socket.accept()
+        tls_sock = self.ssl_context.wrap_socket(sock, server_side=True)
+        self.runtime._record_connection(session_reused=bool(tls_sock.session_reused))
+        return tls_sock, address
+
+
+class _RuntimeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: _TLSServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes = b"") -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        if body:
+            self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self) -> None:
+        if self.path != GET_JOB_PATH:
+            self._send(404)
+            return
+        job = self.server.runtime._next_job()
+        if job is None:
+            self._send(204)
+        else:
+            self._send(200, json.dumps(job).encode("utf-8"))
+
+    def do_POST(self) -> None:
+        body = self._read_body()
+        if self.path.startswith(POST_RESULT_PATH + "/"):
+            self.server.runtime._record_result(self.path[len(POST_RESULT_PATH) + 1 :], body)
+            self._send(204)
+        elif self.path == POST_SCHEMA_PATH:
+            self.server.runtime.schemas = json.loads(body)
+            self._send(200)
+        else:
+            self._send(404)
+
+
+class LocalRuntime:
+    """Local HTTPS stand-in for the compute module runtime.
+
+    Implements the GET_JOB_URI / POST_RESULT_URI / POST_SCHEMA_URI contract that `InternalQueryService` talks to,
+    and counts connections & TLS handshakes so connection reuse can be measured.
+    The latency of each job, from the time it was handed out to the time its result was posted, is recorded.
+    """
+
+    def __init__(self, poll_wait_seconds: float = 0.05) -> None:
+        self.poll_wait_seconds = poll_wait_seconds
+        self.schemas: Any = None
+        self.results: Dict[str, bytes] = {}
+        self.connections = 0
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+        self.latencies: List[float] = []
+        self._dispatched_at: Dict[str, float] = {}
+        self._jobs: Deque[Dict[str, Any]] = deque()
+        self._condition = threading.Condition()
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._server: Optional[_TLSServer] = None
+
+    def __enter__(self) -> "LocalRuntime":
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self.cert_path, key_path = _generate_self_signed_cert(self._tempdir.name)
+        self.token_path = os.path.join(self._tempdir.name, "token")
+        with open(self.token_path, "w") as f:
+            f.write(AUTH_TOKEN)
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(self.cert_path, key_path)
+        self._server = _TLSServer(runtime=self, ssl_context=ssl_context)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._tempdir.cleanup()
+
+    @property
+    def port(self) -> int:
+        assert self._server, "LocalRuntime has not been started"
+        return int(self._server.server_address[1])
+
+    def environ(self) -> Dict[str, str]:
+        """Environment variables that point a compute module at this runtime"""
+        base_url = f"https://localhost:{self.port}"
+        return {
+            "RUNTIME_HOST": "localhost",
+            "RUNTIME_PORT": str(self.port),
+            "GET_JOB_URI": base_url + GET_JOB_PATH,
+            "POST_RESULT_URI": base_url + POST_RESULT_PATH,
+            "POST_SCHEMA_URI": base_url + POST_SCHEMA_PATH,
+            "MODULE_AUTH_TOKEN": self.token_path,
+            "CONNECTIONS_TO_OTHER_PODS_CA_PATH": self.cert_path,
+        }
+
+    def enqueue_job(self, query_type: str, query: Any, job_id: Optional[str] = None) -> str:
+        job_id = job_id or str(uuid.uuid4())
+        job = {"computeModuleJobV1": {"jobId": job_id, "queryType": query_type, "query": query}}
+        with self._condition:
+            self._jobs.append(job)
+            self._condition.notify_all()
+        return job_id
+
+    def wait_for_results(self, count: int, timeout: float) -> bool:
+        """Blocks until at least `count` results have been posted. Returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while len(self.results) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def reset(self) -> None:
+        """Forget the results & latencies of the jobs run so far"""
+        with self._condition:
+            self.results.clear()
+            self.latencies.clear()
+
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        with self._condition:
+            if not self._jobs:
+                self._condition.wait(self.poll_wait_seconds)
+            if not self._jobs:
+                return None
+            job = self._jobs.popleft()
+            self._dispatched_at[job["computeModuleJobV1"]["jobId"]] = time.perf_counter()
+            return job
+
+    def _record_result(self, job_id: str, body: bytes) -> None:
+        with self._condition:
+            self.results[job_id] = body
+            dispatched_at = self._dispatched_at.pop(job_id, None)
+            if dispatched_at is not None:
+                self.latencies.append(time.perf_counter() - dispatched_at)
+            self._condition.notify_all()
+
+    def _record_connection(self, session_reused: bool) -> None:
+        with self._condition:
+            self.connections += 1
+            if session_reused:
+                self.resumed_handshakes += 1
+            else:
+                self.full_handshakes += 1
@@ -15,10 +15,15 @@
 
 from ._version import __version__ as __version__
 from .function_registry.function_registry import add_function, add_functions
+from .lifecycle.hooks import add_preload_hook, add_worker_start_hook, add_worker_stop_hook, get_worker_resources
 from .startup import start_compute_module
 
 __all__ = [
     "add_function",
     "add_functions",
+    "add_preload_hook",
+    "add_worker_start_hook",
+    "add_worker_stop_hook",
+    "get_worker_resources",
     "start_compute_module",
 ]
@@ -13,14 +13,94 @@
 #  limitations under the License.
 
 import atexit
-from typing import Any, Callable
+from typing import Any, Callable, Optional, overload
 
+from .caching.result_cache import CachePolicy
+from .caching.single_flight import CoalescePolicy
 from .function_registry.function_registry import add_function
+from .lifecycle.hooks import add_preload_hook, add_worker_start_hook, add_worker_stop_hook
 from .startup import start_compute_module
 
 
-def function(func: Callable[..., Any]) -> Callable[..., Any]:
-    add_function(func)
+@overload
+def function(func: Callable[..., Any]) -> Callable[..., Any]: ...
+
+
+@overload
+def function(
+    *,
+    timeout: Optional[float] = None,
+    batch: bool = False,
+    max_batch_size: Optional[int] = None,
+    max_wait_ms: Optional[float] = None,
+    cache: Optional[CachePolicy] = None,
+    coalesce: Optional[CoalescePolicy] = None,
+    max_concurrency: Optional[int] = None,
+    weight: float = 1.0,
+    lazy_input: bool = False,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]: ...
+
+
+def function(
+    func: Optional[Callable[..., Any]] = None,
+    *,
+    timeout: Optional[float] = None,
+    batch: bool = False,
+    max_batch_size: Optional[int] = None,
+    max_wait_ms: Optional[float] = None,
+    cache: Optional[CachePolicy] = None,
+    coalesce: Optional[CoalescePolicy] = None,
+    max_concurrency: Optional[int] = None,
+    weight: float = 1.0,
+    lazy_input: bool = False,
+) -> Any:
+    """Register a Compute Module function. Use as `@function`, or `@function(timeout=...)` to set options"""
+
+    def register(func: Callable[..., Any]) -> Callable[..., Any]:
+        add_function(
+            func,
+            timeout=timeout,
+            batch=batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            cache=cache,
+            coalesce=coalesce,
+            max_concurrency=max_concurrency,
+            weight=weight,
+            lazy_input=lazy_input,
+        )
+        return func
+
+    return register if func is None else register(func)
+
+
+def preload(func: Callable[[], Any]) -> Callable[[], Any]:
+    add_preload_hook(func)
+    return func
+
+
+@overload
+def on_worker_start(func: Callable[[], Any]) -> Callable[[], Any]: ...
+
+
+@overload
+def on_worker_start(*, name: Optional[str] = None) -> Callable[[Callable[[], Any]], Callable[[], Any]]: ...
+
+
+def on_worker_start(func: Optional[Callable[[], Any]] = None, *, name: Optional[str] = None) -> Any:
+    """Register a worker start hook. Use as `@on_worker_start`, or `@on_worker_start(name=...)` to set the key of
+    the resource it creates in `context.workerResources`, which defaults to the function's name
+    """
+
+    def register(func: Callable[[], Any]) -> Callable[[], Any]:
+        add_worker_start_hook(func, name=name)
+        return func
+
+    return register if func is None else register(func)
+
+
+def on_worker_stop(func: Callable[[], Any]) -> Callable[[], Any]:
+    add_worker_stop_hook(func)
     return func
 
 
@@ -29,4 +109,7 @@ atexit.register(start_compute_module)
 
 __all__ = [
     "function",
+    "on_worker_start",
+    "on_worker_stop",
+    "preload",
 ]
@@ -0,0 +1,167 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from compute_modules.function_registry.function_result_encoder import to_json_compatible
+
+DEFAULT_CACHE_MAX_ENTRIES = 1024
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """How the results of a function are memoized, set with `@function(cache=CachePolicy(...))`.
+
+    Only use this for pure functions: a cached result is reported for any later job with the same query
+    (and the same values of `context_fields`) until it expires or is evicted.
+    """
+
+    max_entries: int = DEFAULT_CACHE_MAX_ENTRIES
+    """Maximum number of results kept by each worker process. The least recently used result is evicted first"""
+
+    max_bytes: int = DEFAULT_CACHE_MAX_BYTES
+    """Maximum total size of the results kept by each worker process, measured as the JSON reported for them"""
+
+    ttl: Optional[float] = None
+    """Seconds after which a cached result expires. None to keep results until they are evicted"""
+
+    context_fields: Tuple[str, ...] = ()
+    """Context fields that are part of the cache key, e.g. `("authHeader",)` to cache results per user"""
+
+    shared: bool = False
+    """Whether all worker processes share one cache, stored on local disk, instead of each keeping its own in memory.
+    `max_entries` & `max_bytes` then bound the shared cache"""
+
+    def __post_init__(self) -> None:
+        if self.max_entries < 1 or self.max_bytes < 1:
+            raise ValueError(f"max_entries & max_bytes must be >= 1, got {self.max_entries} & {self.max_bytes}")
+        if self.ttl is not None and self.ttl <= 0:
+            raise ValueError(f"ttl must be > 0, got {self.ttl}")
+
+
+@dataclass
+class CacheStats:
+    """Counters describing how a result cache has been used"""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    """Number of results removed to stay within `max_entries` & `max_bytes`"""
+
+    expirations: int = 0
+    """Number of results removed because they were older than `ttl`"""
+
+    entries: int = 0
+    bytes: int = 0
+
+
+def _canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=to_json_compatible)
+
+
+def cache_key(query_type: str, query: Any, query_context: Dict[str, Any], context_fields: Sequence[str]) -> str:
+    """Hash of the raw query & the selected context fields, which does not depend on the order of dict keys"""
+    key = [query_type, query, [query_context.get(field) for field in context_fields]]
+    return hashlib.sha256(_canonical_json(key).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _CacheEntry:
+    value: bytes
+    size: int
+    expires_at: Optional[float]
+
+
+class ResultCache:
+    """In-memory LRU cache of function results, bounded by number of entries & total size. Thread safe.
+
+    Results are cached as the JSON bytes reported for them, so cache hits report exactly the same bytes.
+    """
+
+    def __init__(self, policy: CachePolicy, clock: Callable[[], float] = time.monotonic) -> None:
+        self.policy = policy
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._stats = CacheStats()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Worker processes that are not forked start with an empty cache"""
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_entries"] = OrderedDict()
+        state["_stats"] = CacheStats()
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def key(self, query_type: str, query: Any, query_context: Dict[str, Any]) -> str:
+        return cache_key(query_type, query, query_context, self.policy.context_fields)
+
+    def get(self, key: str) -> Tuple[bool, Optional[bytes]]:
+        """Returns whether a result is cached for `key` & the encoded result"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= self._clock():
+                self._remove(key)
+                self._stats.expirations += 1
+                entry = None
+            if entry is None:
+                self._stats.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return True, entry.value
+
+    def put(self, key: str, value: bytes) -> None:
+        """Cache an encoded result, unless it is larger than the whole cache"""
+        size = len(value)
+        if size > self.policy.max_bytes:
+            return
+        expires_at = self._clock() + self.policy.ttl if self.policy.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(value=value, size=size, expires_at=expires_at)
+            self._stats.bytes += size
+            while len(self._entries) > self.policy.max_entries or self._stats.bytes > self.policy.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats.evictions += 1
+            self._stats.entries = len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        self._stats.bytes -= self._entries.pop(key).size
+        self._stats.entries = len(self._entries)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**vars(self._stats))
+
+
+__all__ = [
+    "CachePolicy",
+    "CacheStats",
+    "ResultCache",
+    "cache_key",
+]
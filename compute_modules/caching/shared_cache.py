@@ -0,0 +1,149 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from compute_modules.logging.internal import get_internal_logger
+
+from .result_cache import CachePolicy, CacheStats, cache_key
+from .sqlite_store import SQLiteStore
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO usage VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN
+    UPDATE usage SET entries = entries + 1, bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN
+    UPDATE usage SET entries = entries - 1, bytes = bytes - OLD.size;
+END;
+"""
+
+
+class SharedResultCache:
+    """Result cache shared by all worker processes of a Compute Module, stored in a `SQLiteStore`.
+
+    Has the same interface as `ResultCache`, with `policy.max_entries` & `policy.max_bytes` bounding the whole store.
+    Results are stored as the JSON reported for them.
+    Errors from the database are logged & treated as cache misses, so they never fail a job.
+    `stats` counts the hits, misses, evictions & expirations of the calling process only.
+    """
+
+    def __init__(self, policy: CachePolicy, path: str, clock: Callable[[], float] = time.time) -> None:
+        self.policy = policy
+        self.path = path
+        self._clock = clock
+        self._store = SQLiteStore(path, _SCHEMA)
+        self._stats_lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_stats_lock"]
+        state["_stats"] = CacheStats()
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._stats_lock = threading.Lock()
+
+    def key(self, query_type: str, query: Any, query_context: Dict[str, Any]) -> str:
+        return cache_key(query_type, query, query_context, self.policy.context_fields)
+
+    def _count(self, counter: str, increment: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self._stats, counter, getattr(self._stats, counter) + increment)
+
+    def get(self, key: str) -> Tuple[bool, Optional[bytes]]:
+        """Returns whether a result is cached for `key` & the encoded result"""
+        try:
+            hit, value = self._get(key)
+        except sqlite3.Error as e:
+            get_internal_logger().warning(f"Failed to read from result cache {self.path}: {str(e)}")
+            hit, value = False, None
+        self._count("hits" if hit else "misses")
+        return hit, value
+
+    def _get(self, key: str) -> Tuple[bool, Optional[bytes]]:
+        with self._store.connection() as connection:
+            row = connection.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None
+            value, expires_at = row
+            now = self._clock()
+            if expires_at is not None and expires_at <= now:
+                if connection.execute("DELETE FROM results WHERE key = ? AND expires_at <= ?", (key, now)).rowcount:
+                    self._count("expirations")
+                return False, None
+            connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+        return True, value.encode("utf-8")
+
+    def put(self, key: str, value: bytes) -> None:
+        """Cache an encoded result, unless it is larger than the whole cache"""
+        size = len(value)
+        encoded = value.decode("utf-8")
+        if size > self.policy.max_bytes:
+            return
+        now = self._clock()
+        expires_at = now + self.policy.ttl if self.policy.ttl is not None else None
+        try:
+            self._put(key, encoded, size, expires_at, now)
+        except sqlite3.Error as e:
+            get_internal_logger().warning(f"Failed to write to result cache {self.path}: {str(e)}")
+
+    def _put(self, key: str, encoded: str, size: int, expires_at: Optional[float], now: float) -> None:
+        evictions = 0
+        with self._store.transaction() as connection:
+            connection.execute("DELETE FROM results WHERE key = ?", (key,))
+            connection.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?)", (key, encoded, size, expires_at, now))
+            while True:
+                entries, total_bytes = connection.execute("SELECT entries, bytes FROM usage").fetchone()
+                if entries <= self.policy.max_entries and total_bytes <= self.policy.max_bytes:
+                    break
+                connection.execute(
+                    "DELETE FROM results WHERE key = (SELECT key FROM results ORDER BY last_used LIMIT 1)"
+                )
+                evictions += 1
+        self._count("evictions", evictions)
+
+    def stats(self) -> CacheStats:
+        with self._stats_lock:
+            stats = CacheStats(**vars(self._stats))
+        try:
+            with self._store.connection() as connection:
+                stats.entries, stats.bytes = connection.execute("SELECT entries, bytes FROM usage").fetchone()
+        except sqlite3.Error as e:
+            get_internal_logger().warning(f"Failed to read the size of result cache {self.path}: {str(e)}")
+        return stats
+
+
+__all__ = [
+    "SharedResultCache",
+]
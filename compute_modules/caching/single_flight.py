@@ -0,0 +1,181 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from compute_modules.logging.internal import get_internal_logger
+
+from .result_cache import cache_key
+from .sqlite_store import SQLiteStore
+
+DEFAULT_COALESCE_WAIT_TIMEOUT_SECONDS = 30.0
+# Results of finished flights are kept this long for waiters that have not polled since
+FINISHED_FLIGHT_RETENTION_SECONDS = 60.0
+WAIT_POLL_BASE_INTERVAL_SECONDS = 0.001
+WAIT_POLL_MAX_INTERVAL_SECONDS = 0.05
+
+_RUNNING = 0
+_DONE = 1
+_FAILED = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flights (
+    key TEXT PRIMARY KEY,
+    owner_pid INTEGER NOT NULL,
+    state INTEGER NOT NULL,
+    value TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class CoalescePolicy:
+    """How identical jobs of a function are coalesced, set with `@function(coalesce=CoalescePolicy(...))`.
+
+    While a worker executes a job, jobs with the same query (and the same values of `context_fields`) received
+    by any worker wait for its result instead of executing, & report it as their own.
+    """
+
+    wait_timeout: float = DEFAULT_COALESCE_WAIT_TIMEOUT_SECONDS
+    """Seconds a job waits for an identical job's result before executing on its own. Capped by the job's timeout"""
+
+    context_fields: Tuple[str, ...] = ()
+    """Context fields that must also match for jobs to be coalesced, e.g. `("authHeader",)` to only coalesce
+    the jobs of the same user"""
+
+    def __post_init__(self) -> None:
+        if self.wait_timeout <= 0:
+            raise ValueError(f"wait_timeout must be > 0, got {self.wait_timeout}")
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SingleFlight:
+    """Tracks the jobs being executed by the worker processes of a Compute Module in a `SQLiteStore`,
+    so identical jobs wait for the first one's result instead of also executing.
+
+    The first job to `begin` a key is its leader & must `finish` or `fail` it. Later jobs `wait` for the leader's
+    result, published as the JSON reported for it. If the leader fails, its process dies or the wait times out,
+    waiters are told to execute on their own.
+    Errors from the database are logged & make jobs execute on their own, so they never fail a job.
+    """
+
+    def __init__(self, policy: CoalescePolicy, path: str) -> None:
+        self.policy = policy
+        self.path = path
+        self._store = SQLiteStore(path, _SCHEMA)
+
+    def key(self, query_type: str, query: Any, query_context: Dict[str, Any]) -> str:
+        return cache_key(query_type, query, query_context, self.policy.context_fields)
+
+    def begin(self, key: str) -> bool:
+        """Returns whether the caller is the leader for `key` & should execute the job"""
+        now = time.time()
+        try:
+            with self._store.transaction() as connection:
+                connection.execute(
+                    "DELETE FROM flights WHERE state != ? AND updated_at < ?",
+                    (_RUNNING, now - FINISHED_FLIGHT_RETENTION_SECONDS),
+                )
+                row = connection.execute("SELECT owner_pid, state FROM flights WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] == _RUNNING and _is_alive(row[0]):
+                    return False
+                connection.execute(
+                    "INSERT OR REPLACE INTO flights VALUES (?, ?, ?, NULL, ?)", (key, os.getpid(), _RUNNING, now)
+                )
+                return True
+        except sqlite3.Error as e:
+            get_internal_logger().warning(f"Failed to coalesce job through {self.path}, executing it: {str(e)}")
+            return True
+
+    def _end(self, key: str, state: int, value: Optional[str]) -> None:
+        try:
+            with self._store.transaction() as connection:
+                connection.execute(
+                    "UPDATE flights SET state = ?, value = ?, updated_at = ? WHERE key = ? AND owner_pid = ?",
+                    (state, value, time.time(), key, os.getpid()),
+                )
+        except sqlite3.Error as e:
+            get_internal_logger().warning(
+                f"Failed to publish the outcome of a coalesced job through {self.path}: {str(e)}"
+            )
+
+    def finish(self, key: str, result: bytes) -> None:
+        """Publish the leader's encoded result to the jobs waiting for it"""
+        self._end(key, _DONE, result.decode("utf-8"))
+
+    def fail(self, key: str) -> None:
+        """Tell the jobs waiting for the leader to execute on their own"""
+        self._end(key, _FAILED, None)
+
+    def poll(self, key: str) -> Tuple[bool, bool, Optional[bytes]]:
+        """Returns whether waiting for `key` is over, whether the leader's result is available & the encoded result"""
+        try:
+            with self._store.connection() as connection:
+                row = connection.execute("SELECT owner_pid, state, value FROM flights WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            get_internal_logger().warning(f"Failed to wait for a coalesced job through {self.path}: {str(e)}")
+            return True, False, None
+        if row is None:
+            return True, False, None
+        owner_pid, state, value = row
+        if state == _DONE:
+            return True, True, value.encode("utf-8")
+        return state == _FAILED or not _is_alive(owner_pid), False, None
+
+    def _wait_timeout(self, timeout: Optional[float]) -> float:
+        return self.policy.wait_timeout if timeout is None else min(self.policy.wait_timeout, timeout)
+
+    def wait(self, key: str, timeout: Optional[float] = None) -> Tuple[bool, Optional[bytes]]:
+        """Wait for the leader of `key`. Returns whether its result is available & the encoded result"""
+        deadline = time.monotonic() + self._wait_timeout(timeout)
+        interval = WAIT_POLL_BASE_INTERVAL_SECONDS
+        while True:
+            done, found, result = self.poll(key)
+            if done or time.monotonic() >= deadline:
+                return found, result
+            time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            interval = min(WAIT_POLL_MAX_INTERVAL_SECONDS, interval * 2)
+
+    async def wait_async(self, key: str, timeout: Optional[float] = None) -> Tuple[bool, Optional[bytes]]:
+        """Counterpart of `wait` for jobs running on an event loop"""
+        deadline = time.monotonic() + self._wait_timeout(timeout)
+        interval = WAIT_POLL_BASE_INTERVAL_SECONDS
+        while True:
+            done, found, result = self.poll(key)
+            if done or time.monotonic() >= deadline:
+                return found, result
+            await asyncio.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            interval = min(WAIT_POLL_MAX_INTERVAL_SECONDS, interval * 2)
+
+
+__all__ = [
+    "CoalescePolicy",
+    "SingleFlight",
+]
@@ -0,0 +1,104 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from compute_modules.logging.internal import get_internal_logger
+
+# How long a worker waits for another worker's write to a store before giving up on its own read or write
+SQLITE_BUSY_TIMEOUT_SECONDS = 1.0
+
+
+class SQLiteStore:
+    """A node-local SQLite database shared by the worker processes of a Compute Module.
+
+    The database uses write-ahead logging, so readers do not block the writer & a process that dies mid-write
+    leaves it consistent. A database that cannot be read (e.g. a truncated file) is recreated with `schema`.
+    Each process opens its own connection, as SQLite connections must not be used across a fork.
+    """
+
+    def __init__(self, path: str, schema: str) -> None:
+        self.path = path
+        self.schema = schema
+        self._lock = threading.RLock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+        # Create the database up front, so worker processes do not all race to create it
+        self._connect().close()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_connection"] = state["_connection_pid"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def _open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False
+        )
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.schema)
+            if connection.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise sqlite3.DatabaseError(f"{self.path} is corrupt")
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            return self._open()
+        except sqlite3.DatabaseError as e:
+            get_internal_logger().warning(f"Recreating {self.path} that could not be opened: {str(e)}")
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+            return self._open()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """This process' connection, for use by one thread at a time"""
+        with self._lock:
+            if self._connection is None or self._connection_pid != os.getpid():
+                self._connection = self._connect()
+                self._connection_pid = os.getpid()
+            yield self._connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """A write transaction, which waits for the transactions of other processes to finish first"""
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+
+__all__ = [
+    "SQLiteStore",
+]
@@ -0,0 +1,208 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import ssl
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from compute_modules.logging.internal import get_internal_logger
+
+from .connection_pool import DEFAULT_IDLE_TIMEOUT_SECONDS, DEFAULT_POOL_SIZE, DEFAULT_REQUEST_TIMEOUT_SECONDS
+
+
+class StaleConnectionError(ConnectionError):
+    """The remote end closed a pooled connection before sending a response"""
+
+
+@dataclass
+class AsyncHTTPResponse:
+    """A fully read HTTP response"""
+
+    status: int
+    reason: str
+    headers: Dict[str, str]
+    body: bytes
+    will_close: bool
+
+    def read(self) -> bytes:
+        return self.body
+
+
+@dataclass
+class _AsyncConnection:
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    last_used: float
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class AsyncHTTPSConnectionPool:
+    """Non-blocking counterpart of `HTTPSConnectionPool` built on asyncio streams.
+
+    Only implements the subset of HTTP/1.1 needed to talk to the compute module runtime.
+    Must be created & used from within a single running event loop.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        context: ssl.SSLContext,
+        max_size: int = DEFAULT_POOL_SIZE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT_SECONDS,
+        timeout: float = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.context = context
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle: List[_AsyncConnection] = []
+
+    async def _checkout(self) -> Tuple[_AsyncConnection, bool]:
+        now = time.monotonic()
+        while self._idle:
+            connection = self._idle.pop()
+            if now - connection.last_used <= self.idle_timeout and not connection.reader.at_eof():
+                return connection, True
+            connection.close()
+        reader, writer = await asyncio.open_connection(
+            host=self.host,
+            port=self.port,
+            ssl=self.context,
+            server_hostname=self.host,
+        )
+        return _AsyncConnection(reader=reader, writer=writer, last_used=now), False
+
+    def _checkin(self, connection: _AsyncConnection) -> None:
+        connection.last_used = time.monotonic()
+        if len(self._idle) < self.max_size:
+            self._idle.append(connection)
+        else:
+            connection.close()
+
+    def close(self) -> None:
+        """Close all idle connections held by the pool"""
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, Any],
+        body: Optional[Union[str, bytes]] = None,
+    ) -> AsyncHTTPResponse:
+        """Send a request over a pooled connection, transparently reconnecting if the pooled connection is stale"""
+        payload = body.encode("utf-8") if isinstance(body, str) else (body or b"")
+        connection, reused = await self._checkout()
+        try:
+            response = await asyncio.wait_for(self._exchange(connection, method, url, headers, payload), self.timeout)
+        except (StaleConnectionError, ConnectionResetError, BrokenPipeError) as e:
+            connection.close()
+            if not reused:
+                raise
+            get_internal_logger().debug(f"Pooled connection was stale ({type(e).__name__}), reconnecting")
+            self.close()
+            connection, _ = await self._checkout()
+            try:
+                response = await asyncio.wait_for(
+                    self._exchange(connection, method, url, headers, payload), self.timeout
+                )
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(connection)
+        return response
+
+    async def _exchange(
+        self,
+        connection: _AsyncConnection,
+        method: str,
+        url: str,
+        headers: Dict[str, Any],
+        payload: bytes,
+    ) -> AsyncHTTPResponse:
+        request_lines = [f"{method} {url} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        request_lines.extend(f"{key}: {value}" for key, value in headers.items())
+        if payload or method in ("POST", "PUT"):
+            request_lines.append(f"Content-Length: {len(payload)}")
+        connection.writer.write(("\r\n".join(request_lines) + "\r\n\r\n").encode("latin-1") + payload)
+        await connection.writer.drain()
+        return await self._read_response(connection.reader, method)
+
+    async def _read_response(self, reader: asyncio.StreamReader, method: str) -> AsyncHTTPResponse:
+        status_line = await reader.readline()
+        if not status_line:
+            raise StaleConnectionError("Remote end closed connection without response")
+        version, status, *reason = status_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        response_headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            response_headers[key.strip().lower()] = value.strip()
+        status_code = int(status)
+        connection_header = response_headers.get("connection", "").lower()
+        will_close = connection_header == "close" or (version == "HTTP/1.0" and connection_header != "keep-alive")
+        if method == "HEAD" or status_code in (204, 304) or 100 <= status_code < 200:
+            body = b""
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked(reader)
+        elif "content-length" in response_headers:
+            body = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            body = await reader.read()
+            will_close = True
+        return AsyncHTTPResponse(
+            status=status_code,
+            reason=reason[0] if reason else "",
+            headers=response_headers,
+            body=body,
+            will_close=will_close,
+        )
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks: List[bytes] = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # Skip any trailers up to the terminating empty line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+
+__all__ = [
+    "AsyncHTTPResponse",
+    "AsyncHTTPSConnectionPool",
+]
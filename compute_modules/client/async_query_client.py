@@ -0,0 +1,517 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import importlib
+import inspect
+import os
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from compute_modules.client.async_connection_pool import AsyncHTTPResponse, AsyncHTTPSConnectionPool
+from compute_modules.client.autoscaler import WorkerActivity
+from compute_modules.client.batching import BatchItem
+from compute_modules.client.connection_pool import ResultPostError
+from compute_modules.client.internal_query_client import POST_RESULT_MAX_ATTEMPTS, InternalQueryService, _EncodedResult
+from compute_modules.client.metrics import COUNTER_RESULT_POST_RETRIES, STAGE_DECODE, STAGE_EXECUTE, STAGE_POLL
+from compute_modules.client.quotas import QUOTA_RETRY_INTERVAL_SECONDS
+from compute_modules.client.supervisor import RECYCLE_EXIT_CODES, RECYCLE_TIMEOUT
+from compute_modules.context.cancellation import CancellationToken
+from compute_modules.lifecycle.hooks import (
+    WORKER_START_HOOKS,
+    run_worker_start_hooks_async,
+    run_worker_stop_hooks_async,
+)
+from compute_modules.logging.common import TASK_JOB_ID
+from compute_modules.tracing.spans import get_current_span, start_span
+
+DEFAULT_MAX_CONCURRENT_COROUTINES = 16
+
+
+def _install_uvloop() -> None:
+    """Use uvloop's event loop implementation when it is installed"""
+    try:
+        uvloop = importlib.import_module("uvloop")
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+class AsyncInternalQueryService(InternalQueryService):
+    """InternalQueryService that runs many in-flight jobs per worker process on a single asyncio event loop.
+
+    `async def` functions are awaited directly on the event loop, while regular functions
+    are run in the event loop's default thread pool so they do not block other jobs.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_concurrent_coroutines = int(
+            os.environ.get("MAX_CONCURRENT_COROUTINES", DEFAULT_MAX_CONCURRENT_COROUTINES)
+        )
+        self.async_connection_pool: Optional[AsyncHTTPSConnectionPool] = None
+        # Set once a regular function is still running in a thread after its timeout, which cannot be interrupted
+        self.has_timed_out_threads = False
+        # Jobs of batch functions waiting to be executed together, by query type, with the time they were received
+        self._pending_batches: Dict[str, List[Tuple[Dict[str, Any], float]]] = {}
+        # Number of jobs waiting for a free slot of their function, see `_take_function_slot`
+        self._deferred_jobs = 0
+        if self.profiler is not None and any(map(inspect.iscoroutinefunction, self.registered_functions.values())):
+            self.logger.warning(
+                "async def functions are not profiled in asyncio mode, as other jobs run on the same thread. "
+                "Use EXECUTION_MODE=multiprocessing to profile them"
+            )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = super().__getstate__()
+        state["async_connection_pool"] = None
+        return state
+
+    async def request_async(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, Any],
+        body: Optional[Any] = None,
+    ) -> AsyncHTTPResponse:
+        """Non-blocking counterpart of `request`"""
+        if self.async_connection_pool is None:
+            self.async_connection_pool = AsyncHTTPSConnectionPool(
+                host=self.host,
+                port=self.port,
+                context=self.context,
+                max_size=max(self.connection_pool.max_size, self.max_concurrent_coroutines),
+                idle_timeout=self.connection_pool.idle_timeout,
+            )
+        return await self.async_connection_pool.request(method=method, url=url, headers=headers, body=body)
+
+    async def get_job_or_none_async(self) -> Any:
+        try:
+            started = time.perf_counter()
+            response = await self.request_async(method="GET", url=self.get_job_path, headers=self.get_job_headers)
+            polled = time.perf_counter()
+            self.metrics.observe(STAGE_POLL, None, polled - started)
+            result = None
+            if response.status == 200:
+                result = self.json_codec.loads(response.body)
+                query_type = result.get("computeModuleJobV1", {}).get("queryType")
+                self.metrics.observe(STAGE_DECODE, query_type, time.perf_counter() - polled)
+                self.tracer.start_job(result, started, len(response.body))
+                self.polling_scheduler.record_job()
+            elif response.status == 204:
+                delay = self.polling_scheduler.record_empty_poll()
+                self.logger.debug(f"No job found, retrying in {delay:.2f}s")
+            else:
+                self.logger.error(f"Unexpected response status: {response.status}")
+                self.polling_scheduler.record_failed_poll()
+            return result
+        except ConnectionRefusedError:
+            delay = self.polling_scheduler.record_failed_poll()
+            self.logger.warning(f"Connection refused. Retrying in {delay:.2f}s")
+            return None
+        except Exception as e:
+            delay = self.polling_scheduler.record_failed_poll()
+            self.logger.error(f"Get job request failed, re-establishing connection in {delay:.2f}s: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            return None
+
+    async def report_job_result_async(self, job_id: str, result: Any, query_type: Optional[str] = None) -> None:
+        with self.tracer.report(job_id):
+            result, body = self._encode_result(result, query_type)
+            with start_span("report_job_result"):
+                await self._post_result_async(job_id, result, query_type, body)
+
+    async def _post_result_async(self, job_id: str, result: Any, query_type: Optional[str], body: bytes) -> None:
+        post_result_path = f"{self.post_result_path}/{job_id}"
+        self.logger.debug(f"Posting result to {post_result_path}")
+        started = time.perf_counter()
+        for attempt in range(POST_RESULT_MAX_ATTEMPTS):
+            if attempt > 0:
+                self.metrics.count(COUNTER_RESULT_POST_RETRIES, query_type)
+                get_current_span().set_attribute("attempts", attempt + 1)
+            try:
+                response = await self.request_async(
+                    method="POST",
+                    url=post_result_path,
+                    headers=self.post_result_headers,
+                    body=body,
+                )
+                if response.status == 204:
+                    self.logger.debug("Successfully reported job result")
+                    self._record_reported(result, query_type, started)
+                    return
+                else:
+                    self.logger.error(f"Failed to post result: {response.status} {response.reason}")
+            except Exception as e:
+                self.logger.error(f"POST of job result failed, attempting to re-establish connection: {str(e)}")
+                self.logger.error(traceback.format_exc())
+        raise ResultPostError(f"Unable to post job result after {POST_RESULT_MAX_ATTEMPTS} attempts")
+
+    async def _await_thread_with_deadline(self, thread_result: "asyncio.Future[Any]", token: CancellationToken) -> Any:
+        """Wait for a regular function running in a thread. Once its deadline passes the token is cancelled,
+        and if it is still running after the grace period the worker is marked to be replaced
+        """
+        try:
+            return await asyncio.wait_for(asyncio.shield(thread_result), token.remaining())
+        except asyncio.TimeoutError:
+            token.cancel()
+        try:
+            return await asyncio.wait_for(asyncio.shield(thread_result), self.job_timeout_grace)
+        except asyncio.TimeoutError:
+            self.logger.error("Job is still running after its timeout, replacing worker once in-flight jobs finish")
+            self.has_timed_out_threads = True
+            raise
+
+    async def _call_function_async(
+        self,
+        query_type: str,
+        query: Dict[str, Any],
+        query_context: Dict[str, Any],
+        token: Optional[CancellationToken],
+    ) -> Any:
+        function_ref = self.registered_functions[query_type]
+        typed_context, typed_query = self._convert_inputs(query_type, query, query_context)
+        started = time.perf_counter()
+        try:
+            with start_span("handler"):
+                if token is None:
+                    return await function_ref(typed_context, typed_query)
+                # Coroutines are cancelled at their deadline, raising CancelledError at their current await
+                return await asyncio.wait_for(function_ref(typed_context, typed_query), token.remaining())
+        except asyncio.TimeoutError:
+            token.cancel()
+            raise
+        finally:
+            self.metrics.observe(STAGE_EXECUTE, query_type, time.perf_counter() - started)
+
+    async def _call_coalesced_async(
+        self,
+        query_type: str,
+        query: Dict[str, Any],
+        query_context: Dict[str, Any],
+        token: Optional[CancellationToken],
+    ) -> Any:
+        """Counterpart of `_call_coalesced` for `async def` functions, waiting for identical jobs without blocking"""
+        key, leader = self._join_flight(query_type, query, query_context)
+        if key is not None and not leader:
+            found, result = await self.single_flights[query_type].wait_async(
+                key, token.remaining() if token is not None else None
+            )
+            if found:
+                self.logger.debug("Reporting the result of an identical job")
+                return _EncodedResult(result)
+            self.logger.debug("Identical job did not produce a result in time, executing job")
+            key = None
+        try:
+            result = self._share_result(
+                query_type, await self._call_function_async(query_type, query, query_context, token)
+            )
+        except BaseException:
+            self._abort_flight(query_type, key)
+            raise
+        self._land_flight(query_type, key, result)
+        return result
+
+    async def get_result_async(
+        self,
+        query_type: str,
+        query: Dict[str, Any],
+        query_context: Dict[str, Any],
+        token: Optional[CancellationToken] = None,
+    ) -> Any:
+        function_ref = self.registered_functions.get(query_type)
+        if token is not None and token.deadline is None:
+            token = None
+        if function_ref is not None and inspect.iscoroutinefunction(function_ref):
+            key, hit, result = self._cache_lookup(query_type, query, query_context)
+            if hit:
+                return result
+            result = await self._call_coalesced_async(query_type, query, query_context, token)
+            self._cache_store(query_type, key, result)
+            return result
+        # asyncio.to_thread copies the current context, so TASK_JOB_ID is visible in the worker thread's logs
+        thread_result = asyncio.ensure_future(asyncio.to_thread(self.get_result, query_type, query, query_context))
+        if token is None:
+            return await thread_result
+        return await self._await_thread_with_deadline(thread_result, token)
+
+    async def handle_job_async(self, job: Dict[str, Any], received_at: Optional[float] = None) -> None:
+        job_id, query_type, query, query_context = self._parse_job(job)
+        token = self._start_deadline(query_type, query_context, received_at)
+        TASK_JOB_ID.set(job_id)
+        self.logger.debug(f"Received job; queryType: {query_type}")
+        try:
+            if token.is_cancelled():
+                self.logger.warning("Job's deadline passed before it started, rejecting it")
+                result = self.get_timeout_failure(query_type)
+            else:
+                self.logger.debug("Executing job")
+                with self.tracer.activate(job_id):
+                    result = await self.get_result_async(query_type, query, query_context, token)
+                self.logger.debug("Successfully executed job")
+        except Exception as e:
+            if token.is_cancelled():
+                self.logger.error(f"Job exceeded its timeout: {str(e)}")
+                result = self.get_timeout_failure(query_type)
+            else:
+                self.logger.error(f"Error executing job: {str(e)}")
+                result = self.get_failed_query(f"{str(e)}: {traceback.format_exc()}")
+        self.logger.debug("Reporting result for job")
+        await self.report_job_result_async(job_id, result, query_type)
+
+    async def _run_batch_async(
+        self, query_type: str, items: List[BatchItem], token: CancellationToken
+    ) -> List[Tuple[str, Any]]:
+        """Counterpart of `_run_batch` for `async def` batch functions"""
+        start = time.perf_counter()
+        try:
+            try:
+                outputs = await asyncio.wait_for(
+                    self.registered_functions[query_type](
+                        [item.typed_context for item in items], [item.typed_query for item in items]
+                    ),
+                    token.remaining(),
+                )
+            finally:
+                self._record_batch_executed(query_type, items, start)
+            results = self._batch_results(items, outputs)
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                token.cancel()
+            if token.is_cancelled() or len(items) == 1:
+                return self._failed_batch_results(query_type, items, token, e)
+            self.logger.warning(f"Batch of {len(items)} jobs failed, retrying them one at a time: {str(e)}")
+            results = []
+            for item in items:
+                results.extend(await self._run_batch_async(query_type, [item], token))
+            return results
+        self.batch_limit(query_type).record(len(items), time.perf_counter() - start)
+        return results
+
+    async def handle_batch_async(self, jobs: List[Tuple[Dict[str, Any], float]]) -> None:
+        """Execute the jobs of a batch function together & report the result of each job"""
+        query_type, items, results, token = self._prepare_batch(jobs)
+        self.logger.debug(f"Executing batch of {len(items)} jobs; queryType: {query_type}")
+        if items and inspect.iscoroutinefunction(self.registered_functions[query_type]):
+            results.extend(await self._run_batch_async(query_type, items, token))
+        elif items:
+            thread_result = asyncio.ensure_future(asyncio.to_thread(self._run_batch, query_type, items, token))
+            try:
+                if token.deadline is None:
+                    results.extend(await thread_result)
+                else:
+                    results.extend(await self._await_thread_with_deadline(thread_result, token))
+            except asyncio.TimeoutError:
+                results.extend((item.job_id, self.get_timeout_failure(query_type)) for item in items)
+        for job_id, result in results:
+            TASK_JOB_ID.set(job_id)
+            await self.report_job_result_async(job_id, result, query_type)
+
+    async def _handle_batch_in_slots(
+        self,
+        jobs: List[Tuple[Dict[str, Any], float]],
+        slots: asyncio.Semaphore,
+        activity: Optional[WorkerActivity],
+    ) -> None:
+        # Each job occupies one of the worker's slots
+        weight = len(jobs) / self.max_concurrent_coroutines
+        started_at = activity.start_executing(weight) if activity is not None else 0.0
+        try:
+            await self.handle_batch_async(jobs)
+        except Exception as e:
+            self.logger.error(f"Unhandled error while handling batch: {str(e)}")
+            self.logger.error(traceback.format_exc())
+        finally:
+            for _ in jobs:
+                slots.release()
+            if activity is not None:
+                activity.finish_executing(started_at, weight)
+
+    def _flush_batch(
+        self,
+        query_type: str,
+        slots: asyncio.Semaphore,
+        activity: Optional[WorkerActivity],
+        in_flight: Set["asyncio.Task[None]"],
+    ) -> None:
+        jobs = self._pending_batches.pop(query_type, [])
+        if jobs:
+            self._track(asyncio.create_task(self._handle_batch_in_slots(jobs, slots, activity)), in_flight)
+
+    async def _flush_batch_after(
+        self,
+        delay: float,
+        batch: List[Tuple[Dict[str, Any], float]],
+        query_type: str,
+        slots: asyncio.Semaphore,
+        activity: Optional[WorkerActivity],
+        in_flight: Set["asyncio.Task[None]"],
+    ) -> None:
+        await asyncio.sleep(delay)
+        # The batch may already have been executed because it filled up, and another one started since
+        if self._pending_batches.get(query_type) is batch:
+            self._flush_batch(query_type, slots, activity, in_flight)
+
+    def _add_to_batch(
+        self,
+        job: Dict[str, Any],
+        slots: asyncio.Semaphore,
+        activity: Optional[WorkerActivity],
+        in_flight: Set["asyncio.Task[None]"],
+    ) -> bool:
+        """Add the job to the pending batch of its function, if it is a batch function.
+        The batch is executed once it is full or `max_wait_ms` after its first job was received
+        """
+        query_type = job.get("computeModuleJobV1", {}).get("queryType")
+        options = self.batch_options(query_type)
+        if options is None:
+            return False
+        batch = self._pending_batches.setdefault(query_type, [])
+        batch.append((job, time.time()))
+        if len(batch) >= self.batch_limit(query_type).limit:
+            self._flush_batch(query_type, slots, activity, in_flight)
+        elif len(batch) == 1:
+            flush = self._flush_batch_after(options.max_wait_ms / 1000, batch, query_type, slots, activity, in_flight)
+            self._track(asyncio.create_task(flush), in_flight)
+        return True
+
+    def _flush_all_batches(
+        self,
+        slots: asyncio.Semaphore,
+        activity: Optional[WorkerActivity],
+        in_flight: Set["asyncio.Task[None]"],
+    ) -> None:
+        for query_type in list(self._pending_batches):
+            self._flush_batch(query_type, slots, activity, in_flight)
+
+    @staticmethod
+    def _track(task: "asyncio.Task[None]", in_flight: Set["asyncio.Task[None]"]) -> None:
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    def _job_capacity(self) -> int:
+        return self.concurrency * self.max_concurrent_coroutines
+
+    async def _take_function_slot(self, query_type: str, slots: asyncio.Semaphore) -> None:
+        """Take a slot of the job's function, deferring the job until one is free if its function has a quota.
+        Deferred jobs give back their slot of the worker while waiting, so the worker keeps executing other jobs
+        """
+        quotas = self.function_quotas
+        if quotas is None or quotas.try_acquire(query_type):
+            return
+        self.logger.debug(f"No free slot for a job of {query_type}, deferring it")
+        slots.release()
+        quotas.record_deferred(query_type, 1)
+        self._deferred_jobs += 1
+        try:
+            while not quotas.try_acquire(query_type):
+                await asyncio.sleep(QUOTA_RETRY_INTERVAL_SECONDS)
+        finally:
+            quotas.record_deferred(query_type, -1)
+            self._deferred_jobs -= 1
+        await slots.acquire()
+
+    async def _handle_job_in_slot(
+        self,
+        job: Dict[str, Any],
+        slots: asyncio.Semaphore,
+        activity: Optional[WorkerActivity],
+    ) -> None:
+        received_at = time.time()
+        query_type = job.get("computeModuleJobV1", {}).get("queryType")
+        await self._take_function_slot(query_type, slots)
+        weight = 1 / self.max_concurrent_coroutines
+        started_at = activity.start_executing(weight) if activity is not None else 0.0
+        try:
+            await self.handle_job_async(job, received_at)
+        except Exception as e:
+            self.logger.error(f"Unhandled error while handling job: {str(e)}")
+            self.logger.error(traceback.format_exc())
+        finally:
+            slots.release()
+            if self.function_quotas is not None:
+                self.function_quotas.release(query_type)
+            if activity is not None:
+                # Each job occupies one of the worker's slots
+                activity.finish_executing(started_at, weight)
+
+    async def poll_forever_async(self, activity: Optional[WorkerActivity] = None) -> Optional[str]:
+        """Run the worker start hooks, then poll for & execute jobs until the worker needs to be recycled or drained.
+        Returns the reason for recycling, if that is why it stopped
+        """
+        self.logger.debug(f"Running {len(WORKER_START_HOOKS)} worker start hook(s)")
+        await run_worker_start_hooks_async()
+        try:
+            recycle_reason = await self._poll_until_stopped(activity)
+        finally:
+            await run_worker_stop_hooks_async()
+        if recycle_reason == RECYCLE_TIMEOUT:
+            # Exit straight away, as shutting down the event loop would wait for the threads running timed out jobs
+            os._exit(RECYCLE_EXIT_CODES[recycle_reason])
+        return recycle_reason
+
+    async def _poll_until_stopped(self, activity: Optional[WorkerActivity]) -> Optional[str]:
+        recycle_policy = self._recycle_policy()
+        slots = asyncio.Semaphore(self.max_concurrent_coroutines)
+        # Keep references to in-flight tasks so they are not garbage collected before completing
+        in_flight: Set["asyncio.Task[None]"] = set()
+        jobs_started = 0
+        recycle_reason = None
+        while recycle_reason is None:
+            await slots.acquire()
+            if self.has_timed_out_threads:
+                recycle_reason = RECYCLE_TIMEOUT
+                break
+            if activity is not None and activity.drain_requested():
+                self.logger.info("Draining worker")
+                break
+            if self._deferred_jobs >= self.max_concurrent_coroutines:
+                # Stop taking new jobs until one of the deferred jobs has started
+                slots.release()
+                await asyncio.sleep(QUOTA_RETRY_INTERVAL_SECONDS)
+                continue
+            self.logger.debug("Polling for new jobs...")
+            job = await self.get_job_or_none_async()
+            if not job:
+                slots.release()
+                # No more jobs are pending, so there is no point waiting for batches to fill up
+                self._flush_all_batches(slots, activity, in_flight)
+                await asyncio.sleep(self.polling_scheduler.next_delay())
+                continue
+            if not self._add_to_batch(job, slots, activity, in_flight):
+                self._track(asyncio.create_task(self._handle_job_in_slot(job, slots, activity)), in_flight)
+            jobs_started += 1
+            recycle_reason = recycle_policy.recycle_reason(jobs_started)
+            if recycle_reason:
+                self.logger.info(f"Recycling worker after {jobs_started} jobs ({recycle_reason})")
+        self._flush_all_batches(slots, activity, in_flight)
+        if in_flight:
+            await asyncio.wait(in_flight)
+        return recycle_reason
+
+    def poll_forever(self, process_id: int, activity: Optional[WorkerActivity] = None) -> Optional[str]:
+        self._set_logger_process_id(process_id=process_id)
+        self.polling_scheduler.activity = activity
+        if self.function_quotas is not None:
+            self.function_quotas.bind(process_id)
+        self.metrics.bind(process_id)
+        self.tracer.bind(process_id)
+        _install_uvloop()
+        self.logger.info(f"Running up to {self.max_concurrent_coroutines} concurrent jobs on the event loop")
+        try:
+            return asyncio.run(self.poll_forever_async(activity))
+        finally:
+            self.tracer.shutdown()
@@ -0,0 +1,258 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import time
+from dataclasses import dataclass
+from multiprocessing.context import BaseContext
+from typing import Callable, Optional
+
+from compute_modules.client.polling import PollingStats
+
+DEFAULT_AUTOSCALE_INTERVAL_SECONDS = 5.0
+DEFAULT_SCALE_UP_UTILIZATION = 0.8
+DEFAULT_SCALE_DOWN_UTILIZATION = 0.3
+DEFAULT_SCALE_UP_DELAY_SECONDS = 10.0
+DEFAULT_SCALE_DOWN_DELAY_SECONDS = 60.0
+# Workers only scale up while most polls return a job, i.e. while jobs are queueing up
+DEFAULT_SCALE_UP_MAX_EMPTY_POLL_RATIO = 0.2
+DEFAULT_MAX_CPU_LOAD = 0.9
+DEFAULT_MIN_MEMORY_AVAILABLE = 0.1
+
+
+@dataclass
+class ActivitySnapshot:
+    jobs_received: float = 0.0
+    empty_polls: float = 0.0
+    busy_seconds: float = 0.0
+
+
+class WorkerActivity:
+    """Counters written by a worker process & read by the supervisor, kept in shared memory.
+
+    Each counter has a single writer within the worker, so no lock is needed.
+    Busy time includes the jobs that are still executing, so a worker stuck on a long job is seen as busy
+    before the job ends. Start times are taken from `time.monotonic`, which is shared by all processes on Linux.
+    The worker's `PollingScheduler` also publishes its stats here, so the supervisor can report them per worker.
+    The supervisor also uses it to ask the worker to drain & exit.
+    """
+
+    _JOBS_RECEIVED = 0
+    _EMPTY_POLLS = 1
+    _BUSY_SECONDS = 2
+    _DRAIN_REQUESTED = 3
+    _EXECUTING_WEIGHT = 4
+    """Sum of the weights of the jobs being executed"""
+    _EXECUTING_SINCE = 5
+    """Sum of the start times of the jobs being executed, multiplied by their weights"""
+    _VERSION = 6
+    """Odd while the executing counters are being updated, so the supervisor never reads them half-updated"""
+    _FAILED_POLLS = 7
+    _IDLE_SECONDS = 8
+    """Time spent idle over the idle periods that have ended"""
+    _IDLE_PERIODS = 9
+    _IDLE_SINCE = 10
+    """Start of the current idle period, or -1 if the worker is not idle"""
+    _LAST_TIME_TO_FIRST_JOB = 11
+    """-1 until the first idle period has ended"""
+    _SIZE = 12
+
+    def __init__(self, mp_context: BaseContext) -> None:
+        self._values = mp_context.RawArray("d", self._SIZE)
+        self.reset()
+
+    def record_job(self, time_to_first_job: Optional[float] = None) -> None:
+        """A poll returned a job, ending the idle period that lasted `time_to_first_job` seconds if there was one"""
+        self._values[self._JOBS_RECEIVED] += 1
+        if time_to_first_job is not None:
+            self._values[self._IDLE_SECONDS] += time_to_first_job
+            self._values[self._IDLE_PERIODS] += 1
+            self._values[self._LAST_TIME_TO_FIRST_JOB] = time_to_first_job
+            self._values[self._IDLE_SINCE] = -1
+
+    def record_empty_poll(self, idle_since: Optional[float] = None) -> None:
+        """A poll found no job, during the idle period that started at `idle_since`"""
+        self._values[self._EMPTY_POLLS] += 1
+        if idle_since is not None:
+            self._values[self._IDLE_SINCE] = idle_since
+
+    def record_failed_poll(self) -> None:
+        self._values[self._FAILED_POLLS] += 1
+
+    def start_executing(self, weight: float = 1.0) -> float:
+        """Record that a job started executing, occupying `weight` of the worker's capacity.
+        Returns the start time to pass to `finish_executing`
+        """
+        started_at = time.monotonic()
+        self._values[self._VERSION] += 1
+        self._values[self._EXECUTING_WEIGHT] += weight
+        self._values[self._EXECUTING_SINCE] += weight * started_at
+        self._values[self._VERSION] += 1
+        return started_at
+
+    def finish_executing(self, started_at: float, weight: float = 1.0) -> None:
+        now = time.monotonic()
+        self._values[self._VERSION] += 1
+        self._values[self._BUSY_SECONDS] += weight * (now - started_at)
+        self._values[self._EXECUTING_WEIGHT] -= weight
+        self._values[self._EXECUTING_SINCE] -= weight * started_at
+        if self._values[self._EXECUTING_WEIGHT] < 1e-9:
+            # Do not let floating point errors accumulate
+            self._values[self._EXECUTING_WEIGHT] = self._values[self._EXECUTING_SINCE] = 0
+        self._values[self._VERSION] += 1
+
+    def request_drain(self) -> None:
+        self._values[self._DRAIN_REQUESTED] = 1
+
+    def drain_requested(self) -> bool:
+        return bool(self._values[self._DRAIN_REQUESTED])
+
+    def reset(self) -> None:
+        for i in range(len(self._values)):
+            self._values[i] = 0
+        self._values[self._IDLE_SINCE] = self._values[self._LAST_TIME_TO_FIRST_JOB] = -1
+
+    def snapshot(self) -> ActivitySnapshot:
+        while True:
+            version = self._values[self._VERSION]
+            now = time.monotonic()
+            busy_seconds = self._values[self._BUSY_SECONDS]
+            executing_weight = self._values[self._EXECUTING_WEIGHT]
+            executing_since = self._values[self._EXECUTING_SINCE]
+            if version % 2 == 0 and self._values[self._VERSION] == version:
+                break
+        return ActivitySnapshot(
+            jobs_received=self._values[self._JOBS_RECEIVED],
+            empty_polls=self._values[self._EMPTY_POLLS],
+            busy_seconds=busy_seconds + max(0.0, executing_weight * now - executing_since),
+        )
+
+    def polling_stats(self) -> PollingStats:
+        """The stats of the worker's `PollingScheduler`, as last published"""
+        idle_since = self._values[self._IDLE_SINCE]
+        last_time_to_first_job = self._values[self._LAST_TIME_TO_FIRST_JOB]
+        return PollingStats.from_counters(
+            jobs_received=int(self._values[self._JOBS_RECEIVED]),
+            empty_polls=int(self._values[self._EMPTY_POLLS]),
+            failed_polls=int(self._values[self._FAILED_POLLS]),
+            completed_idle_seconds=self._values[self._IDLE_SECONDS],
+            idle_periods=int(self._values[self._IDLE_PERIODS]),
+            idle_since=idle_since if idle_since >= 0 else None,
+            last_time_to_first_job=last_time_to_first_job if last_time_to_first_job >= 0 else None,
+            now=time.monotonic(),
+        )
+
+
+@dataclass
+class LoadSignals:
+    """What the autoscaler knows about the load on the workers over the last interval"""
+
+    utilization: float
+    """Fraction of the workers' time spent executing jobs"""
+
+    empty_poll_ratio: Optional[float]
+    """Fraction of polls that found no job (204). None if the workers did not poll at all, e.g. executing long jobs"""
+
+    cpu_load: Optional[float] = None
+    """Load average of the host divided by its number of CPUs"""
+
+    memory_available: Optional[float] = None
+    """Fraction of the host's memory that is available"""
+
+
+class Autoscaler:
+    """Decides how many worker processes should be running, between `min_workers` & `max_workers`.
+
+    Workers scale up one at a time once they have been busy (utilization above `scale_up_utilization`
+    with few empty polls) for `scale_up_delay` seconds, unless the host's CPU or memory is under pressure.
+    They scale down one at a time once they have been mostly idle (utilization below `scale_down_utilization`)
+    for `scale_down_delay` seconds, or as soon as the host runs low on memory.
+    """
+
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int,
+        interval: float = DEFAULT_AUTOSCALE_INTERVAL_SECONDS,
+        scale_up_utilization: float = DEFAULT_SCALE_UP_UTILIZATION,
+        scale_down_utilization: float = DEFAULT_SCALE_DOWN_UTILIZATION,
+        scale_up_delay: float = DEFAULT_SCALE_UP_DELAY_SECONDS,
+        scale_down_delay: float = DEFAULT_SCALE_DOWN_DELAY_SECONDS,
+        scale_up_max_empty_poll_ratio: float = DEFAULT_SCALE_UP_MAX_EMPTY_POLL_RATIO,
+        max_cpu_load: float = DEFAULT_MAX_CPU_LOAD,
+        min_memory_available: float = DEFAULT_MIN_MEMORY_AVAILABLE,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError(f"Expected 1 <= min_workers <= max_workers, got {min_workers} & {max_workers}")
+        if scale_down_utilization >= scale_up_utilization:
+            raise ValueError("scale_down_utilization must be lower than scale_up_utilization")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.scale_up_utilization = scale_up_utilization
+        self.scale_down_utilization = scale_down_utilization
+        self.scale_up_delay = scale_up_delay
+        self.scale_down_delay = scale_down_delay
+        self.scale_up_max_empty_poll_ratio = scale_up_max_empty_poll_ratio
+        self.max_cpu_load = max_cpu_load
+        self.min_memory_available = min_memory_available
+        self._clock = clock
+        self._busy_since: Optional[float] = None
+        self._idle_since: Optional[float] = None
+
+    def _low_on_memory(self, signals: LoadSignals) -> bool:
+        return signals.memory_available is not None and signals.memory_available < self.min_memory_available
+
+    def _cpu_saturated(self, signals: LoadSignals) -> bool:
+        return signals.cpu_load is not None and signals.cpu_load >= self.max_cpu_load
+
+    def desired_workers(self, current_workers: int, signals: LoadSignals) -> int:
+        """Number of workers that should be running given the load over the last interval"""
+        now = self._clock()
+        busy = signals.utilization >= self.scale_up_utilization and (
+            signals.empty_poll_ratio is None or signals.empty_poll_ratio <= self.scale_up_max_empty_poll_ratio
+        )
+        idle = signals.utilization <= self.scale_down_utilization
+        self._busy_since = (self._busy_since if self._busy_since is not None else now) if busy else None
+        self._idle_since = (self._idle_since if self._idle_since is not None else now) if idle else None
+
+        if self._low_on_memory(signals) and current_workers > self.min_workers:
+            self._busy_since = self._idle_since = None
+            return current_workers - 1
+        if (
+            self._busy_since is not None
+            and now - self._busy_since >= self.scale_up_delay
+            and current_workers < self.max_workers
+            and not self._cpu_saturated(signals)
+            and not self._low_on_memory(signals)
+        ):
+            # Require the workers to be busy for another full delay before scaling up again
+            self._busy_since = None
+            return current_workers + 1
+        if (
+            self._idle_since is not None
+            and now - self._idle_since >= self.scale_down_delay
+            and current_workers > self.min_workers
+        ):
+            self._idle_since = None
+            return current_workers - 1
+        return current_workers
+
+
+__all__ = [
+    "Autoscaler",
+    "LoadSignals",
+    "WorkerActivity",
+]
@@ -0,0 +1,77 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from compute_modules.context.cancellation import CancellationToken
+
+# A batch whose latency per job is this much worse than the running average halves the batch size
+LATENCY_DEGRADATION_TOLERANCE = 0.25
+LATENCY_SMOOTHING = 0.2
+
+
+@dataclass
+class BatchItem:
+    """A job of a batch function, parsed & waiting to be executed with the other jobs of its batch"""
+
+    job_id: str
+    query: Any
+    query_context: Dict[str, Any]
+    typed_context: Any = None
+    typed_query: Any = None
+
+
+class AdaptiveBatchLimit:
+    """Decides how many jobs to execute together in a batch, between 1 & `max_batch_size`.
+
+    Starts at `max_batch_size`, and is halved when a batch takes longer than `latency_budget` seconds or its
+    latency per job rises above the running average, i.e. when larger batches stop paying off.
+    It then grows back by one after each full batch whose latency per job was not worse than the average.
+    """
+
+    def __init__(self, max_batch_size: int, latency_budget: Optional[float] = None) -> None:
+        self.max_batch_size = max_batch_size
+        self.latency_budget = latency_budget
+        self.limit = max_batch_size
+        self.average_job_seconds: Optional[float] = None
+
+    def record(self, batch_size: int, seconds: float) -> None:
+        """Record how long it took to execute a batch of `batch_size` jobs"""
+        job_seconds = seconds / batch_size
+        if self.average_job_seconds is None:
+            self.average_job_seconds = job_seconds
+            return
+        over_budget = self.latency_budget is not None and seconds > self.latency_budget
+        if over_budget or job_seconds > self.average_job_seconds * (1 + LATENCY_DEGRADATION_TOLERANCE):
+            self.limit = max(1, self.limit // 2)
+        elif batch_size >= self.limit:
+            self.limit = min(self.max_batch_size, self.limit + 1)
+        self.average_job_seconds += LATENCY_SMOOTHING * (job_seconds - self.average_job_seconds)
+
+
+def batch_deadline_token(items: List[BatchItem]) -> CancellationToken:
+    """A cancellation token shared by the jobs of a batch, cancelled at the earliest of their deadlines"""
+    deadlines = [item.query_context["deadline"] for item in items if item.query_context["deadline"] is not None]
+    token = CancellationToken(deadline=min(deadlines) if deadlines else None)
+    for item in items:
+        item.query_context["cancellationToken"] = token
+    return token
+
+
+__all__ = [
+    "AdaptiveBatchLimit",
+    "BatchItem",
+]
@@ -0,0 +1,221 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import http.client
+import os
+import socket
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+from compute_modules.logging.internal import get_internal_logger
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_IDLE_TIMEOUT_SECONDS = 60.0
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 60.0 * 5  # 5 minutes
+
+# Errors raised when a pooled connection was closed by the remote end while it sat idle in the pool
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    http.client.CannotSendRequest,
+    http.client.ResponseNotReady,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    ssl.SSLEOFError,
+)
+
+
+class ResultPostError(ConnectionError):
+    """A job result could not be posted to the runtime after all attempts"""
+
+
+@dataclass
+class ConnectionPoolStats:
+    """Counters describing how well connections are being reused by a `HTTPSConnectionPool`"""
+
+    requests: int = 0
+    """Total number of requests sent through the pool"""
+
+    connections_opened: int = 0
+    """Number of new TCP connections opened"""
+
+    full_handshakes: int = 0
+    """Number of TLS handshakes that could not resume a previous session"""
+
+    resumed_handshakes: int = 0
+    """Number of TLS handshakes that resumed a previous session"""
+
+    stale_reconnects: int = 0
+    """Number of requests transparently retried after finding a stale pooled connection"""
+
+
+class _PooledHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPSConnection that offers the pool's last TLS session when connecting so the handshake can be resumed"""
+
+    def __init__(self, pool: "HTTPSConnectionPool", *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._pool = pool
+        self.last_used = time.monotonic()
+
+    def connect(self) -> None:
+        # Same as http.client.HTTPSConnection.connect, minus tunnelling (never used here) and plus session resumption
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(  # type: ignore[attr-defined]
+            self.sock,
+            server_hostname=self.host,
+            session=self._pool.tls_session,
+        )
+        self._pool._record_handshake(self.sock)
+
+
+class HTTPSConnectionPool:
+    """Thread-safe pool of persistent keep-alive HTTPS connections to a single host.
+
+    Connections are only ever reused within the process that opened them, so a pool created
+    before forking worker processes is safe to use from each of the workers.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        context: ssl.SSLContext,
+        max_size: int = DEFAULT_POOL_SIZE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT_SECONDS,
+        timeout: float = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.context = context
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.tls_session: Optional[ssl.SSLSession] = None
+        self.stats = ConnectionPoolStats()
+        self._lock = threading.Lock()
+        self._idle: List[_PooledHTTPSConnection] = []
+        self._pid = os.getpid()
+
+    def _record_handshake(self, sock: socket.socket) -> None:
+        assert isinstance(sock, ssl.SSLSocket)
+        with self._lock:
+            self.stats.connections_opened += 1
+            if sock.session_reused:
+                self.stats.resumed_handshakes += 1
+            else:
+                self.stats.full_handshakes += 1
+
+    def _remember_session(self, connection: _PooledHTTPSConnection) -> None:
+        # TLS 1.3 session tickets arrive after the handshake, so the session is captured once a response has been read
+        if isinstance(connection.sock, ssl.SSLSocket) and connection.sock.session is not None:
+            self.tls_session = connection.sock.session
+
+    def _reset_after_fork(self) -> None:
+        """Drop connections inherited from the parent process without closing the parent's sockets"""
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = os.getpid()
+
+    def _checkout(self) -> Tuple[_PooledHTTPSConnection, bool]:
+        """Returns an idle connection if one is available, otherwise a new one.
+        The second element of the tuple indicates whether the connection has been used before
+        """
+        if os.getpid() != self._pid:
+            self._reset_after_fork()
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                connection = self._idle.pop()
+                if now - connection.last_used <= self.idle_timeout:
+                    return connection, True
+                connection.close()
+        return (
+            _PooledHTTPSConnection(self, host=self.host, port=self.port, context=self.context, timeout=self.timeout),
+            False,
+        )
+
+    def _checkin(self, connection: _PooledHTTPSConnection) -> None:
+        connection.last_used = time.monotonic()
+        with self._lock:
+            if os.getpid() == self._pid and len(self._idle) < self.max_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self) -> None:
+        """Close all idle connections held by the pool"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    @contextmanager
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, Any],
+        body: Optional[Any] = None,
+    ) -> Generator[http.client.HTTPResponse, Any, None]:
+        """Send a request over a pooled connection, transparently reconnecting if the pooled connection is stale"""
+        connection, reused = self._checkout()
+        with self._lock:
+            self.stats.requests += 1
+        try:
+            connection.request(method=method, url=url, body=body, headers=headers)
+            response = connection.getresponse()
+        except STALE_CONNECTION_ERRORS as e:
+            connection.close()
+            if not reused:
+                raise
+            get_internal_logger().debug(f"Pooled connection was stale ({type(e).__name__}), reconnecting")
+            with self._lock:
+                self.stats.stale_reconnects += 1
+            # Other idle connections were most likely dropped by the remote end at the same time
+            self.close()
+            connection, reused = self._checkout()
+            try:
+                connection.request(method=method, url=url, body=body, headers=headers)
+                response = connection.getresponse()
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+        keep_alive = False
+        try:
+            yield response
+            # The response must be fully consumed before the connection can carry another request
+            response.read()
+            keep_alive = not response.will_close
+        finally:
+            self._remember_session(connection)
+            if keep_alive:
+                self._checkin(connection)
+            else:
+                connection.close()
+
+
+__all__ = [
+    "ConnectionPoolStats",
+    "HTTPSConnectionPool",
+    "ResultPostError",
+]
@@ -0,0 +1,113 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Sequence
+
+from compute_modules.context.cancellation import CancellationToken
+
+DEFAULT_JOB_TIMEOUT_GRACE_SECONDS = 5.0
+JOB_TIMEOUT_ERROR = "TIMEOUT"
+
+
+class _WatchedJobs:
+    def __init__(self, job_ids: Sequence[str], token: CancellationToken) -> None:
+        self.job_ids = list(job_ids)
+        self.token = token
+        self.aborted = False
+        """Set under the watchdog's condition once the watchdog has claimed the jobs, so only it reports them"""
+        self.abort_handled = threading.Event()
+
+
+class DeadlineWatchdog:
+    """Enforces the deadline of the job (or batch of jobs) a worker process is executing.
+
+    Once the deadline passes, the job's cancellation token is cancelled so the function can stop cooperatively.
+    If the job is still running `grace` seconds later, `on_hard_timeout` is called from the watchdog thread with
+    the job IDs. As the thread executing the job cannot be interrupted, it is expected to end the process.
+
+    Whether the job finished or was aborted is decided under the watchdog's lock, so exactly one of the job's own
+    result & the timeout reported by `on_hard_timeout` is reported: if the job finishes after being aborted, leaving
+    the `watch` block waits for `on_hard_timeout` to return, which it only does if it did not end the process.
+    """
+
+    def __init__(
+        self, on_hard_timeout: Callable[[List[str]], None], grace: float = DEFAULT_JOB_TIMEOUT_GRACE_SECONDS
+    ) -> None:
+        self.on_hard_timeout = on_hard_timeout
+        self.grace = grace
+        self._condition = threading.Condition()
+        self._current: Optional[_WatchedJobs] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def watch(self, job_ids: Sequence[str], token: CancellationToken) -> Iterator[None]:
+        """Enforce the deadline of `token` while the block executes `job_ids`"""
+        if token.deadline is None:
+            yield
+            return
+        watched = _WatchedJobs(job_ids, token)
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="compute-module-watchdog", daemon=True)
+                self._thread.start()
+            self._current = watched
+            self._condition.notify()
+        try:
+            yield
+        finally:
+            with self._condition:
+                if self._current is watched:
+                    self._current = None
+                    self._condition.notify()
+            if watched.aborted:
+                watched.abort_handled.wait()
+
+    def _wait_for_hard_timeout(self) -> _WatchedJobs:
+        with self._condition:
+            while True:
+                watched = self._current
+                if watched is None:
+                    self._condition.wait()
+                    continue
+                deadline = watched.token.deadline
+                assert deadline is not None
+                now = time.time()
+                if now < deadline:
+                    self._condition.wait(deadline - now)
+                    continue
+                watched.token.cancel()
+                hard_deadline = deadline + self.grace
+                if now < hard_deadline:
+                    self._condition.wait(hard_deadline - now)
+                    continue
+                watched.aborted = True
+                self._current = None
+                return watched
+
+    def _run(self) -> None:
+        while True:
+            watched = self._wait_for_hard_timeout()
+            try:
+                self.on_hard_timeout(watched.job_ids)
+            finally:
+                watched.abort_handled.set()
+
+
+__all__ = [
+    "DeadlineWatchdog",
+]
@@ -13,27 +13,119 @@
 #  limitations under the License.
 
 
+import asyncio
 import http.client
+import inspect
 import json
 import multiprocessing
 import os
+import shutil
 import ssl
+import tempfile
 import time
 import traceback
-from contextlib import contextmanager
-from typing import Any, Callable, Dict, Generator, List, Optional
+from contextlib import contextmanager, nullcontext
+from multiprocessing.context import BaseContext, ForkServerContext
+from typing import Any, Awaitable, Callable, ContextManager, Dict, Generator, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
+from compute_modules.caching.result_cache import CachePolicy, CacheStats, ResultCache
+from compute_modules.caching.shared_cache import SharedResultCache
+from compute_modules.caching.single_flight import CoalescePolicy, SingleFlight
+from compute_modules.client.autoscaler import (
+    DEFAULT_AUTOSCALE_INTERVAL_SECONDS,
+    DEFAULT_SCALE_DOWN_DELAY_SECONDS,
+    DEFAULT_SCALE_DOWN_UTILIZATION,
+    DEFAULT_SCALE_UP_DELAY_SECONDS,
+    DEFAULT_SCALE_UP_UTILIZATION,
+    Autoscaler,
+    WorkerActivity,
+)
+from compute_modules.client.batching import AdaptiveBatchLimit, BatchItem, batch_deadline_token
+from compute_modules.client.connection_pool import (
+    DEFAULT_IDLE_TIMEOUT_SECONDS,
+    DEFAULT_POOL_SIZE,
+    HTTPSConnectionPool,
+    ResultPostError,
+)
+from compute_modules.client.deadlines import DEFAULT_JOB_TIMEOUT_GRACE_SECONDS, JOB_TIMEOUT_ERROR, DeadlineWatchdog
+from compute_modules.client.json_codec import DEFAULT_JSON_CODEC, create_json_codec
+from compute_modules.client.metrics import (
+    COUNTER_FAILED_JOBS,
+    COUNTER_JOBS,
+    COUNTER_RESULT_POST_RETRIES,
+    COUNTER_SCHEMA_POST_RETRIES,
+    DEFAULT_METRICS_DUMP_INTERVAL_SECONDS,
+    DEFAULT_METRICS_HOST,
+    STAGE_CONVERT,
+    STAGE_DECODE,
+    STAGE_ENCODE,
+    STAGE_EXECUTE,
+    STAGE_POLL,
+    STAGE_REPORT,
+    JobMetrics,
+    MetricsExporter,
+)
+from compute_modules.client.polling import (
+    DEFAULT_IDLE_BASE_DELAY_SECONDS,
+    DEFAULT_IDLE_MAX_DELAY_SECONDS,
+    DEFAULT_RECONNECT_BASE_DELAY_SECONDS,
+    DEFAULT_RECONNECT_MAX_DELAY_SECONDS,
+    PollingScheduler,
+)
+from compute_modules.client.profiling import (
+    DEFAULT_PROFILE_MAX_FILES,
+    DEFAULT_PROFILE_SAMPLE_INTERVAL_SECONDS,
+    JobProfiler,
+)
+from compute_modules.client.quotas import FunctionQuotas, has_quota
+from compute_modules.client.supervisor import (
+    DEFAULT_RESTART_BASE_DELAY_SECONDS,
+    DEFAULT_RESTART_MAX_DELAY_SECONDS,
+    DEFAULT_STOP_TIMEOUT_SECONDS,
+    RecyclePolicy,
+    WorkerSupervisor,
+)
+from compute_modules.client.worker import DEFAULT_PREFETCH_DEPTH, PipelinedWorker
+from compute_modules.context.cancellation import CancellationToken
 from compute_modules.context.types import QueryContext
-from compute_modules.function_registry.function_payload_converter import convert_payload
-from compute_modules.function_registry.types import ComputeModuleFunctionSchema, PythonClassNode
+from compute_modules.function_registry.function_payload_converter import PayloadConverter, compile_payload_converter
+from compute_modules.function_registry.function_result_encoder import ResultEncoder, compile_result_encoder
+from compute_modules.function_registry.types import ComputeModuleFunctionSchema, FunctionOptions, PythonClassNode
+from compute_modules.lifecycle.forkserver import configure_forkserver
+from compute_modules.lifecycle.hooks import (
+    PRELOAD_HOOKS,
+    WORKER_START_HOOKS,
+    run_preload_hooks,
+    run_worker_start_hooks,
+    run_worker_stop_hooks,
+)
 from compute_modules.logging.common import COMPUTE_MODULES_ADAPTER_MANAGER
 from compute_modules.logging.internal import get_internal_logger
+from compute_modules.tracing.exporters import SPAN_EXPORTERS, JsonLinesSpanExporter
+from compute_modules.tracing.spans import get_current_span, start_span
+from compute_modules.tracing.tracer import DEFAULT_TRACE_SAMPLE_RATE, Tracer
 
 from ..context import get_extra_context_parameters
 
 POST_RESULT_MAX_ATTEMPTS = 5
 POST_SCHEMAS_MAX_ATTEMPTS = 5
+DEFAULT_WORKER_START_METHOD = "fork"
+_NOT_PROFILED: ContextManager[None] = nullcontext()
+
+
+def _job_query_type(job: Dict[str, Any]) -> Optional[str]:
+    return job.get("computeModuleJobV1", {}).get("queryType")
+
+
+class _JobFailure(Dict[str, str]):
+    """Result reporting that a job failed, told apart from results returned by functions in metrics"""
+
+
+class _EncodedResult(bytes):
+    """Result already encoded as the JSON to report. The results of functions that are cached or coalesced are
+    encoded as soon as they are returned, so cache hits & identical jobs report exactly the same bytes
+    """
 
 
 def _extract_path_from_url(url: str) -> str:
@@ -48,11 +140,16 @@ class InternalQueryService:
         function_schemas: List[ComputeModuleFunctionSchema],
         function_schema_conversions: Dict[str, PythonClassNode],
         is_function_context_typed: Dict[str, bool],
+        function_options: Optional[Dict[str, FunctionOptions]] = None,
+        function_output_types: Optional[Dict[str, Any]] = None,
     ):
         self.registered_functions = registered_functions
         self.function_schemas = function_schemas
         self.function_schema_conversions = function_schema_conversions
         self.is_function_context_typed = is_function_context_typed
+        self.function_options = function_options or {}
+        self.function_output_types = function_output_types or {}
+        self.payload_converters = self._compile_payload_converters()
         self.host = os.environ["RUNTIME_HOST"]
         self.port = int(os.environ["RUNTIME_PORT"])
         self.get_job_path = _extract_path_from_url(os.environ["GET_JOB_URI"])
@@ -62,9 +159,172 @@ class InternalQueryService:
         self._initialize_headers()
         self.certPath = os.environ["CONNECTIONS_TO_OTHER_PODS_CA_PATH"]
         self.context = ssl.create_default_context(cafile=self.certPath)
-        self.connection_refused_count: int = 0
         self.concurrency = int(os.environ.get("MAX_CONCURRENT_TASKS", 1))
+        self.min_concurrency = int(os.environ.get("MIN_CONCURRENT_TASKS", self.concurrency))
+        self.autoscale_interval = float(
+            os.environ.get("AUTOSCALE_INTERVAL_SECONDS", DEFAULT_AUTOSCALE_INTERVAL_SECONDS)
+        )
+        self.scale_up_utilization = float(
+            os.environ.get("AUTOSCALE_SCALE_UP_UTILIZATION", DEFAULT_SCALE_UP_UTILIZATION)
+        )
+        self.scale_down_utilization = float(
+            os.environ.get("AUTOSCALE_SCALE_DOWN_UTILIZATION", DEFAULT_SCALE_DOWN_UTILIZATION)
+        )
+        self.scale_up_delay = float(os.environ.get("AUTOSCALE_SCALE_UP_DELAY_SECONDS", DEFAULT_SCALE_UP_DELAY_SECONDS))
+        self.scale_down_delay = float(
+            os.environ.get("AUTOSCALE_SCALE_DOWN_DELAY_SECONDS", DEFAULT_SCALE_DOWN_DELAY_SECONDS)
+        )
+        self.prefetch_depth = int(os.environ.get("JOB_PREFETCH_DEPTH", DEFAULT_PREFETCH_DEPTH))
+        self.default_job_timeout = float(os.environ.get("JOB_TIMEOUT_SECONDS", 0))
+        self.job_timeout_grace = float(os.environ.get("JOB_TIMEOUT_GRACE_SECONDS", DEFAULT_JOB_TIMEOUT_GRACE_SECONDS))
+        self.deadline_watchdog: Optional[DeadlineWatchdog] = None
+        self.batch_limits: Dict[str, AdaptiveBatchLimit] = {}
+        # Created by `start` when a function has a quota, as its counters are shared with the worker processes
+        self.function_quotas: Optional[FunctionQuotas] = None
+        self.json_codec_name = os.environ.get("JSON_CODEC", DEFAULT_JSON_CODEC)
+        self.json_codec = create_json_codec(self.json_codec_name)
+        # Replaced by `start` with metrics shared with the worker processes
+        self.metrics = JobMetrics(list(self.registered_functions), json_codec=self.json_codec.name)
+        self.result_encoders = self._compile_result_encoders()
+        self.tracer = self._create_tracer()
+        self.profiler = self._create_profiler()
+        # Shared result caches are removed on exit, unless they are kept in a directory chosen with RESULT_CACHE_DIR
+        self.owns_result_cache_dir = not os.environ.get("RESULT_CACHE_DIR")
+        self.result_cache_dir = os.environ.get("RESULT_CACHE_DIR") or os.path.join(
+            tempfile.gettempdir(), f"compute-modules-result-cache-{os.getpid()}"
+        )
+        self.result_caches = {
+            query_type: self._create_result_cache(query_type, options.cache)
+            for query_type, options in self.function_options.items()
+            if options.cache is not None
+        }
+        self.single_flights = {
+            query_type: self._create_single_flight(query_type, options.coalesce)
+            for query_type, options in self.function_options.items()
+            if options.coalesce is not None
+        }
+        self.worker_max_jobs = int(os.environ.get("WORKER_MAX_JOBS", 0))
+        self.worker_max_rss_mb = int(os.environ.get("WORKER_MAX_RSS_MB", 0))
+        self.worker_start_method = os.environ.get("WORKER_START_METHOD", DEFAULT_WORKER_START_METHOD)
+        self.worker_preload_modules = [
+            module for module in os.environ.get("WORKER_PRELOAD_MODULES", "").split(",") if module.strip()
+        ]
         self.logger = get_internal_logger()
+        self.polling_scheduler = PollingScheduler(
+            idle_base_delay=float(os.environ.get("POLL_IDLE_BASE_DELAY_SECONDS", DEFAULT_IDLE_BASE_DELAY_SECONDS)),
+            idle_max_delay=float(os.environ.get("POLL_IDLE_MAX_DELAY_SECONDS", DEFAULT_IDLE_MAX_DELAY_SECONDS)),
+            reconnect_base_delay=float(
+                os.environ.get("POLL_RECONNECT_BASE_DELAY_SECONDS", DEFAULT_RECONNECT_BASE_DELAY_SECONDS)
+            ),
+            reconnect_max_delay=float(
+                os.environ.get("POLL_RECONNECT_MAX_DELAY_SECONDS", DEFAULT_RECONNECT_MAX_DELAY_SECONDS)
+            ),
+        )
+        self._event_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.connection_pool_size = int(os.environ.get("CONNECTION_POOL_SIZE", DEFAULT_POOL_SIZE))
+        self.connection_pool_idle_timeout = float(
+            os.environ.get("CONNECTION_POOL_IDLE_TIMEOUT_SECONDS", DEFAULT_IDLE_TIMEOUT_SECONDS)
+        )
+        self.connection_pool = self._create_connection_pool()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Worker processes that are not forked receive a copy of the service without its connections,
+        which are re-created in the worker
+        """
+        state = self.__dict__.copy()
+        for attribute in (
+            "context",
+            "connection_pool",
+            "supervisor",
+            "_event_loop",
+            "logger",
+            "deadline_watchdog",
+            "payload_converters",
+            "result_encoders",
+            "json_codec",
+        ):
+            state.pop(attribute, None)
+        state["_internal_log_level"] = self.logger.getEffectiveLevel()
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        internal_log_level = state.pop("_internal_log_level")
+        self.__dict__.update(state)
+        self.logger = get_internal_logger()
+        self.logger.setLevel(internal_log_level)
+        self.context = ssl.create_default_context(cafile=self.certPath)
+        self.connection_pool = self._create_connection_pool()
+        self._event_loop = None
+        self.deadline_watchdog = None
+        self.payload_converters = self._compile_payload_converters()
+        self.json_codec = create_json_codec(self.json_codec_name)
+        self.result_encoders = self._compile_result_encoders()
+
+    def _compile_payload_converters(self) -> Dict[str, PayloadConverter]:
+        """Compiled converters & encoders are generated code that cannot be pickled, so they are compiled again in
+        workers
+        """
+        return {
+            query_type: compile_payload_converter(class_tree, lazy=self._is_input_lazy(query_type))
+            for query_type, class_tree in self.function_schema_conversions.items()
+        }
+
+    def _compile_result_encoders(self) -> Dict[str, ResultEncoder]:
+        return {
+            query_type: compile_result_encoder(output_type, dumps=self.json_codec.dumps)
+            for query_type, output_type in self.function_output_types.items()
+        }
+
+    def _is_input_lazy(self, query_type: str) -> bool:
+        options = self.function_options.get(query_type)
+        return options is not None and options.lazy_input
+
+    def _create_result_cache(self, query_type: str, policy: CachePolicy) -> Union[ResultCache, SharedResultCache]:
+        if not policy.shared:
+            return ResultCache(policy)
+        os.makedirs(self.result_cache_dir, exist_ok=True)
+        return SharedResultCache(policy, path=os.path.join(self.result_cache_dir, f"{query_type}.sqlite"))
+
+    def _create_single_flight(self, query_type: str, policy: CoalescePolicy) -> SingleFlight:
+        os.makedirs(self.result_cache_dir, exist_ok=True)
+        return SingleFlight(policy, path=os.path.join(self.result_cache_dir, f"{query_type}.flights.sqlite"))
+
+    def _create_tracer(self) -> Tracer:
+        """Jobs are traced when TRACE_FILE is set or span exporters are registered, see `add_span_exporter`"""
+        exporters = list(SPAN_EXPORTERS)
+        if os.environ.get("TRACE_FILE"):
+            exporters.append(JsonLinesSpanExporter(os.environ["TRACE_FILE"]))
+        return Tracer(exporters, sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", DEFAULT_TRACE_SAMPLE_RATE)))
+
+    def _create_profiler(self) -> Optional[JobProfiler]:
+        """Jobs are profiled when PROFILE_DIR is set, see `JobProfiler`"""
+        directory = os.environ.get("PROFILE_DIR")
+        if not directory:
+            return None
+        slow_job_seconds = float(os.environ.get("PROFILE_SLOW_JOB_SECONDS", 0))
+        return JobProfiler(
+            directory,
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+            slow_job_seconds=slow_job_seconds if slow_job_seconds > 0 else None,
+            max_files=int(os.environ.get("PROFILE_MAX_FILES", DEFAULT_PROFILE_MAX_FILES)),
+            sample_interval=float(
+                os.environ.get("PROFILE_SAMPLE_INTERVAL_SECONDS", DEFAULT_PROFILE_SAMPLE_INTERVAL_SECONDS)
+            ),
+        )
+
+    def _profile(self, job_id: Optional[str], query_type: str) -> ContextManager[None]:
+        if self.profiler is None:
+            return _NOT_PROFILED
+        return self.profiler.profile(job_id, query_type)
+
+    def _create_connection_pool(self) -> HTTPSConnectionPool:
+        return HTTPSConnectionPool(
+            host=self.host,
+            port=self.port,
+            context=self.context,
+            max_size=self.connection_pool_size,
+            idle_timeout=self.connection_pool_idle_timeout,
+        )
 
     def _clear_logger_job_id(self) -> None:
         """Clear the _job_logger until we receive another job"""
@@ -102,31 +362,17 @@ class InternalQueryService:
         headers: Dict[str, Any],
         body: Optional[Any] = None,
     ) -> Generator[http.client.HTTPResponse, Any, None]:
-        """Wrapper for using https connection for requests"""
-        response: Optional[http.client.HTTPResponse] = None
-        connection = http.client.HTTPSConnection(
-            host=self.host,
-            port=self.port,
-            context=self.context,
-            timeout=(60 * 5),  # 5 minutes
-        )
-        try:
-            connection.request(
-                method=method,
-                url=url,
-                body=body,
-                headers=headers,
-            )
-            response = connection.getresponse()
+        """Wrapper for sending requests over this worker's pool of keep-alive https connections"""
+        with self.connection_pool.request(method=method, url=url, headers=headers, body=body) as response:
             yield response
-        finally:
-            connection.close()
 
     def post_query_schemas(self) -> None:
         """Post the function schemas of the Compute Module"""
         body = json.dumps(self.function_schemas)
         self.logger.debug(f"Posting function schemas: {body}")
         for i in range(POST_SCHEMAS_MAX_ATTEMPTS):
+            if i > 0:
+                self.metrics.count(COUNTER_SCHEMA_POST_RETRIES)
             try:
                 with self.request(
                     method="POST",
@@ -146,33 +392,79 @@ class InternalQueryService:
         self.logger.error(f"Failed to POST /schemas after {POST_SCHEMAS_MAX_ATTEMPTS} attempts")
 
     def get_job_or_none(self) -> Any:
+        """Poll for a job once. Use `polling_scheduler.next_delay()` to find how long to wait before polling again"""
         try:
+            started = time.perf_counter()
             with self.request(method="GET", url=self.get_job_path, headers=self.get_job_headers) as response:
-                response_data = response.read().decode()
+                response_data = response.read()
+                polled = time.perf_counter()
+                self.metrics.observe(STAGE_POLL, None, polled - started)
                 result = None
                 if response.status == 200:
-                    result = json.loads(response_data)
+                    result = self.json_codec.loads(response_data)
+                    self.metrics.observe(STAGE_DECODE, _job_query_type(result), time.perf_counter() - polled)
+                    self.tracer.start_job(result, started, len(response_data))
+                    self.polling_scheduler.record_job()
                 elif response.status == 204:
-                    self.logger.info("No job found, retrying...")
+                    delay = self.polling_scheduler.record_empty_poll()
+                    self.logger.debug(f"No job found, retrying in {delay:.2f}s")
                 else:
                     self.logger.error(f"Unexpected response status: {response.status}")
-                self.connection_refused_count = 0
+                    self.polling_scheduler.record_failed_poll()
                 return result
         except ConnectionRefusedError:
-            self.logger.warning(f"Connection refused. Sleeping for {2 ** self.connection_refused_count}s")
-            time.sleep(2**self.connection_refused_count)
-            self.connection_refused_count += 1
+            delay = self.polling_scheduler.record_failed_poll()
+            self.logger.warning(f"Connection refused. Retrying in {delay:.2f}s")
             return None
         except Exception as e:
-            self.logger.error(f"Get job request failed, attempting to re-establish connection {str(e)}")
+            delay = self.polling_scheduler.record_failed_poll()
+            self.logger.error(f"Get job request failed, re-establishing connection in {delay:.2f}s: {str(e)}")
             self.logger.error(traceback.format_exc())
             return None
 
-    def report_job_result(self, job_id: str, result: Any) -> None:
-        body = json.dumps(result).encode("utf-8")
+    def _serialize_result(self, result: Any, query_type: Optional[str]) -> bytes:
+        with start_span("serialize_result") as span:
+            started = time.perf_counter()
+            encoder = self.result_encoders.get(query_type) if query_type is not None else None
+            if encoder is None or isinstance(result, _JobFailure):
+                body = self.json_codec.dumps(result)
+            else:
+                body = encoder(result)
+            self.metrics.observe(STAGE_ENCODE, query_type, time.perf_counter() - started)
+            span.set_attribute("result_bytes", len(body))
+        return body
+
+    def _encode_result(self, result: Any, query_type: Optional[str]) -> Tuple[Any, bytes]:
+        """Returns the result to report & its JSON. Results that cannot be serialized fail their job"""
+        if isinstance(result, _EncodedResult):
+            return result, result
+        try:
+            return result, self._serialize_result(result, query_type)
+        except Exception as e:
+            self.logger.error(f"Failed to serialize result of job: {str(e)}")
+            failure = self.get_failed_query(f"Failed to serialize result: {str(e)}: {traceback.format_exc()}")
+            return failure, self.json_codec.dumps(failure)
+
+    def _record_reported(self, result: Any, query_type: Optional[str], started: float) -> None:
+        self.metrics.observe(STAGE_REPORT, query_type, time.perf_counter() - started)
+        self.metrics.count(COUNTER_JOBS, query_type)
+        if isinstance(result, _JobFailure):
+            self.metrics.count(COUNTER_FAILED_JOBS, query_type)
+
+    def report_job_result(self, job_id: str, result: Any, query_type: Optional[str] = None) -> None:
+        with self.tracer.report(job_id):
+            result, body = self._encode_result(result, query_type)
+            with start_span("report_job_result"):
+                self._post_result(job_id, result, query_type, body)
+
+    def _post_result(self, job_id: str, result: Any, query_type: Optional[str], body: bytes) -> None:
         post_result_path = f"{self.post_result_path}/{job_id}"
         self.logger.debug(f"Posting result to {post_result_path}")
-        for _ in range(POST_RESULT_MAX_ATTEMPTS):
+        started = time.perf_counter()
+        for attempt in range(POST_RESULT_MAX_ATTEMPTS):
+            if attempt > 0:
+                self.metrics.count(COUNTER_RESULT_POST_RETRIES, query_type)
+                get_current_span().set_attribute("attempts", attempt + 1)
             try:
                 with self.request(
                     method="POST",
@@ -182,13 +474,14 @@ class InternalQueryService:
                 ) as response:
                     if response.status == 204:
                         self.logger.debug("Successfully reported job result")
+                        self._record_reported(result, query_type, started)
                         return
                     else:
                         self.logger.error(f"Failed to post result: {response.status} {response.reason}")
             except Exception as e:
                 self.logger.error(f"POST of job result failed, attempting to re-establish connection: {str(e)}")
                 self.logger.error(traceback.format_exc())
-        raise RuntimeError(f"Unable to post job result after {POST_RESULT_MAX_ATTEMPTS} attempts")
+        raise ResultPostError(f"Unable to post job result after {POST_RESULT_MAX_ATTEMPTS} attempts")
 
     def handle_query(self) -> None:
         job = None
@@ -198,8 +491,11 @@ class InternalQueryService:
             self.logger.warning(f"Exception occurred while fetching job: {str(e)}")
         if job:
             self.handle_job(job)
+        else:
+            time.sleep(self.polling_scheduler.next_delay())
 
-    def handle_job(self, job: Dict[str, Any]) -> None:
+    def _parse_job(self, job: Dict[str, Any]) -> Tuple[str, str, Any, Dict[str, Any]]:
+        """Extract the job ID, query type, raw query & dict query context from a job"""
         v1 = job.get("computeModuleJobV1", {})
         job_id = v1.get("jobId")
         query_type = v1.get("queryType")
@@ -212,19 +508,288 @@ class InternalQueryService:
             "authHeader": authHeader,
             **get_extra_context_parameters(),
         }
+        return job_id, query_type, query, query_context
+
+    def _job_timeout(self, query_type: str) -> Optional[float]:
+        """Seconds a job may run for: the function's own timeout, else JOB_TIMEOUT_SECONDS. None if unlimited"""
+        options = self.function_options.get(query_type)
+        timeout = options.timeout if options is not None and options.timeout is not None else self.default_job_timeout
+        return timeout if timeout > 0 else None
+
+    def _start_deadline(
+        self,
+        query_type: str,
+        query_context: Dict[str, Any],
+        received_at: Optional[float],
+    ) -> CancellationToken:
+        """Add the job's deadline & cancellation token to its context"""
+        timeout = self._job_timeout(query_type)
+        deadline = (received_at or time.time()) + timeout if timeout is not None else None
+        token = CancellationToken(deadline=deadline)
+        query_context["deadline"] = deadline
+        query_context["cancellationToken"] = token
+        return token
+
+    def get_timeout_failure(self, query_type: str) -> Dict[str, str]:
+        return self.get_failed_query(
+            f"Job exceeded its timeout of {self._job_timeout(query_type)}s", error_type=JOB_TIMEOUT_ERROR
+        )
+
+    @contextmanager
+    def _watch_deadline(self, job_ids: List[str], token: CancellationToken) -> Generator[None, Any, None]:
+        if self.deadline_watchdog is None:
+            yield
+            return
+        with self.deadline_watchdog.watch(job_ids, token):
+            yield
+
+    def execute_job(self, job: Dict[str, Any], received_at: Optional[float] = None) -> Tuple[str, Any]:
+        """Run the registered function for a job, returning the job ID & the result to report for it.
+        The job's deadline is computed from `received_at`, the time it was fetched, which defaults to now
+        """
+        job_id, query_type, query, query_context = self._parse_job(job)
+        token = self._start_deadline(query_type, query_context, received_at)
         self._update_logger_job_id(job_id=job_id)
         self.logger.debug(f"Received job; queryType: {query_type}")
         try:
+            if token.is_cancelled():
+                self.logger.warning("Job's deadline passed before it started, rejecting it")
+                return job_id, self.get_timeout_failure(query_type)
             self.logger.debug("Executing job")
-            result = self.get_result(query_type, query, query_context)
+            with self._watch_deadline([job_id], token), self.tracer.activate(job_id):
+                result = self.get_result(query_type, query, query_context)
             self.logger.debug("Successfully executed job")
         except Exception as e:
-            self.logger.error(f"Error executing job: {str(e)}")
-            result = self.get_failed_query(f"{str(e)}: {traceback.format_exc()}")
+            if token.is_cancelled():
+                self.logger.error(f"Job exceeded its timeout: {str(e)}")
+                result = self.get_timeout_failure(query_type)
+            else:
+                self.logger.error(f"Error executing job: {str(e)}")
+                result = self.get_failed_query(f"{str(e)}: {traceback.format_exc()}")
+        finally:
+            self._clear_logger_job_id()
+        return job_id, result
+
+    def batch_options(self, query_type: str) -> Optional[FunctionOptions]:
+        """The options of the function for `query_type`, if it is a batch function"""
+        options = self.function_options.get(query_type)
+        return options if options is not None and options.batch else None
+
+    def batch_limit(self, query_type: str) -> AdaptiveBatchLimit:
+        """How many jobs of the batch function for `query_type` to execute together"""
+        if query_type not in self.batch_limits:
+            timeout = self._job_timeout(query_type)
+            self.batch_limits[query_type] = AdaptiveBatchLimit(
+                max_batch_size=self.function_options[query_type].max_batch_size,
+                # Leave time to retry the jobs of a failed batch one at a time
+                latency_budget=timeout / 2 if timeout is not None else None,
+            )
+        return self.batch_limits[query_type]
+
+    def _prepare_batch(
+        self, jobs: List[Tuple[Dict[str, Any], float]]
+    ) -> Tuple[str, List[BatchItem], List[Tuple[str, Any]], CancellationToken]:
+        """Parse the jobs of a batch & convert their inputs. Returns the query type, the jobs to execute,
+        the results of jobs that failed before executing & the batch's cancellation token
+        """
+        items = []
+        results = []
+        query_type = ""
+        for job, received_at in jobs:
+            job_id, query_type, query, query_context = self._parse_job(job)
+            if self._start_deadline(query_type, query_context, received_at).is_cancelled():
+                self.logger.warning(f"Deadline of job {job_id} passed before it started, rejecting it")
+                results.append((job_id, self.get_timeout_failure(query_type)))
+            else:
+                items.append(BatchItem(job_id=job_id, query=query, query_context=query_context))
+        token = batch_deadline_token(items)
+        converted_items = []
+        for item in items:
+            try:
+                with self.tracer.activate(item.job_id):
+                    item.typed_context, item.typed_query = self._convert_inputs(
+                        query_type, item.query, item.query_context
+                    )
+                converted_items.append(item)
+            except Exception as e:
+                self.logger.error(f"Error converting inputs of job {item.job_id}: {str(e)}")
+                results.append((item.job_id, self.get_failed_query(f"{str(e)}: {traceback.format_exc()}")))
+        return query_type, converted_items, results, token
+
+    def _batch_results(self, items: List[BatchItem], outputs: Any) -> List[Tuple[str, Any]]:
+        """Match the outputs of a batch function to its jobs. An exception returned as an output fails its job"""
+        outputs = list(outputs)
+        if len(outputs) != len(items):
+            raise ValueError(f"Batch function returned {len(outputs)} results for {len(items)} jobs")
+        return [
+            (item.job_id, self.get_failed_query(str(output)) if isinstance(output, Exception) else output)
+            for item, output in zip(items, outputs)
+        ]
+
+    def _failed_batch_results(
+        self, query_type: str, items: List[BatchItem], token: CancellationToken, e: Exception
+    ) -> List[Tuple[str, Any]]:
+        if token.is_cancelled():
+            self.logger.error(f"Batch of {len(items)} jobs exceeded its timeout: {str(e)}")
+            return [(item.job_id, self.get_timeout_failure(query_type)) for item in items]
+        self.logger.error(f"Error executing job {items[0].job_id}: {str(e)}")
+        return [(items[0].job_id, self.get_failed_query(f"{str(e)}: {traceback.format_exc()}"))]
+
+    def _run_batch(self, query_type: str, items: List[BatchItem], token: CancellationToken) -> List[Tuple[str, Any]]:
+        """Call the batch function once for `items`. If it fails, the jobs are retried one at a time
+        so that only the jobs that fail on their own are reported as failed
+        """
+        start = time.perf_counter()
+        try:
+            with self._watch_deadline([item.job_id for item in items], token):
+                try:
+                    with self._profile(items[0].job_id, query_type):
+                        outputs = self.registered_functions[query_type](
+                            [item.typed_context for item in items], [item.typed_query for item in items]
+                        )
+                        if inspect.isawaitable(outputs):
+                            outputs = self._run_coroutine(outputs, token.remaining())
+                finally:
+                    self._record_batch_executed(query_type, items, start)
+                results = self._batch_results(items, outputs)
+        except Exception as e:
+            if token.is_cancelled() or len(items) == 1:
+                return self._failed_batch_results(query_type, items, token, e)
+            self.logger.warning(f"Batch of {len(items)} jobs failed, retrying them one at a time: {str(e)}")
+            return [result for item in items for result in self._run_batch(query_type, [item], token)]
+        self.batch_limit(query_type).record(len(items), time.perf_counter() - start)
+        return results
+
+    def _record_batch_executed(self, query_type: str, items: List[BatchItem], start: float) -> None:
+        end = time.perf_counter()
+        self.metrics.observe(STAGE_EXECUTE, query_type, end - start)
+        for item in items:
+            self.tracer.record(item.job_id, "handler", start, end, batch_size=len(items))
+
+    def execute_batch(self, jobs: List[Tuple[Dict[str, Any], float]]) -> List[Tuple[str, Any]]:
+        """Run a batch function for several of its jobs, fetched at the given times.
+        Returns the job ID & the result to report for each job
+        """
+        query_type, items, results, token = self._prepare_batch(jobs)
+        self.logger.debug(f"Executing batch of {len(items)} jobs; queryType: {query_type}")
+        if items:
+            results.extend(self._run_batch(query_type, items, token))
+        return results
+
+    def handle_job(self, job: Dict[str, Any]) -> None:
+        job_id, result = self.execute_job(job)
+        self._update_logger_job_id(job_id=job_id)
         self.logger.debug("Reporting result for job")
-        self.report_job_result(job_id, result)
+        self.report_job_result(job_id, result, _job_query_type(job))
         self._clear_logger_job_id()
 
+    def _convert_inputs(
+        self,
+        query_type: str,
+        query: Dict[str, Any],
+        query_context: Dict[str, Any],
+    ) -> Tuple[Any, Any]:
+        """Convert the raw query & context into the types expected by the registered function"""
+        started = time.perf_counter()
+        typed_query: Any = query
+        typed_context: Any = query_context
+        with start_span("convert_payload"):
+            if query_type in self.payload_converters:
+                self.logger.debug(f"Found schema conversion for query {query_type}. Converting to typed payload")
+                typed_query = self.payload_converters[query_type](query)
+            if self.is_function_context_typed[query_type]:
+                typed_context = QueryContext(**query_context)
+        self.metrics.observe(STAGE_CONVERT, query_type, time.perf_counter() - started)
+        return typed_context, typed_query
+
+    def _cache_lookup(
+        self, query_type: str, query: Any, query_context: Dict[str, Any]
+    ) -> Tuple[Optional[str], bool, Any]:
+        """Returns the cache key of a job (None if the results of its function are not cached),
+        whether a result is cached for it & the cached result
+        """
+        cache = self.result_caches.get(query_type)
+        if cache is None:
+            return None, False, None
+        key = cache.key(query_type, query, query_context)
+        hit, result = cache.get(key)
+        if hit:
+            self.logger.debug("Found cached result for job")
+            result = result if isinstance(result, _EncodedResult) else _EncodedResult(result)
+        return key, hit, result
+
+    def _cache_store(self, query_type: str, key: Optional[str], result: Any) -> None:
+        if key is not None:
+            self.result_caches[query_type].put(key, result)
+
+    def _join_flight(self, query_type: str, query: Any, query_context: Dict[str, Any]) -> Tuple[Optional[str], bool]:
+        """Returns the single-flight key of a job (None if its function does not coalesce jobs) & whether the job
+        must execute, which is False if an identical job is already executing & the job should wait for its result
+        """
+        flight = self.single_flights.get(query_type)
+        if flight is None:
+            return None, True
+        key = flight.key(query_type, query, query_context)
+        return key, flight.begin(key)
+
+    def _land_flight(self, query_type: str, key: Optional[str], result: Any) -> None:
+        if key is not None:
+            self.single_flights[query_type].finish(key, result)
+
+    def _abort_flight(self, query_type: str, key: Optional[str]) -> None:
+        if key is not None:
+            self.single_flights[query_type].fail(key)
+
+    def _share_result(self, query_type: str, result: Any) -> Any:
+        """Encode the result of a function that is cached or coalesced, to store & report the same bytes"""
+        if query_type in self.result_caches or query_type in self.single_flights:
+            return _EncodedResult(self._serialize_result(result, query_type))
+        return result
+
+    def _call_function(self, query_type: str, query: Dict[str, Any], query_context: Dict[str, Any]) -> Any:
+        typed_context, typed_query = self._convert_inputs(query_type, query, query_context)
+        started = time.perf_counter()
+        try:
+            with start_span("handler"), self._profile(query_context.get("jobId"), query_type):
+                result = self.registered_functions[query_type](typed_context, typed_query)
+                if inspect.isawaitable(result):
+                    token = query_context.get("cancellationToken")
+                    result = self._run_coroutine(result, token.remaining() if token is not None else None)
+        finally:
+            self.metrics.observe(STAGE_EXECUTE, query_type, time.perf_counter() - started)
+        return result
+
+    def _call_coalesced(self, query_type: str, query: Dict[str, Any], query_context: Dict[str, Any]) -> Any:
+        """Call the function of a job, or report the result of an identical job executing in any worker"""
+        key, leader = self._join_flight(query_type, query, query_context)
+        if key is not None and not leader:
+            token = query_context.get("cancellationToken")
+            found, result = self.single_flights[query_type].wait(key, token.remaining() if token is not None else None)
+            if found:
+                self.logger.debug("Reporting the result of an identical job")
+                return _EncodedResult(result)
+            self.logger.debug("Identical job did not produce a result in time, executing job")
+            key = None
+        try:
+            result = self._share_result(query_type, self._call_function(query_type, query, query_context))
+        except BaseException:
+            self._abort_flight(query_type, key)
+            raise
+        self._land_flight(query_type, key, result)
+        return result
+
+    def cache_stats(self) -> Dict[str, CacheStats]:
+        """Stats of the result caches of this worker process, by query type"""
+        return {query_type: cache.stats() for query_type, cache in self.result_caches.items()}
+
+    def _run_coroutine(self, coroutine: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run an `async def` function to completion on this worker's event loop, cancelling it after `timeout`"""
+        if self._event_loop is None or self._event_loop.is_closed():
+            self._event_loop = asyncio.new_event_loop()
+        if timeout is not None:
+            coroutine = asyncio.wait_for(coroutine, timeout)
+        return self._event_loop.run_until_complete(coroutine)
+
     def get_result(
         self,
         query_type: str,
@@ -233,33 +798,137 @@ class InternalQueryService:
     ) -> Any:
         registered_fn_keys = self.registered_functions.keys()
         if query_type in self.registered_functions:
-            typed_query = query
-            typed_context = query_context
-            if query_type in self.function_schema_conversions:
-                self.logger.debug(f"Found schema conversion for query {query_type}. Converting to typed payload")
-                typed_query = convert_payload(query, self.function_schema_conversions[query_type])
-            if self.is_function_context_typed[query_type]:
-                typed_context = QueryContext(**query_context)  # type: ignore[assignment]
-            return self.registered_functions[query_type](typed_context, typed_query)
+            key, hit, result = self._cache_lookup(query_type, query, query_context)
+            if hit:
+                return result
+            result = self._call_coalesced(query_type, query, query_context)
+            self._cache_store(query_type, key, result)
+            return result
         else:
             self.logger.error(f"Unknown query type: {query_type}. Known query runners: {registered_fn_keys}")
             return {"error": "Unknown query type"}
 
     @staticmethod
-    def get_failed_query(message: str) -> Dict[str, str]:
-        return {"exception": message}
+    def get_failed_query(message: str, error_type: Optional[str] = None) -> Dict[str, str]:
+        failed_query = _JobFailure(exception=message)
+        if error_type is not None:
+            failed_query["errorType"] = error_type
+        return failed_query
+
+    def _recycle_policy(self) -> RecyclePolicy:
+        return RecyclePolicy(max_jobs=self.worker_max_jobs, max_rss_bytes=self.worker_max_rss_mb * 1024 * 1024)
+
+    def _autoscaler(self) -> Optional[Autoscaler]:
+        """Autoscaling is enabled by setting MIN_CONCURRENT_TASKS lower than MAX_CONCURRENT_TASKS"""
+        if self.min_concurrency >= self.concurrency:
+            return None
+        return Autoscaler(
+            min_workers=self.min_concurrency,
+            max_workers=self.concurrency,
+            interval=self.autoscale_interval,
+            scale_up_utilization=self.scale_up_utilization,
+            scale_down_utilization=self.scale_down_utilization,
+            scale_up_delay=self.scale_up_delay,
+            scale_down_delay=self.scale_down_delay,
+        )
+
+    def _job_capacity(self) -> int:
+        """Number of jobs the Compute Module executes at once"""
+        return self.concurrency
+
+    def _function_quotas(self, mp_context: BaseContext) -> Optional[FunctionQuotas]:
+        if not any(has_quota(options) for options in self.function_options.values()):
+            return None
+        return FunctionQuotas(
+            mp_context,
+            self.function_options,
+            capacity=self._job_capacity(),
+            num_workers=self.concurrency,
+        )
+
+    def _metrics_exporter(self) -> MetricsExporter:
+        """Metrics are served when METRICS_PORT is set, and written to METRICS_FILE when it is set"""
+        port = os.environ.get("METRICS_PORT")
+        return MetricsExporter(
+            self.metrics,
+            port=int(port) if port else None,
+            host=os.environ.get("METRICS_HOST", DEFAULT_METRICS_HOST),
+            path=os.environ.get("METRICS_FILE") or None,
+            interval=float(os.environ.get("METRICS_DUMP_INTERVAL_SECONDS", DEFAULT_METRICS_DUMP_INTERVAL_SECONDS)),
+        )
+
+    def _mp_context(self) -> BaseContext:
+        """The multiprocessing context used to start worker processes, see WORKER_START_METHOD"""
+        mp_context = multiprocessing.get_context(self.worker_start_method)
+        if isinstance(mp_context, ForkServerContext):
+            configure_forkserver(mp_context, self.worker_preload_modules)
+        return mp_context
 
     def start(self) -> None:
+        mp_context = self._mp_context()
+        if mp_context.get_start_method() == "fork":
+            self.logger.info(f"Running {len(PRELOAD_HOOKS)} preload hook(s)")
+            run_preload_hooks()
+        self.metrics = JobMetrics(
+            list(self.registered_functions), mp_context, num_workers=self.concurrency, json_codec=self.json_codec.name
+        )
+        metrics_exporter = self._metrics_exporter()
+        metrics_exporter.start()
         self.post_query_schemas()
-        self.logger.info(f"Starting to poll for jobs with concurrency {self.concurrency}")
-        processes = [multiprocessing.Process(target=self.poll_forever, args=(i,)) for i in range(self.concurrency)]
-        for p in processes:
-            p.start()
-        for p in processes:
-            p.join()
-
-    def poll_forever(self, process_id: int) -> None:
+        autoscaler = self._autoscaler()
+        if autoscaler:
+            self.logger.info(
+                f"Starting to poll for jobs with concurrency scaling between {self.min_concurrency} & {self.concurrency}"
+            )
+        else:
+            self.logger.info(f"Starting to poll for jobs with concurrency {self.concurrency}")
+        self.function_quotas = self._function_quotas(mp_context)
+        self.supervisor = WorkerSupervisor(
+            target=self.poll_forever,
+            num_workers=self.concurrency,
+            restart_base_delay=float(
+                os.environ.get("WORKER_RESTART_BASE_DELAY_SECONDS", DEFAULT_RESTART_BASE_DELAY_SECONDS)
+            ),
+            restart_max_delay=float(
+                os.environ.get("WORKER_RESTART_MAX_DELAY_SECONDS", DEFAULT_RESTART_MAX_DELAY_SECONDS)
+            ),
+            autoscaler=autoscaler,
+            mp_context=mp_context,
+            stop_timeout=float(os.environ.get("WORKER_STOP_TIMEOUT_SECONDS", DEFAULT_STOP_TIMEOUT_SECONDS)),
+            quotas=self.function_quotas,
+        )
+        try:
+            self.supervisor.run()
+        finally:
+            metrics_exporter.stop()
+            if self.owns_result_cache_dir:
+                shutil.rmtree(self.result_cache_dir, ignore_errors=True)
+
+    def poll_forever(self, process_id: int, activity: Optional[WorkerActivity] = None) -> Optional[str]:
+        """Poll for & execute jobs until the worker needs to be recycled or drained.
+        Returns the reason for recycling, if that is why it stopped
+        """
         self._set_logger_process_id(process_id=process_id)
-        while True:
-            self.logger.info("Polling for new jobs...")
-            self.handle_query()
+        self.polling_scheduler.activity = activity
+        if self.function_quotas is not None:
+            self.function_quotas.bind(process_id)
+        self.metrics.bind(process_id)
+        self.tracer.bind(process_id)
+        self.logger.debug(f"Running {len(WORKER_START_HOOKS)} worker start hook(s)")
+        run_worker_start_hooks(self._run_coroutine)
+        try:
+            worker = PipelinedWorker(
+                service=self,
+                prefetch_depth=self.prefetch_depth,
+                recycle_policy=self._recycle_policy(),
+                activity=activity,
+                # The worker's event loop may be stuck running the timed out job, so run async hooks on a fresh one
+                before_abort=lambda: run_worker_stop_hooks(asyncio.run),
+            )
+            self.deadline_watchdog = DeadlineWatchdog(
+                on_hard_timeout=worker.abort_timed_out_jobs, grace=self.job_timeout_grace
+            )
+            return worker.run()
+        finally:
+            run_worker_stop_hooks(self._run_coroutine)
+            self.tracer.shutdown()
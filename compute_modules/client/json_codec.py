@@ -0,0 +1,113 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import importlib
+import json
+from types import ModuleType
+from typing import Any, Callable, Dict, Optional
+
+from compute_modules.function_registry.function_result_encoder import encode_result, to_json_compatible
+
+DEFAULT_JSON_CODEC = "auto"
+
+
+class JsonCodec:
+    """Decodes job payloads from & encodes results to JSON bytes. Results are encoded like `encode_result` does"""
+
+    name = "stdlib"
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def dumps(self, value: Any) -> bytes:
+        return encode_result(value)
+
+
+class OrjsonCodec(JsonCodec):
+    """Decodes & encodes with orjson, without an intermediate str.
+    Unlike the standard library, NaN & infinite floats are encoded as null
+    """
+
+    name = "orjson"
+
+    def __init__(self, orjson: ModuleType) -> None:
+        self._loads: Callable[[bytes], Any] = orjson.loads
+        self._dumps: Callable[..., bytes] = orjson.dumps
+        self._encode_error = orjson.JSONEncodeError
+        # orjson would encode datetimes & dataclasses itself, differently from the type table of the README
+        self._option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+    def loads(self, data: bytes) -> Any:
+        return self._loads(data)
+
+    def dumps(self, value: Any) -> bytes:
+        try:
+            return self._dumps(value, default=to_json_compatible, option=self._option)
+        except self._encode_error:
+            # e.g. integers that do not fit in 64 bits
+            return encode_result(value)
+
+
+class MsgspecCodec(JsonCodec):
+    """Decodes with msgspec, without an intermediate str. msgspec cannot be made to encode datetimes & bytes like the
+    type table of the README, so results are encoded like `JsonCodec` does
+    """
+
+    name = "msgspec"
+
+    def __init__(self, msgspec: ModuleType) -> None:
+        self._loads: Callable[[bytes], Any] = msgspec.json.Decoder().decode
+
+    def loads(self, data: bytes) -> Any:
+        return self._loads(data)
+
+
+JSON_CODECS: Dict[str, Callable[[ModuleType], JsonCodec]] = {
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+}
+
+
+def _import_optional(name: str) -> Optional[ModuleType]:
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def create_json_codec(name: str = DEFAULT_JSON_CODEC) -> JsonCodec:
+    """The JSON codec `name`: "orjson", "msgspec" or "stdlib".
+    "auto" picks the first of orjson & msgspec that is installed, else the standard library's json module
+    """
+    if name == "stdlib":
+        return JsonCodec()
+    if name == "auto":
+        for codec_name, codec_class in JSON_CODECS.items():
+            module = _import_optional(codec_name)
+            if module is not None:
+                return codec_class(module)
+        return JsonCodec()
+    if name not in JSON_CODECS:
+        raise ValueError(f"Unknown JSON codec {name}, must be one of: {['auto', 'stdlib', *JSON_CODECS]}")
+    module = _import_optional(name)
+    if module is None:
+        raise ValueError(f"JSON codec {name} is not installed")
+    return JSON_CODECS[name](module)
+
+
+__all__ = [
+    "JsonCodec",
+    "create_json_codec",
+]
@@ -0,0 +1,289 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import os
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.context import BaseContext
+from typing import Any, Dict, List, Optional
+
+from compute_modules.logging.internal import get_internal_logger
+
+# Stages of a job, timed separately
+STAGE_POLL = 0
+STAGE_DECODE = 1
+STAGE_CONVERT = 2
+STAGE_EXECUTE = 3
+STAGE_ENCODE = 4
+STAGE_REPORT = 5
+STAGES = ("poll", "decode", "convert", "execute", "encode", "report")
+
+COUNTER_JOBS = 0
+COUNTER_FAILED_JOBS = 1
+COUNTER_RESULT_POST_RETRIES = 2
+COUNTER_SCHEMA_POST_RETRIES = 3
+COUNTERS = ("jobs", "failed_jobs", "result_post_retries", "schema_post_retries")
+
+# Upper bounds (in seconds) of the buckets of the stage duration histograms, followed by an unbounded bucket
+BUCKET_BOUNDS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+_SUM = len(BUCKET_BOUNDS) + 1
+_HISTOGRAM_WIDTH = _SUM + 1
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_DUMP_INTERVAL_SECONDS = 60.0
+METRIC_NAME_PREFIX = "compute_module"
+
+
+def _label_value(value: str) -> str:
+    """Escapes a label value of the Prometheus text exposition format"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@dataclass
+class HistogramSnapshot:
+    """Durations of a stage, summed across all worker processes"""
+
+    buckets: List[int]
+    """Number of durations in each bucket: up to each of `BUCKET_BOUNDS`, then above the last one"""
+
+    count: int
+
+    sum: float
+    """Sum of the durations, in seconds"""
+
+
+class JobMetrics:
+    """Counters & fixed-bucket histograms of stage durations, by query type.
+
+    Without `mp_context` the metrics are only kept in this process. With it they are kept in shared memory,
+    in one row per worker process plus one for the process that created them (the supervisor), so the supervisor
+    can export the metrics of all workers. A worker process calls `bind` with its process ID first.
+    Rows are not reset when a worker is replaced, so counters only ever increase.
+    Stages & counters that do not belong to a job of a known function are recorded under the query type "".
+    The name of the JSON codec that decodes jobs & encodes results, timed as the decode & encode stages, is exported
+    as an info metric.
+    """
+
+    def __init__(
+        self,
+        query_types: List[str],
+        mp_context: Optional[BaseContext] = None,
+        num_workers: int = 0,
+        json_codec: str = "stdlib",
+    ) -> None:
+        self.query_types = ["", *query_types]
+        self.json_codec = json_codec
+        self.num_workers = num_workers
+        self._index = {query_type: i for i, query_type in enumerate(self.query_types)}
+        self._counters_offset = len(self.query_types) * len(STAGES) * _HISTOGRAM_WIDTH
+        self._row_size = self._counters_offset + len(self.query_types) * len(COUNTERS)
+        size = (num_workers + 1) * self._row_size
+        self._values: Any = mp_context.RawArray("d", size) if mp_context is not None else [0.0] * size
+        self._row = num_workers * self._row_size
+        # Several threads of a worker record metrics
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def bind(self, process_id: int) -> None:
+        """Record the metrics of this process in the row of the worker process `process_id`"""
+        if not 0 <= process_id < self.num_workers:
+            raise ValueError(f"process_id must be between 0 & {self.num_workers - 1}, got {process_id}")
+        self._row = process_id * self._row_size
+        # The lock may have been held by another thread of the parent when this process was forked
+        self._lock = threading.Lock()
+
+    def observe(self, stage: int, query_type: Optional[str], seconds: float) -> None:
+        """Record that `stage` of a job of `query_type` took `seconds`"""
+        offset = self._row + (self._index.get(query_type or "", 0) * len(STAGES) + stage) * _HISTOGRAM_WIDTH
+        bucket = bisect_left(BUCKET_BOUNDS, seconds)
+        with self._lock:
+            self._values[offset + bucket] += 1
+            self._values[offset + _SUM] += seconds
+
+    def count(self, counter: int, query_type: Optional[str] = None, increment: int = 1) -> None:
+        offset = self._row + self._counters_offset + self._index.get(query_type or "", 0) * len(COUNTERS)
+        with self._lock:
+            self._values[offset + counter] += increment
+
+    def _rows(self) -> range:
+        return range(0, len(self._values), self._row_size)
+
+    def histogram(self, stage: int, query_type: str = "") -> HistogramSnapshot:
+        offset = (self._index[query_type] * len(STAGES) + stage) * _HISTOGRAM_WIDTH
+        buckets = [
+            int(sum(self._values[row + offset + bucket] for row in self._rows()))
+            for bucket in range(len(BUCKET_BOUNDS) + 1)
+        ]
+        return HistogramSnapshot(
+            buckets=buckets,
+            count=sum(buckets),
+            sum=sum(self._values[row + offset + _SUM] for row in self._rows()),
+        )
+
+    def counter(self, counter: int, query_type: str = "") -> int:
+        offset = self._counters_offset + self._index[query_type] * len(COUNTERS) + counter
+        return int(sum(self._values[row + offset] for row in self._rows()))
+
+    def render_prometheus(self) -> str:
+        """The metrics of all processes in the Prometheus text exposition format"""
+        lines = []
+        for counter, name in enumerate(COUNTERS):
+            metric = f"{METRIC_NAME_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for query_type in self.query_types:
+                value = self.counter(counter, query_type)
+                if value:
+                    lines.append(f'{metric}{{query_type="{_label_value(query_type)}"}} {value}')
+        metric = f"{METRIC_NAME_PREFIX}_json_codec_info"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f'{metric}{{codec="{_label_value(self.json_codec)}"}} 1')
+        metric = f"{METRIC_NAME_PREFIX}_stage_duration_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for query_type in self.query_types:
+            for stage, stage_name in enumerate(STAGES):
+                histogram = self.histogram(stage, query_type)
+                if not histogram.count:
+                    continue
+                labels = f'query_type="{_label_value(query_type)}",stage="{stage_name}"'
+                cumulative = 0
+                for bound, count in zip([*map(str, BUCKET_BOUNDS), "+Inf"], histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, metrics: JobMetrics) -> None:
+        super().__init__((host, port), _MetricsRequestHandler)
+        self.metrics = metrics
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    server: _MetricsServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsExporter:
+    """Exposes `JobMetrics` from the supervisor process: served at `/metrics` on `port` if set,
+    and written to `path` every `interval` seconds & when stopped if set
+    """
+
+    def __init__(
+        self,
+        metrics: JobMetrics,
+        port: Optional[int] = None,
+        host: str = DEFAULT_METRICS_HOST,
+        path: Optional[str] = None,
+        interval: float = DEFAULT_METRICS_DUMP_INTERVAL_SECONDS,
+    ) -> None:
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.path = path
+        self.interval = interval
+        self.logger = get_internal_logger()
+        self._server: Optional[_MetricsServer] = None
+        self._stopping = threading.Event()
+        self._dumper: Optional[threading.Thread] = None
+
+    def dump(self) -> None:
+        """Write the metrics to `path`, replacing the previous dump atomically"""
+        assert self.path is not None
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                f.write(self.metrics.render_prometheus())
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Failed to write metrics to {self.path}: {str(e)}")
+
+    def _dump_forever(self) -> None:
+        while not self._stopping.wait(self.interval):
+            self.dump()
+
+    def start(self) -> None:
+        if self.port is not None:
+            self._server = _MetricsServer(self.host, self.port, self.metrics)
+            threading.Thread(target=self._server.serve_forever, name="compute-module-metrics", daemon=True).start()
+            self.logger.info(f"Serving metrics at http://{self.host}:{self._server.server_address[1]}/metrics")
+        if self.path is not None:
+            self._dumper = threading.Thread(target=self._dump_forever, name="compute-module-metrics-dump", daemon=True)
+            self._dumper.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._dumper is not None:
+            self._dumper.join()
+            self._dumper = None
+            self.dump()
+
+
+__all__ = [
+    "HistogramSnapshot",
+    "JobMetrics",
+    "MetricsExporter",
+]
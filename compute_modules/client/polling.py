@@ -0,0 +1,198 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from compute_modules.client.autoscaler import WorkerActivity
+
+DEFAULT_IDLE_BASE_DELAY_SECONDS = 0.05
+DEFAULT_IDLE_MAX_DELAY_SECONDS = 1.0
+DEFAULT_RECONNECT_BASE_DELAY_SECONDS = 1.0
+DEFAULT_RECONNECT_MAX_DELAY_SECONDS = 60.0
+
+
+@dataclass
+class PollingStats:
+    """Snapshot of how a worker has been polling for jobs"""
+
+    jobs_received: int
+    """Number of polls that returned a job"""
+
+    empty_polls: int
+    """Number of polls that found no job"""
+
+    failed_polls: int
+    """Number of polls that failed, e.g. because the connection was refused"""
+
+    idle_seconds: float
+    """Total time spent idle, i.e. between the first empty poll & the next job received"""
+
+    idle_poll_rate: float
+    """Empty polls per second of idle time"""
+
+    last_time_to_first_job: Optional[float]
+    """Seconds between the start of the most recent idle period & the job that ended it"""
+
+    mean_time_to_first_job: Optional[float]
+    """Mean of `last_time_to_first_job` across all idle periods so far"""
+
+    @classmethod
+    def from_counters(
+        cls,
+        jobs_received: int,
+        empty_polls: int,
+        failed_polls: int,
+        completed_idle_seconds: float,
+        idle_periods: int,
+        idle_since: Optional[float],
+        last_time_to_first_job: Optional[float],
+        now: float,
+    ) -> "PollingStats":
+        """Stats as of `now`, from the counters kept by `PollingScheduler` (or published in `WorkerActivity`)"""
+        idle_seconds = completed_idle_seconds + (now - idle_since if idle_since is not None else 0.0)
+        return cls(
+            jobs_received=jobs_received,
+            empty_polls=empty_polls,
+            failed_polls=failed_polls,
+            idle_seconds=idle_seconds,
+            idle_poll_rate=empty_polls / idle_seconds if idle_seconds > 0 else 0.0,
+            last_time_to_first_job=last_time_to_first_job,
+            mean_time_to_first_job=completed_idle_seconds / idle_periods if idle_periods else None,
+        )
+
+
+def _decorrelated_jitter(previous: float, base: float, cap: float, rng: random.Random) -> float:
+    """Exponential backoff with "decorrelated jitter", so workers that went idle together do not poll in lockstep.
+
+    See: https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    """
+    return min(cap, rng.uniform(base, max(base, previous * 3)))
+
+
+class PollingScheduler:
+    """Decides how long a worker should wait before polling for the next job.
+
+    Polls are immediate while jobs are being received. Once polls come back empty the delay backs off
+    from `idle_base_delay` up to `idle_max_delay`, and drops back to zero as soon as a job is received.
+    Failed polls (e.g. connection refused) back off separately up to `reconnect_max_delay`.
+    """
+
+    def __init__(
+        self,
+        idle_base_delay: float = DEFAULT_IDLE_BASE_DELAY_SECONDS,
+        idle_max_delay: float = DEFAULT_IDLE_MAX_DELAY_SECONDS,
+        reconnect_base_delay: float = DEFAULT_RECONNECT_BASE_DELAY_SECONDS,
+        reconnect_max_delay: float = DEFAULT_RECONNECT_MAX_DELAY_SECONDS,
+        rng: Optional[random.Random] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.idle_base_delay = idle_base_delay
+        self.idle_max_delay = idle_max_delay
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self._rng = rng or random.Random()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next_delay = 0.0
+        self._idle_delay = 0.0
+        self._reconnect_delay = 0.0
+        self._idle_since: Optional[float] = None
+        self._jobs_received = 0
+        self._empty_polls = 0
+        self._failed_polls = 0
+        self._idle_seconds = 0.0
+        self._idle_periods = 0
+        self._last_time_to_first_job: Optional[float] = None
+        self.activity: Optional["WorkerActivity"] = None
+        """Shared with the supervisor so it can tell how often polls find a job & report the polling stats"""
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def next_delay(self) -> float:
+        """Seconds to wait before the next poll, based on the outcome of the previous poll"""
+        return self._next_delay
+
+    def record_job(self) -> None:
+        """A poll returned a job: go back to polling immediately"""
+        with self._lock:
+            self._jobs_received += 1
+            self._next_delay = self._idle_delay = self._reconnect_delay = 0.0
+            time_to_first_job = None
+            if self._idle_since is not None:
+                time_to_first_job = self._clock() - self._idle_since
+                self._idle_seconds += time_to_first_job
+                self._idle_periods += 1
+                self._last_time_to_first_job = time_to_first_job
+                self._idle_since = None
+            if self.activity is not None:
+                self.activity.record_job(time_to_first_job)
+
+    def record_empty_poll(self) -> float:
+        """A poll found no job. Returns the delay before the next poll"""
+        with self._lock:
+            self._empty_polls += 1
+            self._reconnect_delay = 0.0
+            if self._idle_since is None:
+                self._idle_since = self._clock()
+            if self.activity is not None:
+                self.activity.record_empty_poll(self._idle_since)
+            self._idle_delay = _decorrelated_jitter(
+                self._idle_delay, self.idle_base_delay, self.idle_max_delay, self._rng
+            )
+            self._next_delay = self._idle_delay
+            return self._next_delay
+
+    def record_failed_poll(self) -> float:
+        """A poll failed, e.g. because the connection was refused. Returns the delay before the next poll"""
+        with self._lock:
+            self._failed_polls += 1
+            if self.activity is not None:
+                self.activity.record_failed_poll()
+            self._reconnect_delay = _decorrelated_jitter(
+                self._reconnect_delay, self.reconnect_base_delay, self.reconnect_max_delay, self._rng
+            )
+            self._next_delay = self._reconnect_delay
+            return self._next_delay
+
+    def stats(self) -> PollingStats:
+        with self._lock:
+            return PollingStats.from_counters(
+                jobs_received=self._jobs_received,
+                empty_polls=self._empty_polls,
+                failed_polls=self._failed_polls,
+                completed_idle_seconds=self._idle_seconds,
+                idle_periods=self._idle_periods,
+                idle_since=self._idle_since,
+                last_time_to_first_job=self._last_time_to_first_job,
+                now=self._clock(),
+            )
+
+
+__all__ = [
+    "PollingScheduler",
+    "PollingStats",
+]
@@ -0,0 +1,202 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from types import FrameType
+from typing import Any, Dict, Generator, Optional
+
+from compute_modules.logging.internal import get_internal_logger
+
+DEFAULT_PROFILE_MAX_FILES = 100
+DEFAULT_PROFILE_SAMPLE_INTERVAL_SECONDS = 0.01
+PSTATS_SUFFIX = ".pstats"
+COLLAPSED_SUFFIX = ".collapsed"
+
+
+def _file_name_part(value: Optional[str]) -> str:
+    return re.sub(r"[^\w.-]", "_", value or "unknown")
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    """A stack in the collapsed format read by flame graph tools: frames from the outermost, separated by ;"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class _StackSampler:
+    """Samples the stacks of the threads it watches every `interval` seconds, from a background thread.
+    The thread only wakes up while at least one thread is watched
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._watched: Dict[int, "Counter[str]"] = {}
+        self._watching = threading.Event()
+        # Held while sampling, so the samples of a thread are complete once it is no longer watched
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def watch(self, thread_id: int) -> "Counter[str]":
+        """Start sampling the stacks of a thread, counting how often each stack is seen"""
+        # A sampler thread started before forking does not run in the forked process
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._sample_forever, name="compute-module-profiler", daemon=True)
+            self._thread.start()
+        samples: "Counter[str]" = Counter()
+        with self._lock:
+            self._watched[thread_id] = samples
+            self._watching.set()
+        return samples
+
+    def unwatch(self, thread_id: int) -> None:
+        with self._lock:
+            self._watched.pop(thread_id, None)
+            if not self._watched:
+                self._watching.clear()
+
+    def _sample_forever(self) -> None:
+        while self._watching.wait():
+            time.sleep(self.interval)
+            with self._lock:
+                frames = sys._current_frames()
+                for thread_id, samples in self._watched.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_collapse(frame)] += 1
+
+
+class JobProfiler:
+    """Writes profiles of the functions of jobs to `directory`:
+
+    * a `sample_rate` fraction of jobs is profiled with cProfile, written as a pstats file.
+    * the stacks of all other jobs are sampled every `sample_interval` seconds when `slow_job_seconds` is set.
+      This costs little enough to run for every job, & the stacks of the jobs that take at least `slow_job_seconds`
+      are written in the collapsed stack format, counting how often each stack was seen.
+
+    Files are named after the time they were written, the process ID, query type & job ID. Only the `max_files`
+    most recent profiles are kept, shared by all worker processes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float = 0.0,
+        slow_job_seconds: Optional[float] = None,
+        max_files: int = DEFAULT_PROFILE_MAX_FILES,
+        sample_interval: float = DEFAULT_PROFILE_SAMPLE_INTERVAL_SECONDS,
+    ) -> None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f"sample_rate must be between 0 & 1, got {sample_rate}")
+        if max_files < 1:
+            raise ValueError(f"max_files must be >= 1, got {max_files}")
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_job_seconds = slow_job_seconds
+        self.max_files = max_files
+        self.sample_interval = sample_interval
+        self._sampler = _StackSampler(sample_interval)
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_sampler"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._sampler = _StackSampler(self.sample_interval)
+
+    def _path(self, job_id: Optional[str], query_type: Optional[str], suffix: str) -> str:
+        name = f"{time.time_ns()}-{os.getpid()}-{_file_name_part(query_type)}-{_file_name_part(job_id)}{suffix}"
+        return os.path.join(self.directory, name)
+
+    def _prune(self) -> None:
+        """Remove the oldest profiles beyond `max_files`. File names start with the time they were written at"""
+        profiles = sorted(
+            name for name in os.listdir(self.directory) if name.endswith((PSTATS_SUFFIX, COLLAPSED_SUFFIX))
+        )
+        for name in profiles[: -self.max_files]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                # Already removed by another worker process
+                pass
+
+    def _write(self, path: str, write: Any) -> None:
+        temp_path = f"{path}.tmp"
+        try:
+            write(temp_path)
+            os.replace(temp_path, path)
+            self._prune()
+        except OSError as e:
+            get_internal_logger().warning(f"Failed to write profile {path}: {str(e)}")
+
+    def _write_collapsed(self, path: str, samples: "Counter[str]") -> None:
+        def write(temp_path: str) -> None:
+            with open(temp_path, "w") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+        self._write(path, write)
+
+    @contextmanager
+    def profile(self, job_id: Optional[str], query_type: Optional[str]) -> Generator[None, Any, None]:
+        """Profile the function of a job, run by the current thread while the context manager is entered"""
+        if self.sample_rate and random.random() < self.sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active, e.g. for a job running in another thread
+                yield
+                return
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self._write(self._path(job_id, query_type, PSTATS_SUFFIX), profiler.dump_stats)
+            return
+        if self.slow_job_seconds is None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        samples = self._sampler.watch(thread_id)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sampler.unwatch(thread_id)
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.slow_job_seconds and samples:
+                get_internal_logger().info(f"Job took {elapsed:.2f}s, writing its sampled stacks")
+                self._write_collapsed(self._path(job_id, query_type, COLLAPSED_SUFFIX), samples)
+
+
+__all__ = [
+    "JobProfiler",
+]
@@ -0,0 +1,145 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from dataclasses import dataclass
+from multiprocessing.context import BaseContext
+from typing import Any, Dict, List, Optional
+
+from compute_modules.function_registry.types import FunctionOptions
+
+# How often a job deferred because its function has no free slot checks whether it can start
+QUOTA_RETRY_INTERVAL_SECONDS = 0.01
+
+
+@dataclass
+class SlotUsage:
+    """Snapshot of the slots used by the jobs of a function across all worker processes"""
+
+    executing: int
+    """Number of jobs of the function being executed"""
+
+    deferred: int
+    """Number of jobs of the function that were received but are waiting for a free slot"""
+
+    max_concurrency: Optional[int]
+    """Maximum number of jobs of the function executed at once, None if unlimited"""
+
+    weight: float
+    """Share of the Compute Module's capacity occupied by each job of the function"""
+
+
+def has_quota(options: FunctionOptions) -> bool:
+    return options.max_concurrency is not None or options.weight != 1
+
+
+class FunctionQuotas:
+    """Slots of the functions of a Compute Module, shared by all of its worker processes in shared memory.
+
+    Every executing job occupies the `weight` of its function out of `capacity`, the number of jobs the Compute
+    Module executes at once. A job of a function with a quota (`max_concurrency` or a `weight` other than 1) only
+    starts while fewer than `max_concurrency` jobs of the function are executing & `weight` is free, or when no
+    other job is executing at all. Jobs of other functions always start, so a flood of jobs of a slow function
+    cannot starve them.
+
+    Counters are kept per worker process, so the supervisor can release the slots of a worker that exited
+    in the middle of a job with `release_worker`. A worker process calls `bind` with its process ID first.
+    """
+
+    def __init__(
+        self,
+        mp_context: BaseContext,
+        function_options: Dict[str, FunctionOptions],
+        capacity: int,
+        num_workers: int,
+    ) -> None:
+        self.capacity = capacity
+        self.num_workers = num_workers
+        self._index = {query_type: i for i, query_type in enumerate(function_options)}
+        self._max_concurrency: List[Optional[int]] = [options.max_concurrency for options in function_options.values()]
+        self._weights = [options.weight for options in function_options.values()]
+        self._has_quota = [has_quota(options) for options in function_options.values()]
+        self._executing = mp_context.RawArray("i", num_workers * len(function_options))
+        self._deferred = mp_context.RawArray("i", num_workers * len(function_options))
+        self._lock = mp_context.Lock()
+        self._worker = 0
+
+    def bind(self, process_id: int) -> None:
+        """Attribute the slots acquired from now on to the worker process `process_id`"""
+        if not 0 <= process_id < self.num_workers:
+            raise ValueError(f"process_id must be between 0 & {self.num_workers - 1}, got {process_id}")
+        self._worker = process_id
+
+    def _total(self, counters: Any, function: int) -> int:
+        functions = len(self._index)
+        return sum(counters[worker * functions + function] for worker in range(self.num_workers))
+
+    def _used_capacity(self) -> float:
+        return sum(self._total(self._executing, i) * weight for i, weight in enumerate(self._weights))
+
+    def try_acquire(self, query_type: str) -> bool:
+        """Take a slot for a job of `query_type` if it can start now. Returns whether it was taken"""
+        function = self._index.get(query_type)
+        if function is None:
+            return True
+        with self._lock:
+            if self._has_quota[function]:
+                max_concurrency = self._max_concurrency[function]
+                if max_concurrency is not None and self._total(self._executing, function) >= max_concurrency:
+                    return False
+                used = self._used_capacity()
+                if used > 0 and used + self._weights[function] > self.capacity:
+                    return False
+            self._executing[self._worker * len(self._index) + function] += 1
+        return True
+
+    def release(self, query_type: str) -> None:
+        """Free the slot taken by a job of `query_type` once it has executed"""
+        function = self._index.get(query_type)
+        if function is not None:
+            with self._lock:
+                self._executing[self._worker * len(self._index) + function] -= 1
+
+    def record_deferred(self, query_type: str, change: int) -> None:
+        """Count jobs of `query_type` that started (`change` > 0) or stopped (`change` < 0) waiting for a slot"""
+        function = self._index.get(query_type)
+        if function is not None:
+            with self._lock:
+                self._deferred[self._worker * len(self._index) + function] += change
+
+    def release_worker(self, process_id: int) -> None:
+        """Free the slots of a worker process that exited, including those of jobs it was executing"""
+        functions = len(self._index)
+        with self._lock:
+            for i in range(process_id * functions, (process_id + 1) * functions):
+                self._executing[i] = self._deferred[i] = 0
+
+    def usage(self) -> Dict[str, SlotUsage]:
+        """How many slots the jobs of each function use, by query type"""
+        with self._lock:
+            return {
+                query_type: SlotUsage(
+                    executing=self._total(self._executing, i),
+                    deferred=self._total(self._deferred, i),
+                    max_concurrency=self._max_concurrency[i],
+                    weight=self._weights[i],
+                )
+                for query_type, i in self._index.items()
+            }
+
+
+__all__ = [
+    "FunctionQuotas",
+    "SlotUsage",
+]
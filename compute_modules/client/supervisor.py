@@ -0,0 +1,384 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing.context import BaseContext
+from types import FrameType
+from typing import Any, Callable, Dict, List, Optional
+
+from compute_modules.client.autoscaler import ActivitySnapshot, Autoscaler, LoadSignals, WorkerActivity
+from compute_modules.client.polling import PollingStats
+from compute_modules.client.quotas import FunctionQuotas, SlotUsage
+from compute_modules.client.system_stats import get_cpu_load, get_memory_available_fraction, get_rss_bytes
+from compute_modules.lifecycle.hooks import run_preload_hooks
+from compute_modules.logging.internal import get_internal_logger
+
+RECYCLE_MAX_JOBS = "max_jobs"
+RECYCLE_MAX_RSS = "max_rss"
+RECYCLE_TIMEOUT = "timeout"
+# Exit codes used by worker processes to tell the supervisor why they exited on purpose
+RECYCLE_EXIT_CODES = {
+    RECYCLE_MAX_JOBS: 3,
+    RECYCLE_MAX_RSS: 4,
+    RECYCLE_TIMEOUT: 5,
+}
+EXIT_CODE_RECYCLE_REASONS = {code: reason for reason, code in RECYCLE_EXIT_CODES.items()}
+
+DEFAULT_RESTART_BASE_DELAY_SECONDS = 1.0
+DEFAULT_RESTART_MAX_DELAY_SECONDS = 60.0
+# A worker that stays up for this long is considered healthy again, resetting its restart backoff
+HEALTHY_UPTIME_SECONDS = 60.0
+# Spread max_jobs by up to this fraction so that workers started together are not all recycled at the same time
+MAX_JOBS_JITTER = 0.1
+MONITOR_INTERVAL_SECONDS = 1.0
+# How often the polling stats of each worker are logged
+POLLING_STATS_LOG_INTERVAL_SECONDS = 60.0
+# How long workers are given to exit after being asked to terminate before they are killed
+DEFAULT_STOP_TIMEOUT_SECONDS = 30.0
+# Set by the supervisor so that worker processes which import the main module again know not to start another one
+SUPERVISOR_PID_ENV = "COMPUTE_MODULES_SUPERVISOR_PID"
+
+
+class RecyclePolicy:
+    """Decides when a worker process should exit so the supervisor can replace it with a fresh one"""
+
+    def __init__(self, max_jobs: int = 0, max_rss_bytes: int = 0, rng: Optional[random.Random] = None) -> None:
+        rng = rng or random.Random()
+        self.max_jobs = max_jobs + int(rng.uniform(0, max_jobs * MAX_JOBS_JITTER)) if max_jobs > 0 else 0
+        self.max_rss_bytes = max_rss_bytes
+
+    def recycle_reason(self, jobs_executed: int) -> Optional[str]:
+        """Returns the reason the worker should be recycled after executing `jobs_executed` jobs, if any"""
+        if self.max_jobs and jobs_executed >= self.max_jobs:
+            return RECYCLE_MAX_JOBS
+        if self.max_rss_bytes:
+            rss = get_rss_bytes()
+            if rss is not None and rss > self.max_rss_bytes:
+                return RECYCLE_MAX_RSS
+        return None
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    return f"{seconds:.3f}s" if seconds is not None else "n/a"
+
+
+WorkerTarget = Callable[[int, Optional[WorkerActivity]], Optional[str]]
+
+
+def _exit_on_signal(signum: int, frame: Optional[FrameType]) -> None:
+    # Raising SystemExit (rather than being killed) lets the worker stop hooks run
+    sys.exit(128 + signum)
+
+
+def run_worker_process(poll_forever: WorkerTarget, process_id: int, activity: Optional[WorkerActivity]) -> None:
+    """Entrypoint of a worker process. Translates the reason the worker stopped polling into its exit code"""
+    # Do not inherit the supervisor's signal handlers when forked
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    signal.signal(signal.SIGINT, _exit_on_signal)
+    # No-op when forked from a process that already ran them
+    run_preload_hooks()
+    recycle_reason = poll_forever(process_id, activity)
+    sys.exit(RECYCLE_EXIT_CODES[recycle_reason] if recycle_reason else 0)
+
+
+@dataclass
+class SupervisorStats:
+    """Counters describing the lifecycle of the worker processes"""
+
+    restarts: int = 0
+    """Number of worker processes that were started to replace one that exited"""
+
+    crashes: int = 0
+    """Number of worker processes that exited unexpectedly"""
+
+    recycles: Dict[str, int] = field(default_factory=dict)
+    """Number of worker processes that exited to be recycled, by reason"""
+
+    scale_ups: int = 0
+    """Number of worker processes started by the autoscaler"""
+
+    scale_downs: int = 0
+    """Number of worker processes drained & stopped by the autoscaler"""
+
+
+@dataclass
+class _WorkerSlot:
+    process_id: int
+    activity: WorkerActivity
+    process: Optional[multiprocessing.process.BaseProcess] = None
+    started_at: float = 0.0
+    consecutive_crashes: int = 0
+    restart_at: Optional[float] = None
+    active: bool = False
+    """Whether this slot should have a running worker, i.e. it has been started & is not being drained"""
+    last_activity: ActivitySnapshot = field(default_factory=ActivitySnapshot)
+
+
+class WorkerSupervisor:
+    """Keeps `num_workers` worker processes running.
+
+    Workers that crash are restarted with exponential backoff, and workers that exit to be recycled
+    (see `RecyclePolicy`) are replaced immediately.
+
+    With an `autoscaler`, between `autoscaler.min_workers` & `autoscaler.max_workers` workers run instead.
+    Workers that are scaled down are asked to drain, finishing their in-flight jobs before exiting.
+
+    Once stopped, workers are asked to terminate & killed if they have not exited within `stop_timeout` seconds.
+
+    With `quotas`, the function slots held by a worker are released when it exits.
+    """
+
+    def __init__(
+        self,
+        target: WorkerTarget,
+        num_workers: int,
+        mp_context: Optional[BaseContext] = None,
+        restart_base_delay: float = DEFAULT_RESTART_BASE_DELAY_SECONDS,
+        restart_max_delay: float = DEFAULT_RESTART_MAX_DELAY_SECONDS,
+        autoscaler: Optional[Autoscaler] = None,
+        stop_timeout: float = DEFAULT_STOP_TIMEOUT_SECONDS,
+        quotas: Optional[FunctionQuotas] = None,
+    ) -> None:
+        self.target = target
+        self.quotas = quotas
+        self.autoscaler = autoscaler
+        self.num_workers = autoscaler.max_workers if autoscaler else num_workers
+        self.mp_context = mp_context or multiprocessing.get_context()
+        self.restart_base_delay = restart_base_delay
+        self.restart_max_delay = restart_max_delay
+        self.stop_timeout = stop_timeout
+        self.stats = SupervisorStats()
+        self.logger = get_internal_logger()
+        self._slots: List[_WorkerSlot] = [
+            _WorkerSlot(process_id=i, activity=WorkerActivity(self.mp_context)) for i in range(self.num_workers)
+        ]
+        self._stopping = False
+        self._kill_at: Optional[float] = None
+        self._last_autoscale = time.monotonic()
+        self._last_polling_stats_log = time.monotonic()
+
+    @property
+    def active_workers(self) -> int:
+        """Number of workers that are running or due to be restarted, excluding those being drained"""
+        return sum(slot.active for slot in self._slots)
+
+    def _start_worker(self, slot: _WorkerSlot) -> None:
+        slot.activity.reset()
+        slot.last_activity = ActivitySnapshot()
+        process = self.mp_context.Process(  # type: ignore[attr-defined]
+            target=run_worker_process,
+            args=(self.target, slot.process_id, slot.activity),
+        )
+        process.start()
+        slot.process = process
+        slot.started_at = time.monotonic()
+        slot.restart_at = None
+        slot.active = True
+
+    def _restart_delay(self, slot: _WorkerSlot) -> float:
+        return float(min(self.restart_max_delay, self.restart_base_delay * 2 ** (slot.consecutive_crashes - 1)))
+
+    def _handle_exit(self, slot: _WorkerSlot) -> None:
+        assert slot.process is not None
+        exit_code = slot.process.exitcode
+        slot.process.close()
+        slot.process = None
+        if self.quotas is not None:
+            self.quotas.release_worker(slot.process_id)
+        now = time.monotonic()
+        if self._stopping:
+            return
+        if not slot.active:
+            self.logger.info(f"Worker {slot.process_id} drained & exited with code {exit_code}")
+            return
+        recycle_reason = EXIT_CODE_RECYCLE_REASONS.get(exit_code)  # type: ignore[arg-type]
+        if recycle_reason:
+            self.stats.recycles[recycle_reason] = self.stats.recycles.get(recycle_reason, 0) + 1
+            self.logger.info(f"Worker {slot.process_id} exited to be recycled ({recycle_reason}), replacing it")
+            slot.consecutive_crashes = 0
+            slot.restart_at = now
+            return
+        self.stats.crashes += 1
+        if now - slot.started_at >= HEALTHY_UPTIME_SECONDS:
+            slot.consecutive_crashes = 0
+        slot.consecutive_crashes += 1
+        delay = self._restart_delay(slot)
+        self.logger.error(f"Worker {slot.process_id} exited unexpectedly with code {exit_code}, restarting in {delay}s")
+        slot.restart_at = now + delay
+
+    def _restart_due_workers(self) -> None:
+        now = time.monotonic()
+        for slot in self._slots:
+            if slot.active and slot.process is None and slot.restart_at is not None and slot.restart_at <= now:
+                self.stats.restarts += 1
+                self._start_worker(slot)
+
+    def _wait_timeout(self) -> float:
+        due_times = [slot.restart_at for slot in self._slots if slot.restart_at is not None]
+        if self.autoscaler is not None:
+            due_times.append(self._last_autoscale + self.autoscaler.interval)
+        if self._kill_at is not None:
+            due_times.append(self._kill_at)
+        if not due_times:
+            return MONITOR_INTERVAL_SECONDS
+        return max(0.0, min(MONITOR_INTERVAL_SECONDS, min(due_times) - time.monotonic()))
+
+    def _load_signals(self, elapsed: float) -> LoadSignals:
+        """Aggregate the activity of the active workers since the last time this was called"""
+        jobs_received = empty_polls = busy_seconds = 0.0
+        active_slots = [slot for slot in self._slots if slot.active]
+        for slot in active_slots:
+            snapshot = slot.activity.snapshot()
+            jobs_received += snapshot.jobs_received - slot.last_activity.jobs_received
+            empty_polls += snapshot.empty_polls - slot.last_activity.empty_polls
+            busy_seconds += snapshot.busy_seconds - slot.last_activity.busy_seconds
+            slot.last_activity = snapshot
+        polls = jobs_received + empty_polls
+        return LoadSignals(
+            utilization=busy_seconds / (elapsed * len(active_slots)) if active_slots and elapsed > 0 else 0.0,
+            empty_poll_ratio=empty_polls / polls if polls else None,
+            cpu_load=get_cpu_load(),
+            memory_available=get_memory_available_fraction(),
+        )
+
+    def _scale_up(self) -> None:
+        for slot in self._slots:
+            # Slots that are still draining keep their process until it exits
+            if not slot.active and slot.process is None:
+                self.stats.scale_ups += 1
+                self._start_worker(slot)
+                return
+
+    def _scale_down(self) -> None:
+        for slot in reversed(self._slots):
+            if slot.active:
+                slot.active = False
+                slot.restart_at = None
+                self.stats.scale_downs += 1
+                if slot.process is not None:
+                    slot.activity.request_drain()
+                return
+
+    def _autoscale(self) -> None:
+        if self.autoscaler is None:
+            return
+        now = time.monotonic()
+        if now - self._last_autoscale < self.autoscaler.interval:
+            return
+        signals = self._load_signals(now - self._last_autoscale)
+        self._last_autoscale = now
+        current_workers = self.active_workers
+        desired_workers = self.autoscaler.desired_workers(current_workers, signals)
+        if desired_workers == current_workers:
+            return
+        self.logger.info(f"Scaling from {current_workers} to {desired_workers} workers: {signals}")
+        if desired_workers > current_workers:
+            self._scale_up()
+        else:
+            self._scale_down()
+
+    def polling_stats(self) -> Dict[int, PollingStats]:
+        """How each running worker has been polling for jobs since it was started, by process ID"""
+        return {slot.process_id: slot.activity.polling_stats() for slot in self._slots if slot.process is not None}
+
+    def slot_usage(self) -> Dict[str, SlotUsage]:
+        """How many slots the jobs of each function use across all workers, by query type"""
+        return self.quotas.usage() if self.quotas is not None else {}
+
+    def _log_polling_stats(self) -> None:
+        now = time.monotonic()
+        if now - self._last_polling_stats_log < POLLING_STATS_LOG_INTERVAL_SECONDS:
+            return
+        self._last_polling_stats_log = now
+        for process_id, stats in self.polling_stats().items():
+            self.logger.info(
+                f"Worker {process_id} polling stats: {stats.jobs_received} jobs, {stats.empty_polls} empty polls "
+                f"({stats.idle_poll_rate:.2f}/s while idle), {stats.failed_polls} failed polls, "
+                f"time to first job {_format_seconds(stats.last_time_to_first_job)} "
+                f"(mean {_format_seconds(stats.mean_time_to_first_job)})"
+            )
+        for query_type, usage in self.slot_usage().items():
+            if usage.executing or usage.deferred:
+                self.logger.info(
+                    f"Function {query_type} slots: {usage.executing}/{usage.max_concurrency or 'unlimited'} executing "
+                    f"with weight {usage.weight}, {usage.deferred} deferred"
+                )
+
+    def _on_signal(self, signum: int, frame: Optional[FrameType]) -> None:
+        self.logger.info(f"Received signal {signum}, stopping worker processes")
+        self.stop()
+
+    def stop(self) -> None:
+        """Stop restarting workers & ask the running ones to terminate, killing them after `stop_timeout`"""
+        self._stopping = True
+        if self._kill_at is None:
+            self._kill_at = time.monotonic() + self.stop_timeout
+        for slot in self._slots:
+            if slot.process is not None and slot.process.is_alive():
+                slot.process.terminate()
+
+    def _kill_remaining_workers(self) -> None:
+        if self._kill_at is None or time.monotonic() < self._kill_at:
+            return
+        for slot in self._slots:
+            if slot.process is not None and slot.process.is_alive():
+                self.logger.warning(f"Worker {slot.process_id} did not exit within {self.stop_timeout}s, killing it")
+                slot.process.kill()
+
+    def monitor_once(self) -> None:
+        """Wait for a worker to exit or a restart to become due, then handle it"""
+        sentinels: Dict[Any, _WorkerSlot] = {slot.process.sentinel: slot for slot in self._slots if slot.process}
+        ready = multiprocessing.connection.wait(list(sentinels), timeout=self._wait_timeout()) if sentinels else []
+        for sentinel in ready:
+            slot = sentinels[sentinel]
+            assert slot.process is not None
+            slot.process.join()
+            self._handle_exit(slot)
+        if not sentinels:
+            time.sleep(self._wait_timeout())
+        if self._stopping:
+            self._kill_remaining_workers()
+        else:
+            self._restart_due_workers()
+            self._autoscale()
+            self._log_polling_stats()
+
+    def run(self) -> None:
+        """Start the worker processes & supervise them until `stop` is called (or SIGTERM/SIGINT is received)"""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._on_signal)
+            signal.signal(signal.SIGINT, self._on_signal)
+        os.environ[SUPERVISOR_PID_ENV] = str(os.getpid())
+        initial_workers = self.autoscaler.min_workers if self.autoscaler else self.num_workers
+        for slot in self._slots[:initial_workers]:
+            self._start_worker(slot)
+        self._last_autoscale = time.monotonic()
+        while not self._stopping or any(slot.process is not None for slot in self._slots):
+            self.monitor_once()
+
+
+__all__ = [
+    "RecyclePolicy",
+    "SupervisorStats",
+    "WorkerSupervisor",
+]
@@ -0,0 +1,107 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import os
+import resource
+import sys
+from typing import Dict, List, Optional
+
+
+def get_rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Current resident set size of a process (defaults to the current process), or None if it cannot be read.
+
+    Falls back to the peak RSS of the current process on platforms without /proc.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if pid is not None and pid != os.getpid():
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS & kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def get_cpu_load() -> Optional[float]:
+    """1-minute load average of the host divided by its number of CPUs, or None if it cannot be read"""
+    try:
+        load_average = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+    return load_average / (os.cpu_count() or 1)
+
+
+def get_memory_available_fraction() -> Optional[float]:
+    """Fraction of the host's memory that is available to new processes, or None if it cannot be read"""
+    meminfo = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                meminfo[key] = int(value.split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    if not meminfo.get("MemTotal") or "MemAvailable" not in meminfo:
+        return None
+    return meminfo["MemAvailable"] / meminfo["MemTotal"]
+
+
+def get_unique_memory_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Memory only mapped by a process (its "USS"), i.e. excluding pages shared with its parent or siblings.
+    None if it cannot be read
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/smaps_rollup") as f:
+            return sum(
+                int(line.split()[1]) * 1024 for line in f if line.startswith(("Private_Clean:", "Private_Dirty:"))
+            )
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_cpu_seconds(pid: Optional[int] = None) -> Optional[float]:
+    """CPU time (user + system) a process has used so far, or None if it cannot be read"""
+    try:
+        with open(f"/proc/{pid or 'self'}/stat") as f:
+            # The process name is in parentheses & may contain spaces, so split the fields after it
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_descendant_pids(pid: int) -> List[int]:
+    """The running descendants of a process (its children, their children, etc.). Empty if /proc cannot be read"""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return []
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    descendants: List[int] = []
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            descendants.append(child)
+            pending.append(child)
+    return descendants
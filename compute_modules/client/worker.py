@@ -0,0 +1,354 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from compute_modules.client.autoscaler import WorkerActivity
+from compute_modules.client.connection_pool import ResultPostError
+from compute_modules.client.deadlines import JOB_TIMEOUT_ERROR
+from compute_modules.client.quotas import QUOTA_RETRY_INTERVAL_SECONDS
+from compute_modules.client.supervisor import RECYCLE_EXIT_CODES, RECYCLE_TIMEOUT, RecyclePolicy
+from compute_modules.logging.common import TASK_JOB_ID
+
+if TYPE_CHECKING:
+    from compute_modules.client.internal_query_client import InternalQueryService
+
+DEFAULT_PREFETCH_DEPTH = 1
+RESULT_QUEUE_SIZE = 16
+# How often the execute stage wakes up to check whether the worker has been asked to stop
+STOP_CHECK_INTERVAL_SECONDS = 1.0
+
+
+class _PendingJob(NamedTuple):
+    job: Dict[str, Any]
+    received_at: float
+    """Time the job was fetched, from which its deadline is computed"""
+    holds_slot: bool
+    """Whether the job was fetched by the fetch stage, holding one of the worker's job slots until it has executed"""
+
+
+def _job_field(job: Dict[str, Any], field: str) -> Any:
+    return job.get("computeModuleJobV1", {}).get(field)
+
+
+class PipelinedWorker:
+    """Runs the fetch, execute & report stages of a worker process concurrently.
+
+    * fetch: a background thread keeps up to `prefetch_depth` jobs buffered while the current job executes.
+      With a `prefetch_depth` of 0 jobs are only fetched once the previous job has finished executing,
+      which avoids holding on to jobs that other workers could pick up when functions are long-running.
+    * execute: the calling thread runs the registered function for each job. Jobs of batch functions are
+      executed together with the other jobs of the same function that are already buffered or pending,
+      which are fetched directly until the batch is full, a poll finds no job or `max_wait_ms` has passed.
+    * report: a background thread drains results & POSTs them, so the next job can start executing immediately.
+
+    Jobs of functions with a quota (see `FunctionQuotas`) that cannot start are deferred: the worker keeps executing
+    other jobs & starts them, oldest first, once their function has a free slot. Deferred jobs do not hold one of
+    the worker's job slots, but once `prefetch_depth + 1` jobs are deferred the worker stops taking new jobs
+    until one of them starts.
+
+    `before_abort` is called just before the process exits because a job timed out, as the `finally` blocks
+    of the thread stuck executing the job never run.
+    """
+
+    def __init__(
+        self,
+        service: "InternalQueryService",
+        prefetch_depth: int = DEFAULT_PREFETCH_DEPTH,
+        recycle_policy: Optional[RecyclePolicy] = None,
+        activity: Optional[WorkerActivity] = None,
+        before_abort: Optional[Callable[[], None]] = None,
+    ) -> None:
+        if prefetch_depth < 0:
+            raise ValueError(f"prefetch_depth must be >= 0, got {prefetch_depth}")
+        self.service = service
+        self.logger = service.logger
+        self.prefetch_depth = prefetch_depth
+        self.recycle_policy = recycle_policy or RecyclePolicy()
+        self.activity = activity
+        self.before_abort = before_abort
+        self.jobs_executed = 0
+        self.recycle_reason: Optional[str] = None
+        # Jobs are buffered with the time they were received, from which their deadline is computed
+        self._jobs: "queue.Queue[Tuple[Dict[str, Any], float]]" = queue.Queue()
+        # Jobs of other functions fetched while collecting a batch, executed before any other job
+        self._deferred: Deque[_PendingJob] = deque()
+        self.quotas = service.function_quotas
+        # Jobs whose function had no free slot, waiting for one
+        self._waiting: Deque[_PendingJob] = deque()
+        self.max_waiting_jobs = prefetch_depth + 1
+        # Results to report, with the query type of their job
+        self._results: "queue.Queue[Optional[Tuple[str, Any, Optional[str]]]]" = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+        # Bounds the number of jobs held by this worker (buffered + executing) to prefetch_depth + 1
+        self._job_slots = threading.Semaphore(prefetch_depth + 1)
+        self._stopping = threading.Event()
+        self._fetcher: Optional[threading.Thread] = None
+        self._reporter: Optional[threading.Thread] = None
+
+    def stop(self) -> None:
+        """Stop fetching new jobs. `run` returns once buffered jobs have executed & all results are reported"""
+        self._stopping.set()
+
+    def _fetch_job(self) -> Optional[Dict[str, Any]]:
+        job = None
+        try:
+            self.logger.debug("Polling for new jobs...")
+            job = self.service.get_job_or_none()
+        except Exception as e:
+            self.logger.warning(f"Exception occurred while fetching job: {str(e)}")
+        return job or None
+
+    def _wait_before_next_poll(self) -> None:
+        """Back off after an empty or failed poll, waking up early if the worker is stopped"""
+        self._stopping.wait(self.service.polling_scheduler.next_delay())
+
+    def _too_many_waiting_jobs(self) -> bool:
+        """Stop taking new jobs for a while once too many jobs are deferred, until one of them starts"""
+        if len(self._waiting) < self.max_waiting_jobs:
+            return False
+        self._stopping.wait(QUOTA_RETRY_INTERVAL_SECONDS)
+        return True
+
+    def _fetch_forever(self) -> None:
+        TASK_JOB_ID.set("")
+        while not self._stopping.is_set():
+            self._job_slots.acquire()
+            if self._too_many_waiting_jobs():
+                self._job_slots.release()
+                continue
+            job = None if self._stopping.is_set() else self._fetch_job()
+            if job:
+                self._jobs.put((job, time.time()))
+            else:
+                self._job_slots.release()
+                self._wait_before_next_poll()
+
+    def _report_forever(self) -> None:
+        while True:
+            item = self._results.get()
+            if item is None:
+                return
+            job_id, result, query_type = item
+            token = TASK_JOB_ID.set(job_id)
+            try:
+                self.service.report_job_result(job_id, result, query_type)
+            except ResultPostError as e:
+                self.logger.error(f"Dropping result of job after failing to report it: {str(e)}")
+            except Exception as e:
+                self.logger.error(f"Failed to report result of job, reporting it as failed: {str(e)}")
+                self.logger.error(traceback.format_exc())
+                self._report_failure(
+                    job_id, query_type, self.service.get_failed_query(f"{str(e)}: {traceback.format_exc()}")
+                )
+            finally:
+                TASK_JOB_ID.reset(token)
+
+    def _report_failure(self, job_id: str, query_type: Optional[str], failure: Dict[str, str]) -> None:
+        """Report a job as failed when its result could not be reported"""
+        try:
+            self.service.report_job_result(job_id, failure, query_type)
+        except Exception as e:
+            self.logger.error(f"Dropping result of job after failing to report it: {str(e)}")
+
+    def _next_job(self) -> Optional[_PendingJob]:
+        if self._deferred:
+            return self._deferred.popleft()
+        if self._fetcher is None:
+            if self._too_many_waiting_jobs():
+                return None
+            job = self._fetch_job()
+            if not job:
+                self._wait_before_next_poll()
+                return None
+            return _PendingJob(job, time.time(), holds_slot=False)
+        try:
+            timeout = QUOTA_RETRY_INTERVAL_SECONDS if self._waiting else STOP_CHECK_INTERVAL_SECONDS
+            return _PendingJob(*self._jobs.get(timeout=timeout), holds_slot=True)
+        except queue.Empty:
+            return None
+
+    def _next_pending_job_now(self) -> Optional[_PendingJob]:
+        """A buffered job, or else a job fetched directly. None if no job is pending"""
+        try:
+            return _PendingJob(*self._jobs.get_nowait(), holds_slot=True)
+        except queue.Empty:
+            pass
+        job = self._fetch_job()
+        return _PendingJob(job, time.time(), holds_slot=False) if job else None
+
+    def _collect_batch(
+        self, first: _PendingJob, query_type: str, max_batch_size: int, max_wait_ms: float
+    ) -> List[_PendingJob]:
+        batch = [first]
+        collect_until = time.monotonic() + max_wait_ms / 1000
+        while len(batch) < max_batch_size and time.monotonic() < collect_until and not self._stopping.is_set():
+            pending = self._next_pending_job_now()
+            if pending is None:
+                break
+            if _job_field(pending.job, "queryType") == query_type:
+                batch.append(pending)
+            else:
+                self._deferred.append(pending)
+        return batch
+
+    def _execute(self, pending: _PendingJob) -> None:
+        query_type = _job_field(pending.job, "queryType")
+        options = self.service.batch_options(query_type)
+        if options is None:
+            self._execute_single(pending)
+            return
+        max_batch_size = self.service.batch_limit(query_type).limit
+        self._execute_jobs(self._collect_batch(pending, query_type, max_batch_size, options.max_wait_ms))
+
+    def _execute_single(self, pending: _PendingJob) -> None:
+        """Execute a job if its function has a free slot, or else defer it"""
+        if self.quotas is None:
+            self._execute_jobs([pending])
+            return
+        query_type = _job_field(pending.job, "queryType")
+        if not self.quotas.try_acquire(query_type):
+            self.logger.debug(f"No free slot for a job of {query_type}, deferring it")
+            if pending.holds_slot:
+                self._job_slots.release()
+            self._waiting.append(pending._replace(holds_slot=False))
+            self.quotas.record_deferred(query_type, 1)
+            return
+        try:
+            self._execute_jobs([pending])
+        finally:
+            self.quotas.release(query_type)
+
+    def _start_waiting_jobs(self) -> None:
+        """Execute the deferred jobs whose function now has a free slot, oldest first"""
+        if self.quotas is None:
+            return
+        for pending in list(self._waiting):
+            query_type = _job_field(pending.job, "queryType")
+            if not self.quotas.try_acquire(query_type):
+                continue
+            self._waiting.remove(pending)
+            self.quotas.record_deferred(query_type, -1)
+            try:
+                self._execute_jobs([pending])
+            finally:
+                self.quotas.release(query_type)
+
+    def _execute_jobs(self, pending_jobs: List[_PendingJob]) -> None:
+        started_at = self.activity.start_executing() if self.activity is not None else 0.0
+        try:
+            if len(pending_jobs) == 1:
+                results = [self.service.execute_job(pending_jobs[0].job, pending_jobs[0].received_at)]
+            else:
+                results = self.service.execute_batch([(pending.job, pending.received_at) for pending in pending_jobs])
+        finally:
+            for pending in pending_jobs:
+                if pending.holds_slot:
+                    self._job_slots.release()
+            if self.activity is not None:
+                self.activity.finish_executing(started_at)
+        # The jobs of a batch are all of the same function
+        query_type = _job_field(pending_jobs[0].job, "queryType")
+        for job_id, result in results:
+            self._results.put((job_id, result, query_type))
+        self.jobs_executed += len(pending_jobs)
+        if self.recycle_reason is None:
+            self.recycle_reason = self.recycle_policy.recycle_reason(self.jobs_executed)
+            if self.recycle_reason:
+                self.logger.info(f"Recycling worker after {self.jobs_executed} jobs ({self.recycle_reason})")
+                self.stop()
+
+    def _start_threads(self) -> None:
+        self._reporter = threading.Thread(target=self._report_forever, name="compute-module-reporter", daemon=True)
+        self._reporter.start()
+        if self.prefetch_depth > 0:
+            self._fetcher = threading.Thread(target=self._fetch_forever, name="compute-module-fetcher", daemon=True)
+            self._fetcher.start()
+
+    def _stop_fetching(self) -> None:
+        self.stop()
+        if self._fetcher is not None:
+            # Release a slot in case the fetcher is waiting for one, so it notices the worker is stopping
+            self._job_slots.release()
+            self._fetcher.join()
+
+    def _drain(self) -> None:
+        """Execute any jobs that were already fetched, then wait for all results to be reported"""
+        self._stop_fetching()
+        while self._deferred or self._waiting or not self._jobs.empty():
+            self._start_waiting_jobs()
+            if self._deferred:
+                self._execute_single(self._deferred.popleft())
+            elif not self._jobs.empty():
+                self._execute_single(_PendingJob(*self._jobs.get_nowait(), holds_slot=True))
+            elif self._waiting:
+                time.sleep(QUOTA_RETRY_INTERVAL_SECONDS)
+        self._results.put(None)
+        if self._reporter is not None:
+            self._reporter.join()
+
+    def abort_timed_out_jobs(self, job_ids: List[str]) -> None:
+        """Called by the `DeadlineWatchdog` when the executing job (or batch) is still running after its timeout.
+
+        Reports the jobs as timed out, fails the jobs buffered behind them & waits for all results to be reported,
+        then runs `before_abort` & exits the process so that the supervisor replaces this worker
+        """
+        self.logger.error("Job exceeded its timeout, replacing worker")
+        self._stop_fetching()
+        for job_id in job_ids:
+            failure = self.service.get_failed_query("Job exceeded its timeout & was stopped", JOB_TIMEOUT_ERROR)
+            self._results.put((job_id, failure, None))
+        buffered_jobs = [pending.job for pending in self._deferred] + [pending.job for pending in self._waiting]
+        while not self._jobs.empty():
+            buffered_jobs.append(self._jobs.get_nowait()[0])
+        for buffered_job in buffered_jobs:
+            self._results.put(
+                (
+                    _job_field(buffered_job, "jobId"),
+                    self.service.get_failed_query(f"Job was not run as job {job_ids[0]} timed out"),
+                    _job_field(buffered_job, "queryType"),
+                )
+            )
+        self._results.put(None)
+        if self._reporter is not None:
+            self._reporter.join()
+        if self.before_abort is not None:
+            try:
+                self.before_abort()
+            except Exception as e:
+                self.logger.error(f"Failed to clean up before replacing worker: {str(e)}")
+        os._exit(RECYCLE_EXIT_CODES[RECYCLE_TIMEOUT])
+
+    def run(self) -> Optional[str]:
+        """Fetch, execute & report jobs until `stop` is called.
+        Returns the reason the worker should be recycled, if that is why it stopped
+        """
+        self._start_threads()
+        while not self._stopping.is_set():
+            if self.activity is not None and self.activity.drain_requested():
+                self.logger.info("Draining worker")
+                self.stop()
+                break
+            self._start_waiting_jobs()
+            pending = self._next_job()
+            if pending:
+                self._execute(pending)
+        self._drain()
+        return self.recycle_reason
@@ -13,10 +13,13 @@
 #  limitations under the License.
 
 
+from .cancellation import CancellationToken, JobTimeoutError
 from .context import get_extra_context_parameters
 from .types import QueryContext
 
 __all__ = [
+    "CancellationToken",
     "get_extra_context_parameters",
+    "JobTimeoutError",
     "QueryContext",
 ]
@@ -0,0 +1,63 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import threading
+import time
+from typing import Optional
+
+
+class JobTimeoutError(Exception):
+    """Raised when a job runs past its deadline"""
+
+
+class CancellationToken:
+    """Signals that a job has run past its deadline, so the function can stop early.
+
+    Long-running functions should check `is_cancelled()` (or call `raise_if_cancelled()`) periodically.
+    Functions that are still running a grace period after the deadline are stopped by replacing their worker process.
+    """
+
+    def __init__(self, deadline: Optional[float] = None) -> None:
+        self.deadline = deadline
+        """Unix timestamp after which the job is cancelled, if it has a timeout"""
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        if not self._cancelled.is_set() and self.deadline is not None and time.time() >= self.deadline:
+            self._cancelled.set()
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline (negative once it has passed), or None if the job has no timeout"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def raise_if_cancelled(self) -> None:
+        if self.is_cancelled():
+            raise JobTimeoutError("Job was cancelled after exceeding its timeout")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleep for up to `timeout` seconds, waking up early once the job is cancelled. Returns whether it is"""
+        return self._cancelled.wait(timeout)
+
+
+__all__ = [
+    "CancellationToken",
+    "JobTimeoutError",
+]
@@ -16,11 +16,12 @@
 from typing import Any, Dict
 
 from ..auth import retrieve_third_party_id_and_creds
+from ..lifecycle.hooks import get_worker_resources
 from ..sources import get_sources
 
 
 def get_extra_context_parameters() -> Dict[str, Any]:
-    context_parameters = {"sources": get_sources()}
+    context_parameters = {"sources": get_sources(), "workerResources": get_worker_resources()}
     CLIENT_ID, CLIENT_SECRET = retrieve_third_party_id_and_creds()
 
     if CLIENT_ID and CLIENT_SECRET:
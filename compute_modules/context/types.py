@@ -16,6 +16,8 @@
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
 
+from .cancellation import CancellationToken
+
 
 @dataclass
 class QueryContext:
@@ -46,3 +48,14 @@ class QueryContext:
 
     sources: Optional[Dict[str, Any]] = None
     """dict containing the metadata of any sources configured for this compute module."""
+
+    workerResources: Optional[Dict[str, Any]] = None
+    """dict containing the values returned by the `@on_worker_start` hooks of this worker process, keyed by hook name.
+    Use this to reuse clients such as HTTP sessions or DB pools across jobs.
+    """
+
+    deadline: Optional[float] = None
+    """Unix timestamp by which the job must complete, if the function has a timeout"""
+
+    cancellationToken: Optional[CancellationToken] = None
+    """Becomes cancelled once the deadline has passed. Check it periodically to stop long-running jobs early."""
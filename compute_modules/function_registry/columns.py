@@ -0,0 +1,98 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import operator
+import typing
+
+from .function_payload_converter import PayloadConverter, compile_payload_converter
+from .types import PythonClassNode
+
+RowT = typing.TypeVar("RowT")
+# Getter of a field of a raw row & converter of the values of that field for all rows
+_ColumnConverter = typing.Tuple[typing.Callable[[typing.Any], typing.Any], PayloadConverter]
+
+
+class Columns(typing.Sequence[RowT]):
+    """A `List[RowT]` input decoded column by column: `Columns[MyDataclass]` has the schema of `List[MyDataclass]`,
+    but holds one list per field of `MyDataclass` instead of one object per row.
+
+    Columns are read with `column(name)` or `columns`. Indexing or iterating builds row objects on access only.
+    """
+
+    def __init__(
+        self,
+        row_type: typing.Callable[..., RowT],
+        columns: typing.Dict[str, typing.List[typing.Any]],
+        length: int,
+    ) -> None:
+        self.row_type = row_type
+        self.columns = columns
+        self._length = length
+
+    def column(self, name: str) -> typing.List[typing.Any]:
+        """The values of a field for all rows"""
+        return self.columns[name]
+
+    def __len__(self) -> int:
+        return self._length
+
+    @typing.overload
+    def __getitem__(self, index: int) -> RowT: ...
+
+    @typing.overload
+    def __getitem__(self, index: slice) -> "Columns[RowT]": ...
+
+    def __getitem__(self, index: typing.Union[int, slice]) -> typing.Union[RowT, "Columns[RowT]"]:
+        if isinstance(index, slice):
+            columns = {name: column[index] for name, column in self.columns.items()}
+            return Columns(self.row_type, columns, len(range(self._length)[index]))
+        row = range(self._length)[index]
+        return self.row_type(**{name: column[row] for name, column in self.columns.items()})
+
+    def __iter__(self) -> typing.Iterator[RowT]:
+        names = list(self.columns)
+        if not names:
+            for _ in range(self._length):
+                yield self.row_type()
+            return
+        for values in zip(*self.columns.values()):
+            yield self.row_type(**dict(zip(names, values)))
+
+    def __repr__(self) -> str:
+        return f"Columns[{getattr(self.row_type, '__name__', self.row_type)}]({len(self)} rows: {list(self.columns)})"
+
+
+class ColumnsDecoder:
+    """Decodes a list of structs into `Columns`, converting each field of all rows at once"""
+
+    def __init__(self, row_class_node: PythonClassNode) -> None:
+        self.row_type = row_class_node["constructor"]
+        self.column_converters: typing.Dict[str, _ColumnConverter] = {
+            name: (
+                operator.itemgetter(name),
+                compile_payload_converter(PythonClassNode(constructor=list, children={"list": field_class_node})),
+            )
+            for name, field_class_node in (row_class_node["children"] or {}).items()
+        }
+
+    def __call__(self, raw_rows: typing.List[typing.Dict[str, typing.Any]]) -> Columns[typing.Any]:
+        if None in raw_rows:
+            raise ValueError(f"Rows of a Columns[{self.row_type.__name__}] input cannot be null")
+        columns = {
+            name: convert_column(list(map(get_field, raw_rows)))
+            for name, (get_field, convert_column) in self.column_converters.items()
+        }
+        return Columns(self.row_type, columns, len(raw_rows))
+
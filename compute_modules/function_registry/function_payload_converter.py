@@ -13,6 +13,7 @@
 #  limitations under the License.
 
 
+import keyword
 import logging
 import typing
 
@@ -55,3 +56,247 @@ def convert_payload(
     except Exception as e:
         logger.error(f"Error converting {raw_payload} to type {class_tree['constructor']}")
         raise e
+
+
+PayloadConverter = typing.Callable[[typing.Any], typing.Any]
+
+# Payload values that are already of these types are used as-is instead of being passed to their constructor
+_IDENTITY_TYPES = (str, int, float, bool)
+_NONE_TYPE = type(None)
+
+
+def _identity_types(type_constructor: typing.Any) -> typing.Set[type]:
+    """The types of the values that are used as-is by the constructor of a primitive type"""
+    return {type_constructor} if type_constructor in _IDENTITY_TYPES else set()
+
+
+def _identity(raw_payload: typing.Any) -> typing.Any:
+    return raw_payload
+
+
+def _leaf_constructor(class_tree: PythonClassNode) -> typing.Optional[typing.Callable[[typing.Any], typing.Any]]:
+    return class_tree["constructor"] if class_tree["children"] is None else None
+
+
+def compile_payload_converter(class_tree: PythonClassNode, lazy: bool = False) -> PayloadConverter:
+    """Compile a class tree into a function converting payloads like `convert_payload(raw_payload, class_tree)`.
+
+    The tree is only walked once: the type dispatch happens at compile time, lists, sets & maps of primitive types
+    are converted with a single `map` over their elements, values that already have the expected primitive type are
+    not converted, and the fields of classes are converted by generated code.
+    With `lazy`, classes are instead converted into instances that convert each of their fields on first access,
+    see `_compile_lazy_class`.
+    """
+    converter = _compile(class_tree, lazy)
+
+    def convert(raw_payload: typing.Any) -> typing.Any:
+        try:
+            return converter(raw_payload)
+        except Exception as e:
+            logger.error(f"Error converting {raw_payload} to type {class_tree['constructor']}")
+            raise e
+
+    return convert
+
+
+def _compile(class_tree: PythonClassNode, lazy: bool) -> PayloadConverter:
+    type_constructor = class_tree["constructor"]
+    children = class_tree["children"]
+    if children is None:
+        return _compile_leaf(type_constructor)
+    if type_constructor is list or type_constructor is set:
+        return _compile_collection(type_constructor, children["list" if type_constructor is list else "set"], lazy)
+    if type_constructor is dict:
+        return _compile_map(children["key"], children["value"], lazy)
+    if type_constructor is typing.Optional:
+        return _identity
+    if lazy and _can_convert_lazily(type_constructor):
+        return _compile_lazy_class(type_constructor, children)
+    return _compile_class(type_constructor, children, lazy)
+
+
+def _compile_leaf(type_constructor: typing.Callable[[typing.Any], typing.Any]) -> PayloadConverter:
+    if type_constructor in _IDENTITY_TYPES:
+
+        def convert_primitive(raw_payload: typing.Any) -> typing.Any:
+            if raw_payload.__class__ is type_constructor or raw_payload is None:
+                return raw_payload
+            return type_constructor(raw_payload)
+
+        return convert_primitive
+
+    def convert_leaf(raw_payload: typing.Any) -> typing.Any:
+        return None if raw_payload is None else type_constructor(raw_payload)
+
+    return convert_leaf
+
+
+def _compile_collection(
+    collection_type: typing.Callable[[typing.Any], typing.Any], element_tree: PythonClassNode, lazy: bool
+) -> PayloadConverter:
+    element_constructor = _leaf_constructor(element_tree)
+    convert_element = _compile(element_tree, lazy)
+    if convert_element is _identity:
+
+        def convert_collection_as_is(raw_payload: typing.Any) -> typing.Any:
+            return None if raw_payload is None else collection_type(raw_payload)
+
+        return convert_collection_as_is
+    if element_constructor is None:
+
+        def convert_collection(raw_payload: typing.Any) -> typing.Any:
+            if raw_payload is None:
+                return None
+            return collection_type([convert_element(el) for el in raw_payload])
+
+        return convert_collection
+
+    identity_types = _identity_types(element_constructor)
+
+    def convert_primitive_collection(raw_payload: typing.Any) -> typing.Any:
+        if raw_payload is None:
+            return None
+        # A single pass over the types of the elements of a JSON array tells whether they are already converted,
+        # or can all be converted without calling back into Python per element
+        if raw_payload.__class__ is list:
+            element_types = set(map(type, raw_payload))
+            if element_types <= identity_types:
+                return collection_type(raw_payload)
+            if _NONE_TYPE not in element_types:
+                return collection_type(map(element_constructor, raw_payload))
+        return collection_type([convert_element(el) for el in raw_payload])
+
+    return convert_primitive_collection
+
+
+def _compile_map(key_tree: PythonClassNode, value_tree: PythonClassNode, lazy: bool) -> PayloadConverter:
+    key_constructor = _leaf_constructor(key_tree)
+    value_constructor = _leaf_constructor(value_tree)
+    convert_key = _compile(key_tree, lazy)
+    convert_value = _compile(value_tree, lazy)
+    if key_constructor is None or value_constructor is None:
+
+        def convert_map(raw_payload: typing.Any) -> typing.Any:
+            if raw_payload is None:
+                return None
+            return {convert_key(key): convert_value(value) for key, value in raw_payload.items()}
+
+        return convert_map
+
+    identity_key_types = _identity_types(key_constructor)
+    identity_value_types = _identity_types(value_constructor)
+
+    def convert_primitive_map(raw_payload: typing.Any) -> typing.Any:
+        if raw_payload is None:
+            return None
+        if raw_payload.__class__ is dict:
+            key_types = set(map(type, raw_payload))
+            value_types = set(map(type, raw_payload.values()))
+            if key_types <= identity_key_types and value_types <= identity_value_types:
+                return dict(raw_payload)
+            if _NONE_TYPE not in key_types and _NONE_TYPE not in value_types:
+                keys = map(key_constructor, raw_payload)
+                return {key: value for key, value in zip(keys, map(value_constructor, raw_payload.values()))}
+        return {convert_key(key): convert_value(value) for key, value in raw_payload.items()}
+
+    return convert_primitive_map
+
+
+def _compile_class(
+    type_constructor: typing.Callable[..., typing.Any], children: typing.Dict[str, PythonClassNode], lazy: bool
+) -> PayloadConverter:
+    """Generates a function converting each field of the class in turn, then calling its constructor"""
+    namespace: typing.Dict[str, typing.Any] = {"type_constructor": type_constructor}
+    lines = ["def convert_class(raw_payload):", "    if raw_payload is None:", "        return None"]
+    arguments = []
+    for index, (child_key, child_class_tree) in enumerate(children.items()):
+        convert_child = _compile(child_class_tree, lazy)
+        value = f"raw_payload[{child_key!r}]"
+        if convert_child is _identity:
+            lines.append(f"    field_{index} = {value}")
+        elif _leaf_constructor(child_class_tree) in _IDENTITY_TYPES:
+            namespace[f"type_{index}"] = child_class_tree["constructor"]
+            namespace[f"convert_{index}"] = convert_child
+            lines.append(f"    field_{index} = {value}")
+            lines.append(
+                f"    if field_{index}.__class__ is not type_{index}: field_{index} = convert_{index}(field_{index})"
+            )
+        else:
+            namespace[f"convert_{index}"] = convert_child
+            lines.append(f"    field_{index} = convert_{index}({value})")
+        arguments.append((child_key, f"field_{index}"))
+    if all(key.isidentifier() and not keyword.iskeyword(key) for key, _ in arguments):
+        lines.append(f"    return type_constructor({', '.join(f'{key}={field}' for key, field in arguments)})")
+    else:
+        lines.append(f"    return type_constructor(**{{{', '.join(f'{key!r}: {field}' for key, field in arguments)}}})")
+    name = getattr(type_constructor, "__qualname__", repr(type_constructor))
+    exec(compile("\n".join(lines), f"<payload converter for {name}>", "exec"), namespace)
+    return typing.cast(PayloadConverter, namespace["convert_class"])
+
+
+# Attribute of lazily converted instances holding their raw payload
+_RAW_PAYLOAD_ATTRIBUTE = "_compute_modules_raw_payload"
+
+
+def _can_convert_lazily(type_constructor: typing.Any) -> bool:
+    """Instances of regular classes can be created without calling their constructor.
+    TypedDicts & classes with a custom `__new__` are always converted eagerly
+    """
+    return (
+        isinstance(type_constructor, type)
+        and not issubclass(type_constructor, dict)
+        and type_constructor.__new__ is object.__new__
+    )
+
+
+class _LazyField:
+    """Non-data descriptor converting a field of a lazily converted instance on first access.
+    The converted value is cached in the instance's `__dict__`, which takes precedence over the descriptor from then on
+    """
+
+    __slots__ = ("name", "convert")
+
+    def __init__(self, name: str, convert: PayloadConverter) -> None:
+        self.name = name
+        self.convert = convert
+
+    def __get__(self, instance: typing.Any, owner: typing.Optional[type] = None) -> typing.Any:
+        if instance is None:
+            return self
+        value = self.convert(getattr(instance, _RAW_PAYLOAD_ATTRIBUTE)[self.name])
+        instance.__dict__[self.name] = value
+        return value
+
+
+def _compile_lazy_class(type_constructor: type, children: typing.Dict[str, PythonClassNode]) -> PayloadConverter:
+    """Converts a payload into an instance of a subclass of the class that holds the raw payload & converts each
+    field on first access. Neither the class's `__init__` nor its `__post_init__` is called
+    """
+    lazy_fields = {
+        child_key: _LazyField(child_key, _compile(child_class_tree, True))
+        for child_key, child_class_tree in children.items()
+    }
+    # The raw payload is held in a slot, while converted fields are cached in the instance's __dict__
+    slots = (_RAW_PAYLOAD_ATTRIBUTE,) if type_constructor.__dictoffset__ else (_RAW_PAYLOAD_ATTRIBUTE, "__dict__")
+    lazy_type = type(
+        type_constructor.__name__,
+        (type_constructor,),
+        {
+            **lazy_fields,
+            "__slots__": slots,
+            "__qualname__": type_constructor.__qualname__,
+            "__module__": type_constructor.__module__,
+        },
+    )
+    new_instance = object.__new__
+    # Bypasses the __setattr__ of frozen dataclasses
+    set_raw_payload = vars(lazy_type)[_RAW_PAYLOAD_ATTRIBUTE].__set__
+
+    def convert_lazy_class(raw_payload: typing.Any) -> typing.Any:
+        if raw_payload is None:
+            return None
+        instance = new_instance(lazy_type)
+        set_raw_payload(instance, raw_payload)
+        return instance
+
+    return convert_lazy_class
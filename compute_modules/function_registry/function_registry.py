@@ -15,13 +15,17 @@
 
 from typing import Any, Callable, Dict, List, Optional
 
+from ..caching.result_cache import CachePolicy
+from ..caching.single_flight import CoalescePolicy
 from .function_schema_parser import parse_function_schema
-from .types import ComputeModuleFunctionSchema, PythonClassNode
+from .types import ComputeModuleFunctionSchema, FunctionOptions, PythonClassNode
 
 REGISTERED_FUNCTIONS: Dict[str, Callable[..., Any]] = {}
 FUNCTION_SCHEMAS: List[ComputeModuleFunctionSchema] = []
 FUNCTION_SCHEMA_CONVERSIONS: Dict[str, PythonClassNode] = {}
 IS_FUNCTION_CONTEXT_TYPED: Dict[str, bool] = {}
+FUNCTION_OPTIONS: Dict[str, FunctionOptions] = {}
+FUNCTION_OUTPUT_TYPES: Dict[str, Any] = {}
 
 
 def add_functions(*args: Callable[..., Any]) -> None:
@@ -29,16 +33,63 @@ def add_functions(*args: Callable[..., Any]) -> None:
         add_function(function_ref=function_ref)
 
 
-def add_function(function_ref: Callable[..., Any]) -> None:
-    """Parse & register a Compute Module function"""
+def add_function(
+    function_ref: Callable[..., Any],
+    timeout: Optional[float] = None,
+    batch: bool = False,
+    max_batch_size: Optional[int] = None,
+    max_wait_ms: Optional[float] = None,
+    cache: Optional[CachePolicy] = None,
+    coalesce: Optional[CoalescePolicy] = None,
+    max_concurrency: Optional[int] = None,
+    weight: float = 1.0,
+    lazy_input: bool = False,
+) -> None:
+    """Parse & register a Compute Module function.
+
+    `timeout` is the number of seconds the function may run for before its job fails,
+    overriding the JOB_TIMEOUT_SECONDS default.
+    With `batch`, pending jobs of the function are executed together: the function is called with a list of
+    contexts & a list of events (up to `max_batch_size`, collected for up to `max_wait_ms`) & returns a list of results.
+    With `cache`, the results of the function are memoized, see `CachePolicy`.
+    With `coalesce`, identical jobs executing at the same time share a single execution, see `CoalescePolicy`.
+    `max_concurrency` limits the number of jobs of the function executed at once across all worker processes,
+    and `weight` is the share of the Compute Module's capacity each of them occupies, see `FunctionOptions`.
+    With `lazy_input`, the classes of the function's input convert each of their fields on first access
+    """
     function_name = function_ref.__name__
-    parse_result = parse_function_schema(function_ref, function_name)
+    parse_result = parse_function_schema(function_ref, function_name, batch=batch)
+    if batch and (cache is not None or coalesce is not None):
+        raise ValueError(f"Jobs of batch function {function_name} cannot be cached or coalesced")
+    if max_concurrency is not None and max_concurrency < 1:
+        raise ValueError(f"max_concurrency must be >= 1, got {max_concurrency}")
+    if weight <= 0:
+        raise ValueError(f"weight must be > 0, got {weight}")
+    if batch and (max_concurrency is not None or weight != 1):
+        raise ValueError(f"Batch function {function_name} cannot have a max_concurrency or weight")
+    function_options = FunctionOptions(
+        timeout=timeout,
+        batch=batch,
+        cache=cache,
+        coalesce=coalesce,
+        max_concurrency=max_concurrency,
+        weight=weight,
+        lazy_input=lazy_input,
+    )
+    if max_batch_size is not None:
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be >= 1, got {max_batch_size}")
+        function_options.max_batch_size = max_batch_size
+    if max_wait_ms is not None:
+        function_options.max_wait_ms = max_wait_ms
     _register_parsed_function(
         function_name=function_name,
         function_ref=function_ref,
         function_schema=parse_result.function_schema,
         function_schema_conversion=parse_result.class_node,
         is_context_typed=parse_result.is_context_typed,
+        function_options=function_options,
+        output_type=parse_result.output_type,
     )
 
 
@@ -48,10 +99,15 @@ def _register_parsed_function(
     function_schema: ComputeModuleFunctionSchema,
     function_schema_conversion: Optional[PythonClassNode],
     is_context_typed: bool,
+    function_options: FunctionOptions,
+    output_type: Any = None,
 ) -> None:
     """Registers a Compute Module function"""
     REGISTERED_FUNCTIONS[function_name] = function_ref
     FUNCTION_SCHEMAS.append(function_schema)
     IS_FUNCTION_CONTEXT_TYPED[function_name] = is_context_typed
+    FUNCTION_OPTIONS[function_name] = function_options
     if function_schema_conversion is not None:
         FUNCTION_SCHEMA_CONVERSIONS[function_name] = function_schema_conversion
+    if output_type is not None:
+        FUNCTION_OUTPUT_TYPES[function_name] = output_type
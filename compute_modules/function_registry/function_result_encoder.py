@@ -0,0 +1,280 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import dataclasses
+import datetime
+import decimal
+import functools
+import json
+import keyword
+import typing
+from json.encoder import encode_basestring_ascii
+
+from .columns import Columns
+from .types import Byte, Double, Long, Short
+
+ResultEncoder = typing.Callable[[typing.Any], bytes]
+# Encodes a value into JSON text
+_Encoder = typing.Callable[[typing.Any], str]
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_UTC = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MILLISECOND = datetime.timedelta(milliseconds=1)
+_INTEGER_TYPES = (int, Byte, Long, Short)
+_FLOAT_TYPES = (float, Double)
+# Types that the JSON encoder serializes natively, so collections of them are encoded in one call to it
+_JSON_NATIVE_TYPES = (str, bool, *_INTEGER_TYPES, *_FLOAT_TYPES)
+_SEQUENCE_TYPES = (list, tuple, set, frozenset, Columns)
+
+
+def _timestamp_millis(value: datetime.datetime) -> int:
+    """Milliseconds since the Unix epoch. Naive datetimes are in UTC, as those converted from timestamp inputs"""
+    return (value - (_EPOCH if value.tzinfo is None else _EPOCH_UTC)) // _MILLISECOND
+
+
+@functools.lru_cache(maxsize=None)
+def _field_hints(cls: type) -> typing.Dict[str, typing.Any]:
+    """The type hints of the fields of a class, leaving out its class variables"""
+    try:
+        type_hints = typing.get_type_hints(cls, globalns={})
+    except (NameError, TypeError):
+        # e.g. forward references that cannot be resolved
+        return {}
+    return {
+        name: hint
+        for name, hint in type_hints.items()
+        if hint is not typing.ClassVar and typing.get_origin(hint) is not typing.ClassVar
+    }
+
+
+def to_json_compatible(value: typing.Any) -> typing.Any:
+    """`default` of the JSON encoder, serializing the types of the README's type table like their inputs"""
+    if isinstance(value, datetime.datetime):
+        return _timestamp_millis(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    if isinstance(value, (set, frozenset, Columns)):
+        return list(value)
+    if hasattr(value, "tolist"):
+        # array.array & NumPy arrays
+        return value.tolist()
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+    field_hints = _field_hints(type(value))
+    if field_hints:
+        # Classes with annotated fields, like the classes of inputs
+        return {name: getattr(value, name) for name in field_hints}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"), default=to_json_compatible)
+_encode_any: _Encoder = _JSON_ENCODER.encode
+
+
+def encode_result(result: typing.Any) -> bytes:
+    """Encode a result of a function without a declared return type"""
+    return _encode_any(result).encode("utf-8")
+
+
+def compile_result_encoder(type_hint: typing.Any, dumps: ResultEncoder = encode_result) -> ResultEncoder:
+    """Compile the return type of a function into a function encoding its results into JSON bytes.
+
+    Values are encoded like the inputs of the same type are decoded (e.g. datetimes as milliseconds since the epoch,
+    sets as arrays) & classes are encoded by generated code writing their fields straight to JSON, without copying
+    them into dicts first. Values that are not of their declared type are encoded based on their actual type.
+    Results of types that JSON encoders serialize natively (e.g. `List[float]`) are encoded with `dumps` as a whole,
+    which must follow the same rules as `encode_result`.
+    """
+    encoder = _compile(type_hint)
+    if encoder is _encode_any:
+        return dumps
+
+    def encode(result: typing.Any) -> bytes:
+        return encoder(result).encode("utf-8")
+
+    return encode
+
+
+def _compile(type_hint: typing.Any) -> _Encoder:
+    if type_hint in _JSON_NATIVE_TYPES:
+        return _compile_primitive(type_hint)
+    if type_hint is datetime.datetime:
+        return _encode_timestamp
+    if type_hint is datetime.date:
+        return _encode_date
+    if type_hint is decimal.Decimal:
+        return _encode_decimal
+    if type_hint is bytes:
+        return _encode_bytes
+    origin = typing.get_origin(type_hint)
+    type_args = typing.get_args(type_hint)
+    if origin in (list, set, Columns) and type_args:
+        return _compile_sequence(type_args[0])
+    if origin is dict and type_args:
+        return _compile_map(*type_args)
+    if origin is typing.Union:
+        # Optional values are encoded as their type, while None is encoded as null by any encoder
+        non_null_args = [arg for arg in type_args if arg is not type(None)]
+        return _compile(non_null_args[0]) if len(non_null_args) == 1 else _encode_any
+    if isinstance(type_hint, type) and issubclass(type_hint, dict) and type_hint is not dict:
+        # TypedDict
+        return _compile_typed_dict(type_hint)
+    if isinstance(type_hint, type) and _field_hints(type_hint):
+        return _compile_class(type_hint)
+    return _encode_any
+
+
+def _compile_primitive(type_hint: typing.Any) -> _Encoder:
+    if type_hint is str:
+        return _encode_str
+    if type_hint is bool:
+        return _encode_any
+    if type_hint in _INTEGER_TYPES:
+        return _encode_int
+    return _encode_float
+
+
+def _encode_str(value: typing.Any) -> str:
+    return encode_basestring_ascii(value) if value.__class__ is str else _encode_any(value)
+
+
+def _encode_int(value: typing.Any) -> str:
+    return int.__repr__(value) if value.__class__ is int else _encode_any(value)
+
+
+def _encode_float(value: typing.Any) -> str:
+    # NaN & infinities are left to the JSON encoder
+    if value.__class__ is float and value - value == 0.0:
+        return float.__repr__(value)
+    return _encode_any(value)
+
+
+def _encode_timestamp(value: typing.Any) -> str:
+    return str(_timestamp_millis(value)) if isinstance(value, datetime.datetime) else _encode_any(value)
+
+
+def _encode_date(value: typing.Any) -> str:
+    return f'"{value.isoformat()}"' if value.__class__ is datetime.date else _encode_any(value)
+
+
+def _encode_decimal(value: typing.Any) -> str:
+    return f'"{value}"' if isinstance(value, decimal.Decimal) else _encode_any(value)
+
+
+def _encode_bytes(value: typing.Any) -> str:
+    return encode_basestring_ascii(value.decode("utf-8")) if isinstance(value, bytes) else _encode_any(value)
+
+
+def _is_json_native(type_hint: typing.Any) -> bool:
+    if typing.get_origin(type_hint) is typing.Union:
+        return all(arg is type(None) or _is_json_native(arg) for arg in typing.get_args(type_hint))
+    return type_hint in _JSON_NATIVE_TYPES
+
+
+def _compile_sequence(element_hint: typing.Any) -> _Encoder:
+    if _is_json_native(element_hint):
+        return _encode_any
+    encode_element = _compile(element_hint)
+
+    def encode_sequence(value: typing.Any) -> str:
+        if isinstance(value, _SEQUENCE_TYPES):
+            return "[" + ",".join(map(encode_element, value)) + "]"
+        return _encode_any(value)
+
+    return encode_sequence
+
+
+def _encode_key(encode: _Encoder) -> _Encoder:
+    """JSON object keys are strings: keys that are not encoded as strings are quoted, as the JSON encoder does"""
+
+    def encode_key(key: typing.Any) -> str:
+        encoded = encode(key)
+        return encoded if encoded[:1] == '"' else f'"{encoded}"'
+
+    return encode_key
+
+
+def _compile_map(key_hint: typing.Any, value_hint: typing.Any) -> _Encoder:
+    if _is_json_native(key_hint) and _is_json_native(value_hint):
+        return _encode_any
+    encode_key = _encode_key(_compile(key_hint))
+    encode_value = _compile(value_hint)
+
+    def encode_map(value: typing.Any) -> str:
+        if isinstance(value, dict):
+            return "{" + ",".join([encode_key(k) + ":" + encode_value(v) for k, v in value.items()]) + "}"
+        return _encode_any(value)
+
+    return encode_map
+
+
+def _compile_typed_dict(type_hint: typing.Any) -> _Encoder:
+    field_encoders = {name: _compile(hint) for name, hint in typing.get_type_hints(type_hint, globalns={}).items()}
+    encode_key = _encode_key(_encode_any)
+
+    def encode_typed_dict(value: typing.Any) -> str:
+        if isinstance(value, dict):
+            return (
+                "{"
+                + ",".join([encode_key(k) + ":" + field_encoders.get(k, _encode_any)(v) for k, v in value.items()])
+                + "}"
+            )
+        return _encode_any(value)
+
+    return encode_typed_dict
+
+
+def _compile_class(type_hint: type) -> _Encoder:
+    """Generates a function writing each field of the class in turn as a member of a JSON object"""
+    namespace: typing.Dict[str, typing.Any] = {
+        "type_hint": type_hint,
+        "encode_any": _encode_any,
+        "encode_string": encode_basestring_ascii,
+        "int_repr": int.__repr__,
+    }
+    lines = [
+        "def encode_class(value):",
+        "    if value.__class__ is not type_hint and not isinstance(value, type_hint):",
+        "        return encode_any(value)",
+    ]
+    parts = []
+    for index, (name, field_hint) in enumerate(_field_hints(type_hint).items()):
+        if name.isidentifier() and not keyword.iskeyword(name):
+            lines.append(f"    field_{index} = value.{name}")
+        else:
+            lines.append(f"    field_{index} = getattr(value, {name!r})")
+        encode_field = _compile(field_hint)
+        namespace[f"encode_{index}"] = encode_field
+        # Inline the common cases of string & integer fields
+        field, encode = f"field_{index}", f"encode_{index}"
+        if encode_field is _encode_str:
+            expression = f"encode_string({field}) if {field}.__class__ is str else {encode}({field})"
+        elif encode_field is _encode_int:
+            expression = f"int_repr({field}) if {field}.__class__ is int else {encode}({field})"
+        else:
+            expression = f"{encode}({field})"
+        lines.append(f"    part_{index} = {expression}")
+        prefix = "{" if index == 0 else ","
+        parts.append(repr(prefix + encode_basestring_ascii(name) + ":"))
+        parts.append(f"part_{index}")
+    parts.append(repr("}") if parts else repr("{}"))
+    lines.append(f"    return {' + '.join(parts)}")
+    exec(compile("\n".join(lines), f"<result encoder for {type_hint.__qualname__}>", "exec"), namespace)
+    return typing.cast(_Encoder, namespace["encode_class"])
+
@@ -13,21 +13,26 @@
 #  limitations under the License.
 
 
+import array
 import datetime
 import decimal
 import inspect
+import sys
 import typing
 
 from compute_modules.context.types import QueryContext
 
+from .columns import Columns, ColumnsDecoder
 from .types import (
     AllowedKeyTypes,
     Byte,
     ComputeModuleFunctionSchema,
     DataTypeDict,
     Double,
+    FloatArray,
     FunctionInputType,
     FunctionOutputType,
+    IntArray,
     Long,
     ParseFunctionSchemaResult,
     PythonClassNode,
@@ -37,13 +42,27 @@ from .types import (
 CONTEXT_KEY = "context"
 RETURN_KEY = "return"
 RESERVED_KEYS = {CONTEXT_KEY, RETURN_KEY}
+# Data types of the elements of the lists that NumPy `NDArray` inputs are decoded from, by dtype
+NDARRAY_ELEMENT_TYPES = {
+    "bool": "boolean",
+    "int8": "byte",
+    "int16": "short",
+    "int32": "integer",
+    "int64": "long",
+    "float32": "float",
+    "float64": "double",
+}
 
 
 def parse_function_schema(
-    function_ref: typing.Callable[..., typing.Any], function_name: str
+    function_ref: typing.Callable[..., typing.Any], function_name: str, batch: bool = False
 ) -> ParseFunctionSchemaResult:
-    """Convert function name, input(s) & output into ComputeModuleFunctionSchema"""
+    """Convert function name, input(s) & output into ComputeModuleFunctionSchema.
+    The schema of a `batch` function is that of a single item of its list parameters & return type
+    """
     type_hints = typing.get_type_hints(function_ref, globalns={})
+    if batch:
+        type_hints = _unwrap_batch_type_hints(type_hints, function_name)
     inputs, root_class_node = _extract_inputs(type_hints)
     is_context_typed = _check_is_context_typed(type_hints)
     output = _extract_output(type_hints)
@@ -56,9 +75,23 @@ def parse_function_schema(
         function_schema=function_schema,
         class_node=root_class_node,
         is_context_typed=is_context_typed,
+        output_type=type_hints.get(RETURN_KEY),
     )
 
 
+def _unwrap_batch_type_hints(
+    type_hints: typing.Dict[str, typing.Any], function_name: str
+) -> typing.Dict[str, typing.Any]:
+    """Replace the `List[...]` type hints of a batch function with their item types"""
+    item_type_hints = {}
+    for key, type_hint in type_hints.items():
+        item_types = typing.get_args(type_hint)
+        if typing.get_origin(type_hint) is not list or len(item_types) != 1:
+            raise ValueError(f"Batch function {function_name} must annotate {key} as a List[...], got {type_hint}")
+        item_type_hints[key] = item_types[0]
+    return item_type_hints
+
+
 def _extract_inputs(
     type_hints: typing.Dict[str, typing.Any],
 ) -> typing.Tuple[typing.List[FunctionInputType], typing.Optional[PythonClassNode]]:
@@ -189,6 +222,34 @@ def _extract_data_type(type_hint: typing.Any) -> typing.Tuple[DataTypeDict, Pyth
             "type": "timestamp",
             "timestamp": {},
         }, PythonClassNode(constructor=lambda d: datetime.datetime.utcfromtimestamp(d / 1e3), children=None)
+    if type_hint is FloatArray:
+        return {
+            "type": "list",
+            "list": {
+                "elementsType": {"type": "float", "float": {}},
+            },
+        }, PythonClassNode(constructor=lambda x: array.array("d", x), children=None)
+    if type_hint is IntArray:
+        return {
+            "type": "list",
+            "list": {
+                "elementsType": {"type": "integer", "integer": {}},
+            },
+        }, PythonClassNode(constructor=_to_int_array, children=None)
+    ndarray_data_type = _extract_ndarray_data_type(type_hint)
+    if ndarray_data_type is not None:
+        return ndarray_data_type
+    if typing.get_origin(type_hint) is Columns:
+        row_hint = typing.get_args(type_hint)[0]
+        row_type, row_class_node = _extract_data_type(row_hint)
+        if row_type["type"] != "anonymousCustomType":
+            raise ValueError(f"Columns type hints must have a class parameter (e.g. Columns[MyDataclass]), got {row_hint}")
+        return {
+            "type": "list",
+            "list": {
+                "elementsType": row_type,
+            },
+        }, PythonClassNode(constructor=ColumnsDecoder(row_class_node), children=None)
     if typing.get_origin(type_hint) is list:
         element_hint = typing.get_args(type_hint)[0]
         element_type, element_class_node = _extract_data_type(element_hint)
@@ -260,6 +321,39 @@ def _extract_data_type(type_hint: typing.Any) -> typing.Tuple[DataTypeDict, Pyth
     }, PythonClassNode(constructor=type_hint, children=child_class_nodes)
 
 
+def _to_int_array(values: typing.List[typing.Any]) -> "array.array[int]":
+    try:
+        return array.array("q", values)
+    except TypeError:
+        # Integers sent as floats (e.g. 1.0) are converted like the elements of List[int]
+        return array.array("q", map(int, values))
+
+
+def _extract_ndarray_data_type(type_hint: typing.Any) -> typing.Optional[typing.Tuple[DataTypeDict, PythonClassNode]]:
+    """Data type of a `numpy.typing.NDArray[...]` input, decoded in one step from a list of numbers.
+    NumPy is not a dependency: such a type hint can only exist when it has already been imported
+    """
+    numpy = sys.modules.get("numpy")
+    if numpy is None or typing.get_origin(type_hint) is not numpy.ndarray:
+        return None
+    _, dtype_hint = typing.get_args(type_hint)
+    try:
+        dtype = numpy.dtype(typing.get_args(dtype_hint)[0])
+    except (IndexError, TypeError):
+        dtype = None
+    if dtype is None or dtype.name not in NDARRAY_ELEMENT_TYPES:
+        raise ValueError(
+            f"NDArray type hints must have one of the dtypes {list(NDARRAY_ELEMENT_TYPES)}, got {type_hint}"
+        )
+    element_type = NDARRAY_ELEMENT_TYPES[dtype.name]
+    return {
+        "type": "list",
+        "list": {
+            "elementsType": {"type": element_type, element_type: {}},
+        },
+    }, PythonClassNode(constructor=lambda x: numpy.array(x, dtype=dtype), children=None)
+
+
 def _assert_is_valid_custom_type(item: typing.Any) -> None:
     # If using a TypedDict, _assert_is_valid_custom_type will raise an erroneous exception
     # So we only want to validate if this is a true class
@@ -13,11 +13,17 @@
 #  limitations under the License.
 
 
+import array
 import datetime
 import decimal
 import typing
 from dataclasses import dataclass
 
+if typing.TYPE_CHECKING:
+    # The caching package encodes results with the function registry, so it is only imported for type checking
+    from compute_modules.caching.result_cache import CachePolicy
+    from compute_modules.caching.single_flight import CoalescePolicy
+
 DataTypeDict = typing.Dict[str, typing.Any]
 
 
@@ -58,11 +64,47 @@ class ComputeModuleFunctionSchema(typing.TypedDict):
     output: FunctionOutputType
 
 
+@dataclass
+class FunctionOptions:
+    """Execution options of a Compute Module function, set with `@function(...)` or `add_function(...)`"""
+
+    timeout: typing.Optional[float] = None
+    """Seconds the function may run for before its job fails. Defaults to JOB_TIMEOUT_SECONDS"""
+
+    batch: bool = False
+    """Whether the function is called with a list of contexts & a list of events, returning a list of results"""
+
+    max_batch_size: int = 32
+    """Maximum number of jobs passed to a batch function at once"""
+
+    max_wait_ms: float = 10.0
+    """Maximum time spent collecting more pending jobs of the same function before calling a batch function"""
+
+    cache: "typing.Optional[CachePolicy]" = None
+    """How the results of the function are memoized. None to run the function for every job"""
+
+    coalesce: "typing.Optional[CoalescePolicy]" = None
+    """How identical jobs executing at the same time share a single execution. None to execute each of them"""
+
+    max_concurrency: typing.Optional[int] = None
+    """Maximum number of jobs of the function executed at once across all worker processes. None for no limit"""
+
+    weight: float = 1.0
+    """Share of the Compute Module's capacity occupied by each job of the function, e.g. 2 for a job that needs
+    twice the memory of a typical job. Jobs of functions with a weight other than 1 wait until it is free"""
+
+    lazy_input: bool = False
+    """Whether the classes of the function's input convert each of their fields on first access instead of upfront,
+    so the parts of large inputs the function does not read are never converted"""
+
+
 @dataclass
 class ParseFunctionSchemaResult:
     function_schema: ComputeModuleFunctionSchema
     class_node: typing.Optional[PythonClassNode]
     is_context_typed: bool
+    output_type: typing.Any = None
+    """The return type hint of the function (of an item, for batch functions). None if it is not annotated"""
 
 
 Byte = typing.NewType("Byte", int)
@@ -70,6 +112,16 @@ Double = typing.NewType("Double", float)
 Long = typing.NewType("Long", int)
 Short = typing.NewType("Short", int)
 
+# Input annotations for large numeric lists, decoded into an `array.array` of C doubles / 64-bit integers.
+# The schema of the input is that of a list of floats / integers. Decoding takes about as long as for a list, but the
+# array takes a quarter of the memory & can be passed to NumPy without a copy
+if typing.TYPE_CHECKING:
+    FloatArray = typing.NewType("FloatArray", "array.array[float]")
+    IntArray = typing.NewType("IntArray", "array.array[int]")
+else:
+    FloatArray = typing.NewType("FloatArray", array.array)
+    IntArray = typing.NewType("IntArray", array.array)
+
 AllowedKeyTypes = typing.Union[
     bytes,
     bool,
@@ -0,0 +1,26 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+"""Imported by the forkserver process, see `configure_forkserver`"""
+
+import json
+import os
+from multiprocessing import spawn
+
+from compute_modules.lifecycle.forkserver import FORKSERVER_PREPARATION_DATA_ENV
+from compute_modules.lifecycle.hooks import run_preload_hooks
+
+spawn.prepare(json.loads(os.environ.get(FORKSERVER_PREPARATION_DATA_ENV, "{}")))
+run_preload_hooks()
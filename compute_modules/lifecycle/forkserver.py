@@ -0,0 +1,40 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import json
+import os
+from multiprocessing import spawn
+from multiprocessing.context import ForkServerContext
+from typing import List
+
+# Imported by the forkserver process after the user's preload modules
+FORKSERVER_PRELOAD_MODULE = "compute_modules.lifecycle._forkserver_preload"
+# How the forkserver process finds & imports the main module
+FORKSERVER_PREPARATION_DATA_ENV = "COMPUTE_MODULES_FORKSERVER_PREPARATION_DATA"
+_PREPARATION_DATA_KEYS = {"sys_path", "dir", "init_main_from_name", "init_main_from_path"}
+
+
+def configure_forkserver(mp_context: ForkServerContext, preload_modules: List[str]) -> None:
+    """Make the forkserver import the main module (registering functions & hooks) & `preload_modules`,
+    then run the preload hooks, so that worker processes forked from it share what was loaded.
+
+    The main module is imported by `FORKSERVER_PRELOAD_MODULE` rather than by listing "__main__",
+    as the forkserver does not receive the main module's path on all supported Python versions.
+    """
+    preparation_data = spawn.get_preparation_data("forkserver")
+    os.environ[FORKSERVER_PREPARATION_DATA_ENV] = json.dumps(
+        {key: value for key, value in preparation_data.items() if key in _PREPARATION_DATA_KEYS}
+    )
+    mp_context.set_forkserver_preload([*preload_modules, FORKSERVER_PRELOAD_MODULE])
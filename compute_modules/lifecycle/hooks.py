@@ -0,0 +1,155 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import gc
+import inspect
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from compute_modules.logging.internal import get_internal_logger
+
+PRELOAD_HOOKS: List[Callable[[], Any]] = []
+# Keyed by the name of the resource each hook creates
+WORKER_START_HOOKS: Dict[str, Callable[[], Any]] = {}
+WORKER_STOP_HOOKS: List[Callable[[], Any]] = []
+WORKER_RESOURCES: Dict[str, Any] = {}
+_preload_hooks_ran = False
+
+
+def add_preload_hook(hook: Callable[[], Any]) -> None:
+    """Register a function that loads data shared by all workers, e.g. models or lookup tables.
+
+    Preload hooks run once in the parent process before worker processes are forked,
+    so what they load is shared between workers instead of being loaded by each of them.
+    """
+    PRELOAD_HOOKS.append(hook)
+
+
+def run_preload_hooks() -> None:
+    """Run the registered preload hooks, if they have not run in this process (or the process it was forked from).
+
+    Everything allocated so far is then moved to the permanent GC generation with `gc.freeze()`,
+    so garbage collections in forked workers do not write to (and therefore copy) the shared pages.
+    See: https://docs.python.org/3/library/gc.html#gc.freeze
+    """
+    global _preload_hooks_ran
+    if _preload_hooks_ran:
+        return
+    _preload_hooks_ran = True
+    gc.collect()
+    # Avoid collections freeing objects in between the loaded data, which would leave holes to be filled after forking
+    gc.disable()
+    try:
+        for hook in PRELOAD_HOOKS:
+            hook()
+    finally:
+        gc.freeze()
+        gc.enable()
+
+
+def add_worker_start_hook(hook: Callable[[], Any], name: Optional[str] = None) -> None:
+    """Register a function that creates a per-process resource, e.g. an HTTP session, DB pool or model handle.
+
+    Worker start hooks run in each worker process before it starts polling for jobs. The value returned by
+    a hook is available to functions as `context.workerResources[name]` (`name` defaults to `hook.__name__`),
+    so it is created once per worker and reused across jobs.
+    Hooks may be `async def`, in which case they run on the worker's event loop.
+    """
+    name = name or hook.__name__
+    if name in WORKER_START_HOOKS:
+        raise ValueError(
+            f"A worker start hook already creates the resource {name}, register this hook with a different name"
+        )
+    WORKER_START_HOOKS[name] = hook
+
+
+def add_worker_stop_hook(hook: Callable[[], Any]) -> None:
+    """Register a function that releases per-process resources, see `add_worker_start_hook`.
+
+    Worker stop hooks run in each worker process once it has stopped polling for jobs & reported its results,
+    in the reverse order they were registered. Hooks may be `async def`.
+    """
+    WORKER_STOP_HOOKS.append(hook)
+
+
+def get_worker_resources() -> Dict[str, Any]:
+    """The values returned by the worker start hooks that ran in this process, keyed by resource name"""
+    return WORKER_RESOURCES
+
+
+def run_worker_start_hooks(run_coroutine: Callable[[Awaitable[Any]], Any]) -> None:
+    """Run the registered worker start hooks, storing their return values in `WORKER_RESOURCES`.
+
+    `async def` hooks are run to completion with `run_coroutine`
+    """
+    for name, hook in WORKER_START_HOOKS.items():
+        resource = hook()
+        if inspect.isawaitable(resource):
+            resource = run_coroutine(resource)
+        WORKER_RESOURCES[name] = resource
+
+
+async def run_worker_start_hooks_async() -> None:
+    """Counterpart of `run_worker_start_hooks` for workers running on an event loop"""
+    for name, hook in WORKER_START_HOOKS.items():
+        resource = hook()
+        if inspect.isawaitable(resource):
+            resource = await resource
+        WORKER_RESOURCES[name] = resource
+
+
+def _log_stop_hook_failure(hook: Callable[[], Any], e: Exception) -> None:
+    logger = get_internal_logger()
+    logger.error(f"Worker stop hook {hook.__name__} failed: {str(e)}")
+    logger.error(traceback.format_exc())
+
+
+def run_worker_stop_hooks(run_coroutine: Callable[[Awaitable[Any]], Any]) -> None:
+    """Run the registered worker stop hooks, then clear `WORKER_RESOURCES`.
+    A hook that fails is logged, so the remaining hooks still run
+    """
+    for hook in reversed(WORKER_STOP_HOOKS):
+        try:
+            result = hook()
+            if inspect.isawaitable(result):
+                run_coroutine(result)
+        except Exception as e:
+            _log_stop_hook_failure(hook, e)
+    WORKER_RESOURCES.clear()
+
+
+async def run_worker_stop_hooks_async() -> None:
+    """Counterpart of `run_worker_stop_hooks` for workers running on an event loop"""
+    for hook in reversed(WORKER_STOP_HOOKS):
+        try:
+            result = hook()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            _log_stop_hook_failure(hook, e)
+    WORKER_RESOURCES.clear()
+
+
+__all__ = [
+    "add_preload_hook",
+    "add_worker_start_hook",
+    "add_worker_stop_hook",
+    "get_worker_resources",
+    "run_preload_hooks",
+    "run_worker_start_hooks",
+    "run_worker_start_hooks_async",
+    "run_worker_stop_hooks",
+    "run_worker_stop_hooks_async",
+]
@@ -14,7 +14,8 @@
 
 
 import logging
-from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Mapping, Optional, Union
 
 # logging.LoggerAdapter was made generic in 3.11 so we need to determine at runtime
 # whether this should be generic or not.
@@ -27,6 +28,11 @@ else:
     _LoggerAdapter = logging.LoggerAdapter
 
 
+# Job ID of the job being handled by the current asyncio task. When several jobs are in flight on a single event loop
+# the process-wide job_id cannot be used, so this takes precedence over it when set.
+TASK_JOB_ID: ContextVar[Optional[str]] = ContextVar("compute_modules_task_job_id", default=None)
+
+
 # TODO: add replica ID to default log format
 DEFAULT_LOG_FORMAT = (
     "%(levelname)-8s PID: %(process_id)-2s JOB: %(job_id)-36s LOC: %(filename)s:%(lineno)d - %(message)s"
@@ -48,6 +54,26 @@ def _create_logger(name: str) -> logging.Logger:
     return logger
 
 
+class _LogContextExtra(Mapping[str, str]):
+    """The `extra` mapping of a LoggerAdapter, resolving job_id from TASK_JOB_ID when it is set"""
+
+    def __init__(self, process_id: str, job_id: str) -> None:
+        self._values = dict(process_id=process_id, job_id=job_id)
+
+    def __getitem__(self, key: str) -> str:
+        if key == "job_id":
+            task_job_id = TASK_JOB_ID.get()
+            if task_job_id is not None:
+                return task_job_id
+        return self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
 # Wrapper around a logging.LoggerAdapter instance.
 # This allows us to obtain a ComputeModulesLoggerAdapter instance just once,
 # while having the flexibility to swap out the underlying `logging.LoggerAdapter` being used.
@@ -77,7 +103,7 @@ class ComputeModulesLoggerAdapter(_LoggerAdapter):
     def _p_set_log_adapter(self) -> None:
         self.adapter = logging.LoggerAdapter(
             logger=self._p_logger,
-            extra=dict(
+            extra=_LogContextExtra(
                 process_id=str(self._p_process_id),
                 job_id=self._p_job_id,
             ),
@@ -125,4 +151,5 @@ COMPUTE_MODULES_ADAPTER_MANAGER = ComputeModulesAdapterManager()
 __all__ = [
     "COMPUTE_MODULES_ADAPTER_MANAGER",
     "ComputeModulesLoggerAdapter",
+    "TASK_JOB_ID",
 ]
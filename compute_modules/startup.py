@@ -13,21 +13,49 @@
 #  limitations under the License.
 
 
+import os
+from typing import Dict, Type
+
+from compute_modules.client.async_query_client import AsyncInternalQueryService
 from compute_modules.client.internal_query_client import InternalQueryService
+from compute_modules.client.supervisor import SUPERVISOR_PID_ENV
 from compute_modules.function_registry.function_registry import (
+    FUNCTION_OPTIONS,
+    FUNCTION_OUTPUT_TYPES,
     FUNCTION_SCHEMA_CONVERSIONS,
     FUNCTION_SCHEMAS,
     IS_FUNCTION_CONTEXT_TYPED,
     REGISTERED_FUNCTIONS,
 )
 
+EXECUTION_MODE = "EXECUTION_MODE"
+EXECUTION_MODES: Dict[str, Type[InternalQueryService]] = {
+    "multiprocessing": InternalQueryService,
+    "asyncio": AsyncInternalQueryService,
+}
+
+
+def _is_worker_process() -> bool:
+    """Worker processes that are not forked (see WORKER_START_METHOD) import the main module again,
+    which must not start another Compute Module
+    """
+    supervisor_pid = os.environ.get(SUPERVISOR_PID_ENV)
+    return supervisor_pid is not None and supervisor_pid != str(os.getpid())
+
 
 def start_compute_module() -> None:
     """Starts a Compute Module that will Poll for jobs indefinitely"""
-    query_client = InternalQueryService(
+    if _is_worker_process():
+        return
+    execution_mode = os.environ.get(EXECUTION_MODE, "multiprocessing")
+    if execution_mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown {EXECUTION_MODE} {execution_mode}, must be one of: {list(EXECUTION_MODES)}")
+    query_client = EXECUTION_MODES[execution_mode](
         registered_functions=REGISTERED_FUNCTIONS,
         function_schemas=FUNCTION_SCHEMAS,
         function_schema_conversions=FUNCTION_SCHEMA_CONVERSIONS,
         is_function_context_typed=IS_FUNCTION_CONTEXT_TYPED,
+        function_options=FUNCTION_OPTIONS,
+        function_output_types=FUNCTION_OUTPUT_TYPES,
     )
     query_client.start()
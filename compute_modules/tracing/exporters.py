@@ -0,0 +1,88 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import IO, Any, Dict, List, Optional, Sequence
+
+from .spans import Span
+
+SPAN_EXPORTERS: List["SpanExporter"] = []
+
+
+class SpanExporter(ABC):
+    """Receives the spans of sampled jobs. Subclass it to send spans to a tracing backend & register it
+    with `add_span_exporter`.
+
+    Each worker process exports the spans of the jobs it handled, so exporters must be picklable
+    when worker processes are not forked (see WORKER_START_METHOD). `export` may be called from several threads
+    """
+
+    @abstractmethod
+    def export(self, spans: Sequence[Span]) -> None:
+        """Called with all spans of a job's trace once its result has been reported"""
+
+    def shutdown(self) -> None:
+        """Called in each worker process once it has stopped handling jobs"""
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends spans to a file as JSON, one span per line. All worker processes may share the same file,
+    as the spans of a trace are written at once to the end of the file
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: Optional[IO[bytes]] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"path": self.path}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["path"])  # type: ignore[misc]
+
+    def export(self, spans: Sequence[Span]) -> None:
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans).encode("utf-8")
+        with self._lock:
+            # Forked worker processes open the file themselves, rather than sharing the parent's buffer
+            if self._file is None or self._pid != os.getpid():
+                # Unbuffered, so each trace is appended with a single write
+                self._file = open(self.path, "ab", buffering=0)
+                self._pid = os.getpid()
+            self._file.write(lines)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+            self._file = None
+
+
+def add_span_exporter(exporter: SpanExporter) -> None:
+    """Register an exporter for the spans of sampled jobs, in addition to the TRACE_FILE exporter if it is set.
+    Exporters must be registered before the Compute Module starts
+    """
+    SPAN_EXPORTERS.append(exporter)
+
+
+__all__ = [
+    "add_span_exporter",
+    "JsonLinesSpanExporter",
+    "SpanExporter",
+]
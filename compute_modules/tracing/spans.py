@@ -0,0 +1,173 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import random
+import time
+import traceback
+from contextvars import ContextVar, Token
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Type
+
+# Offset from `time.perf_counter()` to the Unix time, as spans are timed with the former
+_UNIX_TIME_OFFSET = time.time() - time.perf_counter()
+
+
+def _new_id(bits: int) -> str:
+    # The random module is re-seeded in forked processes, so worker processes do not generate the same IDs
+    return format(random.getrandbits(bits), f"0{bits // 4}x")
+
+
+class Span:
+    """A timed operation within the trace of a job.
+
+    The span of the job itself is the root of its trace. The spans of its stages, and any span started
+    with `start_span` while handling the job, are its descendants.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attributes", "error", "_trace")
+
+    def __init__(
+        self,
+        name: str,
+        trace: Optional[List["Span"]],
+        trace_id: str = "",
+        parent_id: Optional[str] = None,
+        start: Optional[float] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(64) if trace is not None else ""
+        self.parent_id = parent_id
+        self.start = time.perf_counter() if start is None else start
+        """`time.perf_counter()` when the span started"""
+        self.end: Optional[float] = None
+        self.attributes = attributes if attributes is not None else {}
+        self.error: Optional[str] = None
+        # The finished spans of the trace, shared by all of its spans. None if the span is not recorded
+        self._trace = trace
+
+    def is_recording(self) -> bool:
+        """Whether the span is part of a sampled trace. Spans of traces that are not sampled ignore all updates"""
+        return self._trace is not None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self._trace is not None:
+            self.attributes[key] = value
+
+    def record_exception(self, e: BaseException) -> None:
+        if self._trace is not None:
+            self.error = "".join(traceback.format_exception_only(type(e), e)).strip()
+
+    def child(self, name: str, start: Optional[float] = None, **attributes: Any) -> "Span":
+        """Start a span within this one, which must then be ended"""
+        if self._trace is None:
+            return self
+        return Span(name, self._trace, self.trace_id, self.span_id, start, attributes)
+
+    def finish(self, end: Optional[float] = None) -> None:
+        """End the span, at `end` (a `time.perf_counter()` value) or else now"""
+        if self._trace is not None and self.end is None:
+            self.end = time.perf_counter() if end is None else end
+            self._trace.append(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.end if self.end is not None else self.start
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": _UNIX_TIME_OFFSET + self.start,
+            "end_time": _UNIX_TIME_OFFSET + end,
+            "duration_ms": (end - self.start) * 1000,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+NON_RECORDING_SPAN = Span("", trace=None)
+
+CURRENT_SPAN: ContextVar[Span] = ContextVar("compute_modules_current_span", default=NON_RECORDING_SPAN)
+
+
+def get_current_span() -> Span:
+    """The innermost span of the job being handled by the current thread or asyncio task.
+
+    Returns a span that is not recorded when the job's trace is not sampled (or tracing is disabled),
+    so attributes can always be set on it. Threads started by a function do not inherit its current span
+    """
+    return CURRENT_SPAN.get()
+
+
+class _SpanScope:
+    """Makes a span the current span while it is entered. Unless `end_on_exit` is False,
+    the span is ended on exit, recording the exception that was raised if any
+    """
+
+    __slots__ = ("span", "end_on_exit", "_token")
+
+    def __init__(self, span: Span, end_on_exit: bool = True) -> None:
+        self.span = span
+        self.end_on_exit = end_on_exit
+        self._token: Optional[Token[Span]] = None
+
+    def __enter__(self) -> Span:
+        if self.span.is_recording():
+            self._token = CURRENT_SPAN.set(self.span)
+        return self.span
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        exc_traceback: Optional[TracebackType],
+    ) -> None:
+        if self._token is None:
+            return
+        CURRENT_SPAN.reset(self._token)
+        if not self.end_on_exit:
+            return
+        if exc_value is not None:
+            self.span.record_exception(exc_value)
+        self.span.finish()
+
+
+_NON_RECORDING_SCOPE = _SpanScope(NON_RECORDING_SPAN)
+
+
+def start_span(name: str, **attributes: Any) -> _SpanScope:
+    """Context manager timing a child span of the current span, which is the current span while it is entered:
+
+    ```
+    with start_span("load_model", model=name) as span:
+        ...
+        span.set_attribute("cached", False)
+    ```
+
+    Nothing is recorded unless the job's trace is sampled, in which case the span is exported with the trace
+    once the job's result has been reported
+    """
+    parent = CURRENT_SPAN.get()
+    if not parent.is_recording():
+        return _NON_RECORDING_SCOPE
+    return _SpanScope(parent.child(name, **attributes))
+
+
+__all__ = [
+    "get_current_span",
+    "Span",
+    "start_span",
+]
@@ -0,0 +1,126 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import os
+import random
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Type
+
+from compute_modules.logging.internal import get_internal_logger
+
+from .exporters import SpanExporter
+from .spans import _NON_RECORDING_SCOPE, Span, _new_id, _SpanScope
+
+DEFAULT_TRACE_SAMPLE_RATE = 0.1
+# Traces of jobs whose result is never reported are not exported, so bound how many are kept
+MAX_OPEN_TRACES = 1024
+
+
+class _ReportScope(_SpanScope):
+    """Makes the root span of a job current while its result is reported, then ends & exports its trace"""
+
+    __slots__ = ("tracer",)
+
+    def __init__(self, tracer: "Tracer", root: Span) -> None:
+        super().__init__(root)
+        self.tracer = tracer
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        exc_traceback: Optional[TracebackType],
+    ) -> None:
+        super().__exit__(exc_type, exc_value, exc_traceback)
+        self.tracer._export(self.span)
+
+
+class Tracer:
+    """Samples the jobs to trace & keeps the root span of each traced job until its result has been reported.
+
+    A job's trace starts when it is fetched, so it includes how long it took to fetch & decode, and is exported
+    once its result has been reported. Jobs that are not sampled cost a dict lookup at each stage.
+    A worker process calls `bind` with its process ID first.
+    """
+
+    def __init__(self, exporters: List[SpanExporter], sample_rate: float = DEFAULT_TRACE_SAMPLE_RATE) -> None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f"sample_rate must be between 0 & 1, got {sample_rate}")
+        self.exporters = exporters
+        self.sample_rate = sample_rate if exporters else 0.0
+        self.process_id = -1
+        # Root spans of the traced jobs whose result has not been reported yet, by job ID
+        self._jobs: Dict[str, Span] = {}
+
+    def bind(self, process_id: int) -> None:
+        self.process_id = process_id
+
+    def start_job(self, job: Dict[str, Any], started: float, payload_bytes: int) -> None:
+        """Trace the job if it is sampled. `started` is the `time.perf_counter()` value when polling for it started"""
+        if self.sample_rate == 0 or random.random() >= self.sample_rate or len(self._jobs) >= MAX_OPEN_TRACES:
+            return
+        v1 = job.get("computeModuleJobV1", {})
+        job_id = v1.get("jobId")
+        if job_id is None:
+            return
+        attributes = {
+            "job_id": job_id,
+            "query_type": v1.get("queryType"),
+            "payload_bytes": payload_bytes,
+            "process_id": self.process_id,
+            "pid": os.getpid(),
+        }
+        root = Span("job", [], _new_id(128), start=started, attributes=attributes)
+        root.child("get_job_or_none", start=started, payload_bytes=payload_bytes).finish()
+        self._jobs[job_id] = root
+
+    def activate(self, job_id: str) -> _SpanScope:
+        """Context manager making the root span of the job current while it is handled, if the job is traced"""
+        root = self._jobs.get(job_id) if self._jobs else None
+        return _SpanScope(root, end_on_exit=False) if root is not None else _NON_RECORDING_SCOPE
+
+    def record(self, job_id: str, name: str, start: float, end: float, **attributes: Any) -> None:
+        """Add a span timed by the caller to the trace of the job, if it is traced"""
+        root = self._jobs.get(job_id) if self._jobs else None
+        if root is not None:
+            root.child(name, start=start, **attributes).finish(end)
+
+    def report(self, job_id: str) -> _SpanScope:
+        """Context manager making the root span of the job current while its result is reported,
+        then ending it & exporting the job's trace
+        """
+        root = self._jobs.pop(job_id, None) if self._jobs else None
+        return _ReportScope(self, root) if root is not None else _NON_RECORDING_SCOPE
+
+    def _export(self, root: Span) -> None:
+        spans = root._trace or []
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                get_internal_logger().error(f"Failed to export the spans of job {root.attributes['job_id']}: {str(e)}")
+
+    def shutdown(self) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.shutdown()
+            except Exception as e:
+                get_internal_logger().error(f"Failed to shut down span exporter: {str(e)}")
+
+
+__all__ = [
+    "DEFAULT_TRACE_SAMPLE_RATE",
+    "Tracer",
+]
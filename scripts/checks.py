@@ -24,6 +24,7 @@ from typing import Iterator, List, Tuple
 SOURCE_DIR = "compute_modules"
 TESTS_DIR = "tests"
 SCRIPTS_DIR = "scripts"
+BENCHMARKS_DIR = "benchmarks"
 LICENSE_FILE = "LICENSE"
 FILES_WITH_LICENSE_NEEDED_GLOB_EXPR = "*.py"
 
@@ -36,24 +37,24 @@ def test() -> None:
 
 def check_format() -> None:
     """Runs linter 'checks'. Raises exception if any linting exceptions exist"""
-    black_result = subprocess.run(["black", "--check", "--diff", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR])
-    ruff_result = subprocess.run(["ruff", "check", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR])
-    isort_result = subprocess.run(["isort", "--check", "--diff", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR])
+    black_result = subprocess.run(["black", "--check", "--diff", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR, BENCHMARKS_DIR])
+    ruff_result = subprocess.run(["ruff", "check", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR, BENCHMARKS_DIR])
+    isort_result = subprocess.run(["isort", "--check", "--diff", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR, BENCHMARKS_DIR])
     exit_code = 1 if black_result.returncode or ruff_result.returncode or isort_result.returncode else 0
     sys.exit(exit_code)
 
 
 def check_mypy() -> None:
     """Runs mypy checks. Raises exception if any mypy exceptions exist"""
-    result = subprocess.run(["mypy", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR])
+    result = subprocess.run(["mypy", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR, BENCHMARKS_DIR])
     sys.exit(result.returncode)
 
 
 def format() -> None:
     """Formats all files to fix any linter issues that can be automatically fixed"""
-    subprocess.run(["black", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR])
-    subprocess.run(["ruff", "--fix", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR])
-    subprocess.run(["isort", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR])
+    subprocess.run(["black", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR, BENCHMARKS_DIR])
+    subprocess.run(["ruff", "--fix", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR, BENCHMARKS_DIR])
+    subprocess.run(["isort", SOURCE_DIR, TESTS_DIR, SCRIPTS_DIR, BENCHMARKS_DIR])
 
 
 def _get_license_content() -> Tuple[str, int]:
@@ -79,7 +80,8 @@ def _iterate_licensed_files(num_lines: int) -> Iterator[Tuple[str, str]]:
     source_files = list(Path(SOURCE_DIR).rglob(FILES_WITH_LICENSE_NEEDED_GLOB_EXPR))
     test_files = list(Path(TESTS_DIR).rglob(FILES_WITH_LICENSE_NEEDED_GLOB_EXPR))
     script_files = list(Path(SCRIPTS_DIR).rglob(FILES_WITH_LICENSE_NEEDED_GLOB_EXPR))
-    for path in chain(source_files, test_files, script_files):
+    benchmark_files = list(Path(BENCHMARKS_DIR).rglob(FILES_WITH_LICENSE_NEEDED_GLOB_EXPR))
+    for path in chain(source_files, test_files, script_files, benchmark_files):
         filename = str(path)
         file_head = _get_n_lines_of_file(filename=filename, num_lines=num_lines)
         yield filename, file_head
@@ -0,0 +1,149 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+from compute_modules.caching import CachePolicy, ResultCache
+from compute_modules.caching.result_cache import cache_key
+from compute_modules.client.async_query_client import AsyncInternalQueryService
+from compute_modules.function_registry.types import FunctionOptions
+from tests.conftest import ServiceFactory
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _job(job_id: str, query: Any, auth_header: str = "") -> Dict[str, Any]:
+    return {"computeModuleJobV1": {"jobId": job_id, "queryType": "square", "query": query, "authHeader": auth_header}}
+
+
+def test_key_does_not_depend_on_key_order_and_includes_selected_context_fields() -> None:
+    context = {"jobId": "1", "authHeader": "user-a"}
+    assert cache_key("f", {"a": 1, "b": [1, 2]}, context, ()) == cache_key("f", {"b": [1, 2], "a": 1}, {}, ())
+    assert cache_key("f", {"a": 1}, context, ()) != cache_key("g", {"a": 1}, context, ())
+    assert cache_key("f", 1, context, ("authHeader",)) != cache_key("f", 1, {"authHeader": "user-b"}, ("authHeader",))
+
+
+def test_least_recently_used_results_are_evicted() -> None:
+    cache = ResultCache(CachePolicy(max_entries=2))
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == (True, b"1")
+    cache.put("c", b"3")
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, b"1")
+    assert cache.get("c") == (True, b"3")
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.entries) == (3, 1, 1, 2)
+
+
+def test_cache_is_bounded_in_bytes() -> None:
+    cache = ResultCache(CachePolicy(max_bytes=20))
+    cache.put("a", b'"' + b"x" * 10 + b'"')
+    cache.put("b", b'"' + b"y" * 10 + b'"')
+    assert cache.get("a") == (False, None)
+    assert cache.stats().bytes == 12
+    # Results larger than the whole cache are not cached, rather than evicting everything else
+    cache.put("c", b'"' + b"z" * 100 + b'"')
+    assert cache.get("c") == (False, None)
+    assert cache.get("b") == (True, b'"' + b"y" * 10 + b'"')
+
+
+def test_results_expire_after_ttl() -> None:
+    clock = FakeClock()
+    cache = ResultCache(CachePolicy(ttl=10), clock=clock)
+    cache.put("a", b"null")
+    clock.now = 9.9
+    assert cache.get("a") == (True, b"null")
+    clock.now = 10
+    assert cache.get("a") == (False, None)
+    assert cache.stats().expirations == 1
+    assert cache.stats().entries == 0
+
+
+def test_invalid_policy_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        CachePolicy(max_entries=0)
+    with pytest.raises(ValueError):
+        CachePolicy(ttl=0)
+
+
+def test_cache_hits_skip_input_conversion_and_the_function(
+    make_service: ServiceFactory, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls: List[Any] = []
+
+    def square(context: Any, event: Any) -> Any:
+        calls.append(event)
+        return event["x"] ** 2
+
+    options = {"square": FunctionOptions(cache=CachePolicy(context_fields=("authHeader",)))}
+    service = make_service({"square": square}, function_options=options)
+    conversions: List[Any] = []
+    convert_inputs = service._convert_inputs
+
+    def counting_convert_inputs(*args: Any) -> Any:
+        conversions.append(args)
+        return convert_inputs(*args)
+
+    monkeypatch.setattr(service, "_convert_inputs", counting_convert_inputs)
+    # Results of cached functions are encoded as soon as they are returned
+    assert service.execute_job(_job("1", {"x": 3}, "user-a")) == ("1", b"9")
+    assert service.execute_job(_job("2", {"x": 3}, "user-a")) == ("2", b"9")
+    assert service.execute_job(_job("3", {"x": 3}, "user-b")) == ("3", b"9")
+    assert len(calls) == len(conversions) == 2
+    assert (service.cache_stats()["square"].hits, service.cache_stats()["square"].misses) == (1, 2)
+
+
+def test_failures_are_not_cached(make_service: ServiceFactory) -> None:
+    calls: List[Any] = []
+
+    def square(context: Any, event: Any) -> Any:
+        calls.append(event)
+        raise ValueError("Not now")
+
+    service = make_service({"square": square}, function_options={"square": FunctionOptions(cache=CachePolicy())})
+    service.execute_job(_job("1", {"x": 3}))
+    service.execute_job(_job("2", {"x": 3}))
+    assert len(calls) == 2
+
+
+def test_async_functions_are_cached(make_service: ServiceFactory) -> None:
+    calls: List[Any] = []
+
+    async def square(context: Any, event: Any) -> Any:
+        calls.append(event)
+        return event["x"] ** 2
+
+    service = make_service(
+        {"square": square},
+        function_options={"square": FunctionOptions(cache=CachePolicy())},
+        service_class=AsyncInternalQueryService,
+    )
+    assert isinstance(service, AsyncInternalQueryService)
+
+    async def run() -> List[Any]:
+        return [await service.get_result_async("square", {"x": 4}, {}) for _ in range(3)]
+
+    assert asyncio.run(run()) == [b"16", b"16", b"16"]
+    assert len(calls) == 1
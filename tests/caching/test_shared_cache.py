@@ -0,0 +1,157 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import dataclasses
+import datetime
+import json
+import multiprocessing
+import os
+from typing import Any, List, Set
+
+import pytest
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.caching import CachePolicy, SharedResultCache
+from compute_modules.function_registry.types import FunctionOptions
+from tests.conftest import ServiceFactory
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cache(tmp_path: Any, **policy: Any) -> SharedResultCache:
+    return SharedResultCache(CachePolicy(shared=True, **policy), path=os.path.join(tmp_path, "cache.sqlite"))
+
+
+def test_results_are_shared_between_processes(tmp_path: Any) -> None:
+    cache = _cache(tmp_path)
+    cache.put("parent", b'{"from":"parent"}')
+    # Forked children must open their own connection rather than use the parent's
+    process = multiprocessing.get_context("fork").Process(target=cache.put, args=("child", b"[1,2,3]"))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert cache.get("child") == (True, b"[1,2,3]")
+    assert cache.get("parent") == (True, b'{"from":"parent"}')
+    assert _cache(tmp_path).get("parent") == (True, b'{"from":"parent"}')
+
+
+def test_least_recently_used_results_are_evicted(tmp_path: Any) -> None:
+    clock = FakeClock()
+    cache = SharedResultCache(CachePolicy(max_entries=2, max_bytes=20), os.path.join(tmp_path, "c.sqlite"), clock)
+    for key in ("a", "b"):
+        clock.now += 1
+        cache.put(key, f'"{key * 5}"'.encode())
+    clock.now += 1
+    assert cache.get("a") == (True, b'"aaaaa"')
+    clock.now += 1
+    cache.put("c", b'"ccccc"')
+    assert cache.get("b") == (False, None)
+    clock.now += 1
+    # Results are measured as JSON: "ccccc" is 7 bytes, so adding 12 more bytes evicts "a" to stay within 20 bytes
+    cache.put("d", b'"' + b"d" * 10 + b'"')
+    stats = cache.stats()
+    assert (stats.entries, stats.bytes, stats.evictions) == (2, 19, 2)
+    assert cache.get("a") == (False, None)
+    assert cache.get("d") == (True, b'"' + b"d" * 10 + b'"')
+
+
+def test_results_expire_after_ttl(tmp_path: Any) -> None:
+    clock = FakeClock()
+    cache = SharedResultCache(CachePolicy(ttl=10), os.path.join(tmp_path, "c.sqlite"), clock)
+    cache.put("a", b"1")
+    clock.now = 10
+    assert cache.get("a") == (False, None)
+    stats = cache.stats()
+    assert (stats.expirations, stats.entries, stats.misses) == (1, 0, 1)
+
+
+@pytest.mark.usefixtures("isolated_loggers")
+def test_corrupt_cache_is_recreated(tmp_path: Any) -> None:
+    path = os.path.join(tmp_path, "cache.sqlite")
+    with open(path, "wb") as f:
+        f.write(b"not a database" * 1000)
+    cache = SharedResultCache(CachePolicy(), path)
+    cache.put("a", b"1")
+    assert cache.get("a") == (True, b"1")
+
+
+def test_workers_share_cached_results(make_service: ServiceFactory, tmp_path: Any) -> None:
+    calls: List[Any] = []
+
+    def square(context: Any, event: Any) -> Any:
+        calls.append(event)
+        return event["x"] ** 2
+
+    options = {"square": FunctionOptions(cache=CachePolicy(shared=True))}
+    workers = [
+        make_service({"square": square}, function_options=options, RESULT_CACHE_DIR=str(tmp_path)) for _ in range(2)
+    ]
+    for i, worker in enumerate(workers):
+        job = {"computeModuleJobV1": {"jobId": str(i), "queryType": "square", "query": {"x": 3}}}
+        assert worker.execute_job(job) == (str(i), b"9")
+    assert len(calls) == 1
+    assert workers[1].cache_stats()["square"].hits == 1
+
+
+@dataclasses.dataclass
+class Appointment:
+    when: datetime.datetime
+    tags: Set[str]
+
+
+@pytest.mark.parametrize(
+    "output_type, result, expected",
+    [
+        (Appointment, Appointment(datetime.datetime(2024, 1, 1), {"a"}), {"when": 1704067200000, "tags": ["a"]}),
+        (datetime.datetime, datetime.datetime(2024, 1, 1), 1704067200000),
+        (None, Appointment(datetime.datetime(2024, 1, 1), {"a"}), {"when": 1704067200000, "tags": ["a"]}),
+    ],
+)
+def test_cache_hits_report_the_same_bytes_as_the_first_job(
+    runtime: LocalRuntime,
+    make_service: ServiceFactory,
+    tmp_path: Any,
+    output_type: Any,
+    result: Any,
+    expected: Any,
+) -> None:
+    def schedule(context: Any, event: Any) -> Any:
+        return result
+
+    options = {"schedule": FunctionOptions(cache=CachePolicy(shared=True))}
+    output_types = {"schedule": output_type} if output_type is not None else None
+    workers = [
+        make_service(
+            {"schedule": schedule},
+            function_options=options,
+            function_output_types=output_types,
+            RESULT_CACHE_DIR=str(tmp_path),
+        )
+        for _ in range(2)
+    ]
+    for i, worker in enumerate(workers):
+        runtime.enqueue_job("schedule", {"x": 1}, job_id=str(i))
+        job = worker.get_job_or_none()
+        assert job is not None
+        worker.handle_job(job)
+    assert workers[1].cache_stats()["schedule"].hits == 1
+    assert runtime.results["1"] == runtime.results["0"]
+    assert json.loads(runtime.results["0"]) == expected
@@ -0,0 +1,175 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import dataclasses
+import datetime
+import json
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, List, Set
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.caching import CoalescePolicy, SingleFlight
+from compute_modules.client.async_query_client import AsyncInternalQueryService
+from compute_modules.function_registry.types import FunctionOptions
+from tests.conftest import ServiceFactory
+
+
+def _flight(tmp_path: Any, **policy: Any) -> SingleFlight:
+    return SingleFlight(CoalescePolicy(**policy), path=os.path.join(tmp_path, "flights.sqlite"))
+
+
+def test_waiters_receive_the_leaders_result(tmp_path: Any) -> None:
+    flight = _flight(tmp_path)
+    assert flight.begin("key")
+    # Other worker processes must open their own connection rather than use the parent's
+    process = multiprocessing.get_context("fork").Process(target=lambda: os._exit(0 if not flight.begin("key") else 1))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    threading.Timer(0.05, flight.finish, args=("key", b'{"x":[1,2]}')).start()
+    assert flight.wait("key") == (True, b'{"x":[1,2]}')
+
+
+def test_waiters_execute_on_their_own_when_the_leader_fails(tmp_path: Any) -> None:
+    flight = _flight(tmp_path)
+    assert flight.begin("key")
+    assert not flight.begin("key")
+    flight.fail("key")
+    started = time.monotonic()
+    assert flight.wait("key") == (False, None)
+    assert time.monotonic() - started < 1
+    assert flight.begin("key")
+
+
+def test_flights_of_dead_leaders_are_taken_over(tmp_path: Any) -> None:
+    flight = _flight(tmp_path)
+    process = multiprocessing.get_context("fork").Process(target=lambda: os._exit(0 if flight.begin("key") else 1))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert flight.poll("key") == (True, False, None)
+    assert flight.begin("key")
+
+
+def test_waiting_is_capped_by_the_job_timeout(tmp_path: Any) -> None:
+    flight = _flight(tmp_path, wait_timeout=10)
+    assert flight.begin("key")
+    started = time.monotonic()
+    assert flight.wait("key", timeout=0.05) == (False, None)
+    assert time.monotonic() - started < 1
+
+
+def test_identical_jobs_execute_once(make_service: ServiceFactory, tmp_path: Any) -> None:
+    calls: List[Any] = []
+    started, release = threading.Event(), threading.Event()
+
+    def square(context: Any, event: Any) -> Any:
+        calls.append(event)
+        started.set()
+        release.wait(5)
+        return event["x"] ** 2
+
+    options = {"square": FunctionOptions(coalesce=CoalescePolicy())}
+    workers = [
+        make_service({"square": square}, function_options=options, RESULT_CACHE_DIR=str(tmp_path)) for _ in range(2)
+    ]
+    results: List[Any] = [None, None]
+
+    def execute(i: int) -> None:
+        job = {"computeModuleJobV1": {"jobId": str(i), "queryType": "square", "query": {"x": 3}}}
+        results[i] = workers[i].execute_job(job)
+
+    threads = [threading.Thread(target=execute, args=(i,)) for i in range(2)]
+    threads[0].start()
+    assert started.wait(5)
+    threads[1].start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [("0", b"9"), ("1", b"9")]
+    assert len(calls) == 1
+
+
+@dataclasses.dataclass
+class Appointment:
+    when: datetime.datetime
+    tags: Set[str]
+
+
+def test_waiters_report_the_same_bytes_as_the_leader(
+    runtime: LocalRuntime, make_service: ServiceFactory, tmp_path: Any
+) -> None:
+    calls: List[Any] = []
+    started, release = threading.Event(), threading.Event()
+
+    def schedule(context: Any, event: Any) -> Appointment:
+        calls.append(event)
+        started.set()
+        release.wait(5)
+        return Appointment(datetime.datetime(2024, 1, 1), {"a"})
+
+    options = {"schedule": FunctionOptions(coalesce=CoalescePolicy())}
+    workers = [
+        make_service(
+            {"schedule": schedule},
+            function_options=options,
+            function_output_types={"schedule": Appointment},
+            RESULT_CACHE_DIR=str(tmp_path),
+        )
+        for _ in range(2)
+    ]
+
+    def handle(i: int) -> None:
+        workers[i].handle_job({"computeModuleJobV1": {"jobId": str(i), "queryType": "schedule", "query": {}}})
+
+    threads = [threading.Thread(target=handle, args=(i,)) for i in range(2)]
+    threads[0].start()
+    assert started.wait(5)
+    threads[1].start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert runtime.results["1"] == runtime.results["0"]
+    assert json.loads(runtime.results["0"]) == {"when": 1704067200000, "tags": ["a"]}
+
+
+def test_identical_coroutine_jobs_execute_once(make_service: ServiceFactory, tmp_path: Any) -> None:
+    calls: List[Any] = []
+
+    async def square(context: Any, event: Any) -> Any:
+        calls.append(event)
+        await asyncio.sleep(0.1)
+        return event["x"] ** 2
+
+    service = make_service(
+        {"square": square},
+        function_options={"square": FunctionOptions(coalesce=CoalescePolicy())},
+        service_class=AsyncInternalQueryService,
+        RESULT_CACHE_DIR=str(tmp_path),
+    )
+    assert isinstance(service, AsyncInternalQueryService)
+
+    async def run() -> List[Any]:
+        return list(await asyncio.gather(*(service.get_result_async("square", {"x": 3}, {}) for _ in range(3))))
+
+    assert asyncio.run(run()) == [b"9", b"9", b"9"]
+    assert len(calls) == 1
@@ -0,0 +1,152 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import ssl
+import tempfile
+from typing import Awaitable, Callable, Dict, Iterator, List, Tuple
+
+import pytest
+
+from benchmarks.runtime_stand_in import _generate_self_signed_cert
+from compute_modules.client.async_connection_pool import AsyncHTTPSConnectionPool
+
+RESPONSES: Dict[str, bytes] = {
+    "/length": b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello",
+    "/chunked": b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\n\r\n",
+    "/close": b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok",
+    "/empty": b"HTTP/1.1 204 No Content\r\n\r\n",
+}
+
+
+class ScriptedServer:
+    """TLS server answering each request with the canned response for its path"""
+
+    def __init__(self, cert_path: str, key_path: str) -> None:
+        self.cert_path = cert_path
+        self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.ssl_context.load_cert_chain(cert_path, key_path)
+        self.connections = 0
+        self.writers: List[asyncio.StreamWriter] = []
+        self.port = 0
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.close_connections()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def close_connections(self) -> None:
+        for writer in self.writers:
+            writer.close()
+        self.writers.clear()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self.writers.append(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                headers = dict(line.split(": ", 1) for line in header_lines if line)
+                await reader.readexactly(int(headers.get("Content-Length", 0)))
+                response = RESPONSES[request_line.split(" ")[1]]
+                writer.write(response)
+                await writer.drain()
+                if b"Connection: close" in response:
+                    writer.close()
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+
+@pytest.fixture(scope="module")
+def certificate() -> Iterator[Tuple[str, str]]:
+    with tempfile.TemporaryDirectory() as directory:
+        yield _generate_self_signed_cert(directory)
+
+
+Scenario = Callable[[ScriptedServer, AsyncHTTPSConnectionPool], Awaitable[None]]
+
+
+def _run(certificate: Tuple[str, str], scenario: Scenario) -> None:
+    async def main() -> None:
+        server = ScriptedServer(*certificate)
+        await server.start()
+        pool = AsyncHTTPSConnectionPool(
+            host="localhost", port=server.port, context=ssl.create_default_context(cafile=certificate[0])
+        )
+        try:
+            await scenario(server, pool)
+        finally:
+            pool.close()
+            await server.stop()
+
+    asyncio.run(main())
+
+
+def test_reads_content_length_and_chunked_bodies_over_one_connection(certificate: Tuple[str, str]) -> None:
+    async def scenario(server: ScriptedServer, pool: AsyncHTTPSConnectionPool) -> None:
+        response = await pool.request("GET", "/length", headers={})
+        assert (response.status, response.body, response.will_close) == (200, b"hello", False)
+        response = await pool.request("POST", "/chunked", headers={}, body="payload")
+        assert response.body == b"hello world"
+        response = await pool.request("GET", "/empty", headers={})
+        assert (response.status, response.body) == (204, b"")
+        assert server.connections == 1
+
+    _run(certificate, scenario)
+
+
+def test_connection_close_is_not_pooled(certificate: Tuple[str, str]) -> None:
+    async def scenario(server: ScriptedServer, pool: AsyncHTTPSConnectionPool) -> None:
+        response = await pool.request("GET", "/close", headers={})
+        assert (response.body, response.will_close) == (b"ok", True)
+        assert pool._idle == []
+        await pool.request("GET", "/length", headers={})
+        assert server.connections == 2
+
+    _run(certificate, scenario)
+
+
+def test_stale_connection_reconnects(certificate: Tuple[str, str]) -> None:
+    async def scenario(server: ScriptedServer, pool: AsyncHTTPSConnectionPool) -> None:
+        await pool.request("GET", "/length", headers={})
+        assert len(pool._idle) == 1
+        server.close_connections()
+        await asyncio.sleep(0.05)
+        response = await pool.request("GET", "/length", headers={})
+        assert response.body == b"hello"
+        assert server.connections == 2
+
+    _run(certificate, scenario)
+
+
+@pytest.mark.usefixtures("isolated_loggers")
+def test_stale_connection_detected_mid_request_is_retried(certificate: Tuple[str, str]) -> None:
+    """A pooled connection that looks alive but is closed while the request is sent is retried on a new one"""
+
+    async def scenario(server: ScriptedServer, pool: AsyncHTTPSConnectionPool) -> None:
+        await pool.request("GET", "/length", headers={})
+        # Close the server side without giving the client a chance to notice before the next request
+        server.close_connections()
+        response = await pool.request("GET", "/length", headers={})
+        assert response.body == b"hello"
+        assert server.connections == 2
+
+    _run(certificate, scenario)
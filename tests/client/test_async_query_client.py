@@ -0,0 +1,127 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import json
+import multiprocessing
+import threading
+from typing import Any, Dict, List
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.client.async_query_client import AsyncInternalQueryService
+from compute_modules.client.autoscaler import WorkerActivity
+from compute_modules.function_registry.types import FunctionOptions
+from compute_modules.logging import get_logger
+from tests.conftest import ServiceFactory
+
+
+def _logged_job_id() -> str:
+    """The job ID that a log line emitted here would contain"""
+    return str(get_logger("test_async_query_client").adapter.extra["job_id"])  # type: ignore[index]
+
+
+def _run_until_reported(service: AsyncInternalQueryService, runtime: LocalRuntime, num_jobs: int) -> None:
+    activity = WorkerActivity(multiprocessing.get_context())
+
+    async def main() -> None:
+        poll = asyncio.create_task(service.poll_forever_async(activity))
+        while len(runtime.results) < num_jobs:
+            await asyncio.sleep(0.01)
+        activity.request_drain()
+        await asyncio.wait_for(poll, timeout=10)
+
+    asyncio.run(main())
+
+
+def test_in_flight_jobs_are_capped(runtime: LocalRuntime, make_service: ServiceFactory) -> None:
+    in_flight = 0
+    max_in_flight = 0
+
+    async def slow(context: Dict[str, Any], event: Any) -> Any:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return event
+
+    service = make_service({"slow": slow}, service_class=AsyncInternalQueryService, MAX_CONCURRENT_COROUTINES="3")
+    assert isinstance(service, AsyncInternalQueryService)
+    for i in range(10):
+        runtime.enqueue_job("slow", i, job_id=str(i))
+    _run_until_reported(service, runtime, 10)
+    assert max_in_flight == 3
+    assert {job_id: json.loads(body) for job_id, body in runtime.results.items()} == {str(i): i for i in range(10)}
+
+
+def test_jobs_of_functions_without_free_slot_are_deferred(runtime: LocalRuntime, make_service: ServiceFactory) -> None:
+    in_flight = 0
+    max_in_flight = 0
+    finished: List[str] = []
+
+    async def slow(context: Dict[str, Any], event: Any) -> Any:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        finished.append("slow")
+        return event
+
+    async def fast(context: Dict[str, Any], event: Any) -> Any:
+        finished.append("fast")
+        return event
+
+    service = make_service(
+        {"slow": slow, "fast": fast},
+        function_options={"slow": FunctionOptions(max_concurrency=1), "fast": FunctionOptions()},
+        service_class=AsyncInternalQueryService,
+        MAX_CONCURRENT_COROUTINES="3",
+    )
+    assert isinstance(service, AsyncInternalQueryService)
+    service.function_quotas = service._function_quotas(multiprocessing.get_context("fork"))
+    for i in range(3):
+        runtime.enqueue_job("slow", i, job_id=f"slow-{i}")
+    for i in range(3):
+        runtime.enqueue_job("fast", i, job_id=f"fast-{i}")
+    _run_until_reported(service, runtime, 6)
+    assert max_in_flight == 1
+    # Deferred jobs of the slow function do not hold up the jobs of the fast function
+    assert finished[:3] == ["fast"] * 3
+    assert service.function_quotas is not None
+    assert service.function_quotas.usage()["slow"].executing == 0
+
+
+def test_sync_functions_run_in_threads_with_the_job_id_log_context(
+    runtime: LocalRuntime, make_service: ServiceFactory
+) -> None:
+    seen: List[Any] = []
+
+    def sync_function(context: Dict[str, Any], event: Any) -> Any:
+        seen.append((threading.current_thread() is threading.main_thread(), _logged_job_id(), context["jobId"]))
+        return event
+
+    async def async_function(context: Dict[str, Any], event: Any) -> Any:
+        seen.append((threading.current_thread() is threading.main_thread(), _logged_job_id(), context["jobId"]))
+        return event
+
+    service = make_service(
+        {"sync_function": sync_function, "async_function": async_function}, service_class=AsyncInternalQueryService
+    )
+    assert isinstance(service, AsyncInternalQueryService)
+    runtime.enqueue_job("sync_function", 1, job_id="sync-job")
+    runtime.enqueue_job("async_function", 2, job_id="async-job")
+    _run_until_reported(service, runtime, 2)
+    assert sorted(seen) == [(False, "sync-job", "sync-job"), (True, "async-job", "async-job")]
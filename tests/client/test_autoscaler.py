@@ -0,0 +1,136 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import multiprocessing
+import time
+
+import pytest
+
+from compute_modules.client.autoscaler import Autoscaler, LoadSignals, WorkerActivity
+from compute_modules.client.supervisor import WorkerSupervisor
+from compute_modules.logging import internal
+from compute_modules.logging.common import ComputeModulesAdapterManager
+
+BUSY = LoadSignals(utilization=0.95, empty_poll_ratio=0.0)
+IDLE = LoadSignals(utilization=0.05, empty_poll_ratio=1.0)
+STEADY = LoadSignals(utilization=0.5, empty_poll_ratio=0.5)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _autoscaler(clock: FakeClock) -> Autoscaler:
+    return Autoscaler(min_workers=1, max_workers=3, scale_up_delay=10, scale_down_delay=60, clock=clock)
+
+
+def test_scales_up_after_sustained_load_and_stops_at_max() -> None:
+    clock = FakeClock()
+    autoscaler = _autoscaler(clock)
+    workers = 1
+    for _ in range(10):
+        workers = autoscaler.desired_workers(workers, BUSY)
+        clock.now += 5
+    assert workers == 3
+
+
+def test_hysteresis() -> None:
+    """Load has to stay high (or low) for the whole delay, and load between both thresholds changes nothing"""
+    clock = FakeClock()
+    autoscaler = _autoscaler(clock)
+    assert autoscaler.desired_workers(2, BUSY) == 2
+    clock.now += 5
+    assert autoscaler.desired_workers(2, STEADY) == 2
+    clock.now += 10
+    # The busy period was interrupted, so it starts over
+    assert autoscaler.desired_workers(2, BUSY) == 2
+    for _ in range(20):
+        clock.now += 5
+        assert autoscaler.desired_workers(2, STEADY) == 2
+    assert autoscaler.desired_workers(2, IDLE) == 2
+    clock.now += 59
+    assert autoscaler.desired_workers(2, IDLE) == 2
+    clock.now += 1
+    assert autoscaler.desired_workers(2, IDLE) == 1
+    clock.now += 60
+    assert autoscaler.desired_workers(1, IDLE) == 1
+
+
+def test_host_pressure() -> None:
+    """A saturated CPU blocks scaling up, while low memory scales down straight away"""
+    clock = FakeClock()
+    autoscaler = _autoscaler(clock)
+    saturated = LoadSignals(utilization=0.95, empty_poll_ratio=0.0, cpu_load=1.5, memory_available=0.5)
+    for _ in range(10):
+        assert autoscaler.desired_workers(1, saturated) == 1
+        clock.now += 5
+    low_memory = LoadSignals(utilization=0.95, empty_poll_ratio=0.0, cpu_load=0.1, memory_available=0.01)
+    assert autoscaler.desired_workers(3, low_memory) == 2
+
+
+def test_worker_activity_is_shared_with_child_processes() -> None:
+    activity = WorkerActivity(multiprocessing.get_context())
+    process = multiprocessing.Process(target=activity.record_job)
+    process.start()
+    process.join()
+    activity.request_drain()
+    assert activity.snapshot().jobs_received == 1
+    assert activity.drain_requested()
+    activity.reset()
+    assert not activity.drain_requested()
+
+
+def test_job_still_executing_counts_as_busy() -> None:
+    activity = WorkerActivity(multiprocessing.get_context())
+    started_at = activity.start_executing()
+    time.sleep(0.1)
+    assert activity.snapshot().busy_seconds >= 0.1
+    activity.finish_executing(started_at)
+    busy_seconds = activity.snapshot().busy_seconds
+    time.sleep(0.05)
+    assert activity.snapshot().busy_seconds == busy_seconds
+
+
+def test_workers_saturated_by_a_job_longer_than_the_interval_scale_up(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Workers that neither finish a job nor poll during an interval are busy, not idle"""
+    monkeypatch.setattr(internal, "INTERNAL_LOGGER_ADAPTER", None)
+    monkeypatch.setattr(ComputeModulesAdapterManager, "adapters", {})
+    clock = FakeClock()
+    # Ignore the load on the host running the tests
+    autoscaler = Autoscaler(
+        min_workers=1,
+        max_workers=2,
+        interval=0.05,
+        scale_up_delay=0.1,
+        max_cpu_load=float("inf"),
+        min_memory_available=0,
+        clock=clock,
+    )
+    supervisor = WorkerSupervisor(target=lambda process_id, activity: None, num_workers=1, autoscaler=autoscaler)
+    slot = supervisor._slots[0]
+    slot.active = True
+    slot.activity.start_executing()
+    signals = []
+    for _ in range(3):
+        time.sleep(0.05)
+        signals.append(supervisor._load_signals(elapsed=0.05))
+    assert all(signal.utilization >= 0.8 and signal.empty_poll_ratio is None for signal in signals), signals
+    assert autoscaler.desired_workers(1, signals[0]) == 1
+    clock.now += 0.1
+    assert autoscaler.desired_workers(1, signals[1]) == 2
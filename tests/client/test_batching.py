@@ -0,0 +1,154 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import json
+import multiprocessing
+import threading
+import time
+from typing import Any, Dict, List
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.client.async_query_client import AsyncInternalQueryService
+from compute_modules.client.autoscaler import WorkerActivity
+from compute_modules.client.batching import AdaptiveBatchLimit
+from compute_modules.client.worker import PipelinedWorker
+from compute_modules.function_registry.types import FunctionOptions
+from tests.conftest import ServiceFactory
+
+BATCH = {"double": FunctionOptions(batch=True, max_batch_size=4, max_wait_ms=200)}
+
+
+def _job(job_id: str, query: Any, query_type: str = "double") -> Dict[str, Any]:
+    return {"computeModuleJobV1": {"jobId": job_id, "queryType": query_type, "query": query}}
+
+
+def _results(runtime: LocalRuntime) -> Dict[str, Any]:
+    return {job_id: json.loads(body) for job_id, body in runtime.results.items()}
+
+
+def test_batch_limit_halves_when_latency_per_job_degrades_and_grows_back() -> None:
+    limit = AdaptiveBatchLimit(max_batch_size=8)
+    limit.record(batch_size=8, seconds=0.8)
+    assert limit.limit == 8
+    limit.record(batch_size=8, seconds=1.6)
+    assert limit.limit == 4
+    for _ in range(10):
+        limit.record(batch_size=limit.limit, seconds=limit.limit * 0.1)
+    assert limit.limit == 8
+    # Batches that were not full say nothing about whether larger batches would pay off
+    limit.limit = 2
+    limit.record(batch_size=1, seconds=0.1)
+    assert limit.limit == 2
+
+
+def test_batch_limit_halves_when_over_latency_budget() -> None:
+    limit = AdaptiveBatchLimit(max_batch_size=8, latency_budget=1.0)
+    limit.record(batch_size=8, seconds=0.8)
+    limit.record(batch_size=8, seconds=1.2)
+    assert limit.limit == 4
+
+
+def test_execute_batch_calls_function_once_and_isolates_failures(make_service: ServiceFactory) -> None:
+    calls: List[List[Any]] = []
+
+    def double(context: List[Dict[str, Any]], events: List[Any]) -> List[Any]:
+        calls.append(events)
+        return [event * 2 if event >= 0 else ValueError("negative") for event in events]
+
+    service = make_service({"double": double}, BATCH)
+    now = time.time()
+    results = service.execute_batch([(_job("a", 1), now), (_job("b", -1), now), (_job("c", 3), now)])
+    assert calls == [[1, -1, 3]]
+    assert results == [("a", 2), ("b", {"exception": "negative"}), ("c", 6)]
+
+
+def test_failing_batch_is_retried_one_job_at_a_time(make_service: ServiceFactory) -> None:
+    calls: List[List[Any]] = []
+
+    def double(context: List[Dict[str, Any]], events: List[Any]) -> List[Any]:
+        calls.append(events)
+        if None in events:
+            raise TypeError("unsupported operand")
+        return [event * 2 for event in events]
+
+    service = make_service({"double": double}, BATCH)
+    now = time.time()
+    results = dict(service.execute_batch([(_job("a", 1), now), (_job("b", None), now), (_job("c", 3), now)]))
+    assert calls == [[1, None, 3], [1], [None], [3]]
+    assert results["a"] == 2 and results["c"] == 6
+    assert "unsupported operand" in results["b"]["exception"]
+
+
+def test_batch_rejects_expired_jobs_without_running_them(make_service: ServiceFactory) -> None:
+    calls: List[List[Any]] = []
+
+    def double(context: List[Dict[str, Any]], events: List[Any]) -> List[Any]:
+        calls.append(events)
+        return [event * 2 for event in events]
+
+    service = make_service({"double": double}, {"double": FunctionOptions(timeout=1, batch=True)})
+    results = dict(service.execute_batch([(_job("late", 1), time.time() - 5), (_job("on_time", 2), time.time())]))
+    assert calls == [[2]]
+    assert results == {"late": {"exception": "Job exceeded its timeout of 1s", "errorType": "TIMEOUT"}, "on_time": 4}
+
+
+def test_worker_batches_pending_jobs_of_the_same_function(runtime: LocalRuntime, make_service: ServiceFactory) -> None:
+    batches: List[List[Any]] = []
+
+    def double(context: List[Dict[str, Any]], events: List[Any]) -> List[Any]:
+        batches.append(events)
+        return [event * 2 for event in events]
+
+    def echo(context: Dict[str, Any], event: Any) -> Any:
+        return event
+
+    service = make_service({"double": double, "echo": echo}, BATCH)
+    for i in range(6):
+        runtime.enqueue_job("double", i, job_id=f"double-{i}")
+    runtime.enqueue_job("echo", "hi", job_id="echo")
+    worker = PipelinedWorker(service, prefetch_depth=1)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    assert runtime.wait_for_results(7, timeout=10)
+    worker.stop()
+    thread.join(timeout=10)
+    assert [len(batch) for batch in batches] == [4, 2]
+    assert _results(runtime) == {**{f"double-{i}": i * 2 for i in range(6)}, "echo": "hi"}
+
+
+def test_async_worker_batches_pending_jobs(runtime: LocalRuntime, make_service: ServiceFactory) -> None:
+    batches: List[List[Any]] = []
+
+    async def double(context: List[Dict[str, Any]], events: List[Any]) -> List[Any]:
+        batches.append(events)
+        return [event * 2 for event in events]
+
+    service = make_service({"double": double}, BATCH, service_class=AsyncInternalQueryService)
+    assert isinstance(service, AsyncInternalQueryService)
+    for i in range(4):
+        runtime.enqueue_job("double", i, job_id=f"double-{i}")
+    activity = WorkerActivity(multiprocessing.get_context())
+
+    async def run_until_reported() -> None:
+        poll = asyncio.create_task(service.poll_forever_async(activity))
+        while len(runtime.results) < 4:
+            await asyncio.sleep(0.01)
+        activity.request_drain()
+        await asyncio.wait_for(poll, timeout=10)
+
+    asyncio.run(run_until_reported())
+    assert batches == [[0, 1, 2, 3]]
+    assert _results(runtime) == {f"double-{i}": i * 2 for i in range(4)}
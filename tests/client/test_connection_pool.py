@@ -0,0 +1,64 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import socket
+import ssl
+from typing import Generator
+
+import pytest
+
+from benchmarks.runtime_stand_in import GET_JOB_PATH, LocalRuntime
+from compute_modules.client.connection_pool import HTTPSConnectionPool
+
+
+@pytest.fixture()
+def runtime() -> Generator[LocalRuntime, None, None]:
+    with LocalRuntime(poll_wait_seconds=0) as local_runtime:
+        yield local_runtime
+
+
+def _pool(runtime: LocalRuntime) -> HTTPSConnectionPool:
+    return HTTPSConnectionPool(
+        host="localhost",
+        port=runtime.port,
+        context=ssl.create_default_context(cafile=runtime.cert_path),
+    )
+
+
+def test_connection_is_reused(runtime: LocalRuntime) -> None:
+    """Sequential requests share a single keep-alive connection"""
+    pool = _pool(runtime)
+    for _ in range(5):
+        with pool.request(method="GET", url=GET_JOB_PATH, headers={}) as response:
+            assert response.status == 204
+    assert runtime.connections == 1
+    assert pool.stats.requests == 5
+    assert pool.stats.connections_opened == 1
+    assert pool.stats.full_handshakes == 1
+
+
+@pytest.mark.usefixtures("isolated_loggers")
+def test_stale_connection_reconnects(runtime: LocalRuntime) -> None:
+    """A pooled connection closed underneath the pool is replaced transparently, resuming the TLS session"""
+    pool = _pool(runtime)
+    with pool.request(method="GET", url=GET_JOB_PATH, headers={}) as response:
+        assert response.status == 204
+    for connection in pool._idle:
+        connection.sock.shutdown(socket.SHUT_RDWR)
+    with pool.request(method="GET", url=GET_JOB_PATH, headers={}) as response:
+        assert response.status == 204
+    assert pool.stats.stale_reconnects == 1
+    assert pool.stats.connections_opened == 2
+    assert pool.stats.resumed_handshakes == 1
@@ -0,0 +1,104 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import threading
+import time
+from typing import Any, List
+
+from compute_modules.client.deadlines import JOB_TIMEOUT_ERROR, DeadlineWatchdog
+from compute_modules.context.cancellation import CancellationToken
+from compute_modules.function_registry.types import FunctionOptions
+from tests.conftest import ServiceFactory
+
+
+def _job(job_id: str, query: Any) -> Any:
+    return {"computeModuleJobV1": {"jobId": job_id, "queryType": "echo", "query": query}}
+
+
+def test_job_is_cancelled_at_deadline_then_aborted_after_grace() -> None:
+    aborted: List[List[str]] = []
+    aborted_event = threading.Event()
+
+    def on_hard_timeout(job_ids: List[str]) -> None:
+        aborted.append(job_ids)
+        aborted_event.set()
+
+    watchdog = DeadlineWatchdog(on_hard_timeout=on_hard_timeout, grace=0.1)
+    token = CancellationToken(deadline=time.time() + 0.05)
+    with watchdog.watch(["stuck"], token):
+        assert token.wait(timeout=1)
+        assert not aborted
+        assert aborted_event.wait(timeout=1)
+    assert aborted == [["stuck"]]
+
+
+def test_job_finishing_within_grace_is_not_aborted() -> None:
+    aborted: List[List[str]] = []
+    watchdog = DeadlineWatchdog(on_hard_timeout=aborted.append, grace=0.1)
+    token = CancellationToken(deadline=time.time() + 0.02)
+    with watchdog.watch(["cooperative"], token):
+        token.wait(timeout=1)
+    with watchdog.watch(["next"], CancellationToken(deadline=time.time() + 10)):
+        time.sleep(0.2)
+    assert token.is_cancelled()
+    assert aborted == []
+
+
+def test_job_finishing_after_abort_waits_for_the_abort_to_be_handled() -> None:
+    """A job finishing while it is being aborted does not get to report its result alongside the timeout"""
+    events: List[str] = []
+
+    def on_hard_timeout(job_ids: List[str]) -> None:
+        time.sleep(0.1)
+        events.append("aborted")
+
+    watchdog = DeadlineWatchdog(on_hard_timeout=on_hard_timeout, grace=0.05)
+    with watchdog.watch(["racy"], CancellationToken(deadline=time.time() + 0.01)):
+        time.sleep(0.1)
+    events.append("finished")
+    assert events == ["aborted", "finished"]
+
+
+def test_expired_job_is_rejected_without_running(make_service: ServiceFactory) -> None:
+    calls: List[Any] = []
+
+    def echo(context: Any, event: Any) -> Any:
+        calls.append(event)
+        return event
+
+    service = make_service({"echo": echo}, function_options={"echo": FunctionOptions(timeout=1.0)})
+    job_id, result = service.execute_job(_job("late", "hello"), received_at=time.time() - 2)
+    assert job_id == "late"
+    assert result == {"exception": "Job exceeded its timeout of 1.0s", "errorType": JOB_TIMEOUT_ERROR}
+    assert calls == []
+    assert service.execute_job(_job("on-time", "hello")) == ("on-time", "hello")
+
+
+def test_job_stopping_cooperatively_reports_a_timeout(make_service: ServiceFactory) -> None:
+    def echo(context: Any, event: Any) -> Any:
+        context["cancellationToken"].wait(timeout=5)
+        context["cancellationToken"].raise_if_cancelled()
+        return event
+
+    service = make_service({"echo": echo}, function_options={"echo": FunctionOptions(timeout=0.05)})
+    _, result = service.execute_job(_job("slow", "hello"))
+    assert result == {"exception": "Job exceeded its timeout of 0.05s", "errorType": "TIMEOUT"}
+
+
+def test_cancellation_token_without_deadline_is_never_cancelled() -> None:
+    token = CancellationToken()
+    assert token.remaining() is None
+    assert not token.is_cancelled()
+    token.raise_if_cancelled()
@@ -0,0 +1,115 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import array
+import dataclasses
+import datetime
+import decimal
+import json
+from typing import Any, Dict, List
+
+import pytest
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.client.json_codec import JsonCodec, create_json_codec
+from compute_modules.client.metrics import STAGE_DECODE, STAGE_ENCODE
+from tests.conftest import ServiceFactory
+
+
+@dataclasses.dataclass
+class Reading:
+    when: datetime.datetime
+    day: datetime.date
+    amount: decimal.Decimal
+    blob: bytes
+    values: array.array  # type: ignore[type-arg]
+
+
+RESULTS = [
+    None,
+    "text",
+    2**40,
+    1.5,
+    [1, "a", {"b": [True, False]}],
+    {1: "integer keys"},
+    {"x", "y"},
+    Reading(
+        when=datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+        day=datetime.date(2024, 1, 2),
+        amount=decimal.Decimal("1.10"),
+        blob=b"bytes",
+        values=array.array("d", [0.5, 1.5]),
+    ),
+    2**70,
+]
+
+
+def _installed_codecs() -> List[JsonCodec]:
+    codecs = [create_json_codec("stdlib")]
+    for name in ("orjson", "msgspec"):
+        try:
+            codecs.append(create_json_codec(name))
+        except ValueError:
+            pass
+    return codecs
+
+
+@pytest.mark.parametrize("codec", _installed_codecs(), ids=lambda codec: codec.name)
+@pytest.mark.parametrize("result", RESULTS)
+def test_codecs_encode_like_the_standard_library(codec: JsonCodec, result: Any) -> None:
+    expected = json.loads(JsonCodec().dumps(result))
+    encoded = codec.dumps(result)
+    assert isinstance(encoded, bytes)
+    if isinstance(result, set):
+        assert sorted(json.loads(encoded)) == sorted(expected)
+    else:
+        assert json.loads(encoded) == expected
+
+
+@pytest.mark.parametrize("codec", _installed_codecs(), ids=lambda codec: codec.name)
+def test_codecs_decode_bytes(codec: JsonCodec) -> None:
+    payload = {"computeModuleJobV1": {"jobId": "1", "queryType": "q", "query": {"a": [1, 2.5, "é", None]}}}
+    assert codec.loads(json.dumps(payload).encode("utf-8")) == payload
+
+
+def test_auto_picks_an_installed_codec() -> None:
+    codec = create_json_codec("auto")
+    assert codec.name in {codec.name for codec in _installed_codecs()}
+    if len(_installed_codecs()) > 1:
+        assert codec.name != "stdlib"
+
+
+def test_unknown_codec_is_rejected() -> None:
+    with pytest.raises(ValueError, match="Unknown JSON codec"):
+        create_json_codec("simdjson")
+
+
+@pytest.mark.parametrize("codec", _installed_codecs(), ids=lambda codec: codec.name)
+def test_jobs_are_decoded_and_encoded_with_the_configured_codec(
+    runtime: LocalRuntime, make_service: ServiceFactory, codec: JsonCodec
+) -> None:
+    def echo(context: Dict[str, Any], event: Any) -> Any:
+        return event
+
+    service = make_service({"echo": echo}, JSON_CODEC=codec.name)
+    assert service.json_codec.name == codec.name
+    runtime.enqueue_job("echo", {"values": [1, 2, 3]}, job_id="1")
+    job = service.get_job_or_none()
+    assert job is not None
+    service.handle_job(job)
+    assert json.loads(runtime.results["1"]) == {"values": [1, 2, 3]}
+    assert service.metrics.histogram(STAGE_DECODE, "echo").count == 1
+    assert service.metrics.histogram(STAGE_ENCODE, "echo").count == 1
+    assert f'compute_module_json_codec_info{{codec="{codec.name}"}} 1' in service.metrics.render_prometheus()
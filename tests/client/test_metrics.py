@@ -0,0 +1,116 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import multiprocessing
+import os
+import urllib.request
+from typing import Any, Dict
+
+import pytest
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.client.metrics import (
+    COUNTER_FAILED_JOBS,
+    COUNTER_JOBS,
+    STAGE_CONVERT,
+    STAGE_DECODE,
+    STAGE_ENCODE,
+    STAGE_EXECUTE,
+    STAGE_POLL,
+    STAGE_REPORT,
+    JobMetrics,
+    MetricsExporter,
+)
+from compute_modules.logging import internal
+from compute_modules.logging.common import ComputeModulesAdapterManager
+from tests.conftest import ServiceFactory
+
+
+def test_workers_aggregate_into_shared_memory() -> None:
+    metrics = JobMetrics(["square"], multiprocessing.get_context("fork"), num_workers=2)
+
+    def record(process_id: int) -> None:
+        metrics.bind(process_id)
+        metrics.observe(STAGE_EXECUTE, "square", 0.003)
+        metrics.count(COUNTER_JOBS, "square")
+
+    processes = [multiprocessing.get_context("fork").Process(target=record, args=(i,)) for i in range(2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    metrics.observe(STAGE_EXECUTE, "square", 1000)
+    histogram = metrics.histogram(STAGE_EXECUTE, "square")
+    assert (histogram.count, histogram.sum) == (3, pytest.approx(1000.006))
+    # 3ms falls in the bucket up to 5ms, 1000s above the last bound
+    assert histogram.buckets[5] == 2 and histogram.buckets[-1] == 1
+    assert metrics.counter(COUNTER_JOBS, "square") == 2
+    rendered = metrics.render_prometheus()
+    assert 'compute_module_jobs_total{query_type="square"} 2' in rendered
+    assert 'compute_module_stage_duration_seconds_bucket{query_type="square",stage="execute",le="0.005"} 2' in rendered
+    assert 'compute_module_stage_duration_seconds_bucket{query_type="square",stage="execute",le="+Inf"} 3' in rendered
+    assert 'compute_module_stage_duration_seconds_count{query_type="square",stage="execute"} 3' in rendered
+
+
+def test_label_values_are_escaped() -> None:
+    query_type = 'say "hi"\\\n'
+    metrics = JobMetrics([query_type], multiprocessing.get_context("fork"), num_workers=1)
+    metrics.observe(STAGE_EXECUTE, query_type, 0.003)
+    metrics.count(COUNTER_JOBS, query_type)
+    rendered = metrics.render_prometheus()
+    assert r'compute_module_jobs_total{query_type="say \"hi\"\\\n"} 1' in rendered
+    assert r'compute_module_stage_duration_seconds_count{query_type="say \"hi\"\\\n",stage="execute"} 1' in rendered
+    # Every sample stays on its own line
+    assert all(line.startswith(("# TYPE", "compute_module_")) for line in rendered.splitlines())
+
+
+def test_stages_of_jobs_are_recorded(runtime: LocalRuntime, make_service: ServiceFactory) -> None:
+    def square(context: Dict[str, Any], event: Any) -> Any:
+        if event < 0:
+            raise ValueError("Negative input")
+        return event**2
+
+    service = make_service({"square": square})
+    for i, event in enumerate([3, -1]):
+        runtime.enqueue_job("square", event, job_id=str(i))
+        job = service.get_job_or_none()
+        assert job is not None
+        service.handle_job(job)
+    metrics = service.metrics
+    assert metrics.histogram(STAGE_POLL).count == 2
+    for stage in (STAGE_DECODE, STAGE_CONVERT, STAGE_EXECUTE, STAGE_ENCODE, STAGE_REPORT):
+        assert metrics.histogram(stage, "square").count == 2
+    assert metrics.counter(COUNTER_JOBS, "square") == 2
+    assert metrics.counter(COUNTER_FAILED_JOBS, "square") == 1
+
+
+def test_metrics_are_served_and_dumped(tmp_path: Any, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Loggers write to the stderr they were created with, so do not leak this test's captured stderr to later tests
+    monkeypatch.setattr(internal, "INTERNAL_LOGGER_ADAPTER", None)
+    monkeypatch.setattr(ComputeModulesAdapterManager, "adapters", {})
+    metrics = JobMetrics(["square"])
+    metrics.count(COUNTER_JOBS, "square")
+    path = os.path.join(tmp_path, "metrics.prom")
+    exporter = MetricsExporter(metrics, port=0, path=path, interval=60)
+    exporter.start()
+    try:
+        assert exporter._server is not None
+        url = f"http://127.0.0.1:{exporter._server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.read().decode() == metrics.render_prometheus()
+    finally:
+        exporter.stop()
+    with open(path) as f:
+        assert 'compute_module_jobs_total{query_type="square"} 1' in f.read()
@@ -0,0 +1,92 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import multiprocessing
+import random
+import time
+
+from compute_modules.client.autoscaler import WorkerActivity
+from compute_modules.client.polling import PollingScheduler
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_idle_backoff_is_capped_and_resets_on_job() -> None:
+    """Empty polls back off up to the max delay & a job brings polling straight back to immediate"""
+    scheduler = PollingScheduler(idle_base_delay=0.1, idle_max_delay=2.0, rng=random.Random(0))
+    assert scheduler.next_delay() == 0
+    delays = [scheduler.record_empty_poll() for _ in range(50)]
+    assert all(0.1 <= delay <= 2.0 for delay in delays)
+    assert max(delays) == 2.0
+    scheduler.record_job()
+    assert scheduler.next_delay() == 0
+
+
+def test_reconnect_backoff_is_capped() -> None:
+    """Failed polls no longer sleep for an unbounded 2**n seconds"""
+    scheduler = PollingScheduler(reconnect_base_delay=1.0, reconnect_max_delay=30.0, rng=random.Random(0))
+    delays = [scheduler.record_failed_poll() for _ in range(100)]
+    assert all(1.0 <= delay <= 30.0 for delay in delays)
+    assert scheduler.next_delay() == delays[-1]
+
+
+def test_jitter_decorrelates_workers() -> None:
+    """Workers that go idle at the same time do not keep polling in lockstep"""
+    schedulers = [PollingScheduler(rng=random.Random(seed)) for seed in range(4)]
+    delays = [[scheduler.record_empty_poll() for _ in range(5)] for scheduler in schedulers]
+    assert len({tuple(worker_delays) for worker_delays in delays}) == len(schedulers)
+
+
+def test_idle_stats() -> None:
+    clock = FakeClock()
+    scheduler = PollingScheduler(clock=clock, rng=random.Random(0))
+    for _ in range(10):
+        scheduler.record_empty_poll()
+        clock.now += 0.5
+    scheduler.record_job()
+    stats = scheduler.stats()
+    assert stats.jobs_received == 1
+    assert stats.empty_polls == 10
+    assert stats.idle_seconds == 5.0
+    assert stats.idle_poll_rate == 2.0
+    assert stats.last_time_to_first_job == 5.0
+    assert stats.mean_time_to_first_job == 5.0
+
+
+def test_stats_are_published_to_the_worker_activity() -> None:
+    """The supervisor sees the same stats as the worker's scheduler"""
+    activity = WorkerActivity(multiprocessing.get_context())
+    scheduler = PollingScheduler(rng=random.Random(0))
+    scheduler.activity = activity
+    assert activity.polling_stats() == scheduler.stats()
+    for _ in range(3):
+        scheduler.record_empty_poll()
+    time.sleep(0.05)
+    scheduler.record_job()
+    scheduler.record_failed_poll()
+    published = activity.polling_stats()
+    assert published == scheduler.stats()
+    assert (published.jobs_received, published.empty_polls, published.failed_polls) == (1, 3, 1)
+    assert published.last_time_to_first_job is not None and published.last_time_to_first_job >= 0.05
+    scheduler.record_empty_poll()
+    time.sleep(0.05)
+    # The current idle period counts towards the idle time before it ends
+    assert activity.polling_stats().idle_seconds >= published.idle_seconds + 0.05
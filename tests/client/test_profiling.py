@@ -0,0 +1,116 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import logging
+import os
+import pstats
+import time
+from typing import Any, Dict
+
+import pytest
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.client.async_query_client import AsyncInternalQueryService
+from compute_modules.client.profiling import JobProfiler
+from compute_modules.logging.internal import set_internal_log_level
+from tests.conftest import ServiceFactory
+
+
+def _run_job(runtime: LocalRuntime, service: Any, query_type: str, event: Any, job_id: str) -> None:
+    runtime.enqueue_job(query_type, event, job_id=job_id)
+    job = service.get_job_or_none()
+    assert job is not None
+    service.handle_job(job)
+
+
+def _sum_of_squares(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+def test_sampled_jobs_are_profiled(tmp_path: Any, runtime: LocalRuntime, make_service: ServiceFactory) -> None:
+    def compute(context: Dict[str, Any], event: Any) -> Any:
+        return _sum_of_squares(event)
+
+    service = make_service({"compute": compute}, PROFILE_DIR=str(tmp_path), PROFILE_SAMPLE_RATE="1")
+    _run_job(runtime, service, "compute", 1000, "job/1")
+    (name,) = os.listdir(tmp_path)
+    assert name.endswith("-compute-job_1.pstats")
+    stats = pstats.Stats(os.path.join(tmp_path, name))
+    assert any(function_name == "_sum_of_squares" for _, _, function_name in stats.stats)  # type: ignore[attr-defined]
+
+
+def test_async_functions_are_not_profiled_in_asyncio_mode(
+    tmp_path: Any, runtime: LocalRuntime, make_service: ServiceFactory, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Other jobs run on the event loop's thread, so profiles of async def functions would mix in other jobs"""
+
+    async def compute_async(context: Dict[str, Any], event: Any) -> Any:
+        return _sum_of_squares(event)
+
+    def compute(context: Dict[str, Any], event: Any) -> Any:
+        return _sum_of_squares(event)
+
+    set_internal_log_level(logging.WARNING)
+    service = make_service(
+        {"compute_async": compute_async, "compute": compute},
+        service_class=AsyncInternalQueryService,
+        PROFILE_DIR=str(tmp_path),
+        PROFILE_SAMPLE_RATE="1",
+    )
+    assert isinstance(service, AsyncInternalQueryService)
+    assert "async def functions are not profiled in asyncio mode" in caplog.text
+    for query_type in ("compute_async", "compute"):
+        runtime.enqueue_job(query_type, 1000, job_id=query_type)
+        job = service.get_job_or_none()
+        assert job is not None
+        asyncio.run(service.handle_job_async(job))
+    # Regular functions run in a thread of their own & are profiled
+    (name,) = os.listdir(tmp_path)
+    assert name.endswith("-compute-compute.pstats")
+
+
+def _sleep_in_handler(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def test_stacks_of_slow_jobs_are_written(tmp_path: Any, runtime: LocalRuntime, make_service: ServiceFactory) -> None:
+    def sleep(context: Dict[str, Any], event: Any) -> Any:
+        _sleep_in_handler(event)
+        return event
+
+    service = make_service(
+        {"sleep": sleep},
+        PROFILE_DIR=str(tmp_path),
+        PROFILE_SLOW_JOB_SECONDS="0.1",
+        PROFILE_SAMPLE_INTERVAL_SECONDS="0.005",
+    )
+    _run_job(runtime, service, "sleep", 0, "fast")
+    _run_job(runtime, service, "sleep", 0.2, "slow")
+    (name,) = os.listdir(tmp_path)
+    assert name.endswith("-sleep-slow.collapsed")
+    with open(os.path.join(tmp_path, name)) as f:
+        lines = f.read().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert [frame.split(" ")[0] for frame in stack.split(";")[-2:]] == ["sleep", "_sleep_in_handler"]
+    assert int(count) > 10
+
+
+def test_only_most_recent_profiles_are_kept(tmp_path: Any) -> None:
+    profiler = JobProfiler(str(tmp_path), sample_rate=1, max_files=2)
+    for i in range(4):
+        with profiler.profile(str(i), "compute"):
+            _sum_of_squares(10)
+    assert sorted(name.rsplit("-", 1)[1] for name in os.listdir(tmp_path)) == ["2.pstats", "3.pstats"]
@@ -0,0 +1,63 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import multiprocessing
+
+from compute_modules.client.quotas import FunctionQuotas
+from compute_modules.function_registry.types import FunctionOptions
+
+
+def _quotas(capacity: int = 4, num_workers: int = 2, **options: FunctionOptions) -> FunctionQuotas:
+    return FunctionQuotas(multiprocessing.get_context("fork"), options, capacity=capacity, num_workers=num_workers)
+
+
+def test_max_concurrency_is_enforced_across_workers() -> None:
+    quotas = _quotas(slow=FunctionOptions(max_concurrency=2), fast=FunctionOptions())
+    assert quotas.try_acquire("slow")
+    quotas.bind(1)
+    assert quotas.try_acquire("slow")
+    assert not quotas.try_acquire("slow")
+    # Jobs of functions without a quota always start
+    assert quotas.try_acquire("fast")
+    quotas.release("slow")
+    assert quotas.try_acquire("slow")
+    usage = quotas.usage()
+    assert (usage["slow"].executing, usage["slow"].max_concurrency, usage["fast"].executing) == (2, 2, 1)
+
+
+def test_weighted_jobs_wait_for_enough_capacity() -> None:
+    quotas = _quotas(capacity=4, heavy=FunctionOptions(weight=3), light=FunctionOptions())
+    # With nothing executing, a job starts even if its weight exceeds the free capacity
+    assert quotas.try_acquire("heavy")
+    assert not quotas.try_acquire("heavy")
+    assert quotas.try_acquire("light")
+    quotas.release("heavy")
+    assert quotas.try_acquire("heavy")
+    quotas.release("light")
+    quotas.release("heavy")
+    assert quotas.try_acquire("heavy")
+
+
+def test_slots_of_exited_workers_are_released() -> None:
+    quotas = _quotas(slow=FunctionOptions(max_concurrency=1))
+    quotas.bind(1)
+    # The worker exits in the middle of a job, so never releases its slot
+    process = multiprocessing.get_context("fork").Process(target=quotas.try_acquire, args=("slow",))
+    process.start()
+    process.join()
+    quotas.bind(0)
+    assert not quotas.try_acquire("slow")
+    quotas.release_worker(1)
+    assert quotas.try_acquire("slow")
@@ -0,0 +1,184 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import multiprocessing
+import random
+import signal
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterator, List, Optional
+
+import pytest
+
+from compute_modules.client import supervisor as supervisor_module
+from compute_modules.client.polling import PollingScheduler
+from compute_modules.client.supervisor import (
+    RECYCLE_EXIT_CODES,
+    RECYCLE_MAX_JOBS,
+    RECYCLE_MAX_RSS,
+    SUPERVISOR_PID_ENV,
+    RecyclePolicy,
+    WorkerSupervisor,
+    run_worker_process,
+)
+from compute_modules.logging import internal
+from compute_modules.logging.common import ComputeModulesAdapterManager
+
+# Forked workers can run closures, which lets them report back to the test through multiprocessing primitives
+FORK = multiprocessing.get_context("fork")
+
+
+@pytest.fixture
+def restore_signal_handlers() -> Iterator[None]:
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+@pytest.fixture
+def make_supervisor(monkeypatch: pytest.MonkeyPatch) -> Callable[..., WorkerSupervisor]:
+    # The supervisor advertises its PID to the workers it starts
+    monkeypatch.setenv(SUPERVISOR_PID_ENV, "")
+    # Loggers write to the stderr they were created with, so do not leak this test's captured stderr to later tests
+    monkeypatch.setattr(internal, "INTERNAL_LOGGER_ADAPTER", None)
+    monkeypatch.setattr(ComputeModulesAdapterManager, "adapters", {})
+
+    def make(target: Any, **kwargs: Any) -> WorkerSupervisor:
+        return WorkerSupervisor(target=target, num_workers=1, mp_context=FORK, **kwargs)
+
+    return make
+
+
+def _supervise_until(supervisor: WorkerSupervisor, condition: Callable[[], bool], timeout: float = 10) -> None:
+    """Run the supervisor in the background until `condition` holds, then stop it"""
+    thread = threading.Thread(target=supervisor.run)
+    thread.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while not condition():
+            assert time.monotonic() < deadline, f"Condition not met within {timeout}s: {supervisor.stats}"
+            time.sleep(0.01)
+    finally:
+        supervisor.stop()
+        thread.join(timeout)
+    assert not thread.is_alive()
+
+
+def test_max_jobs_is_jittered_upwards() -> None:
+    """Workers recycle after at least max_jobs, spread so they do not all recycle at once"""
+    limits = {RecyclePolicy(max_jobs=100, rng=random.Random(seed)).max_jobs for seed in range(20)}
+    assert all(100 <= limit <= 110 for limit in limits)
+    assert len(limits) > 1
+
+
+def test_recycle_reason() -> None:
+    policy = RecyclePolicy(max_jobs=10, rng=random.Random(0))
+    assert policy.recycle_reason(1) is None
+    assert policy.recycle_reason(policy.max_jobs) == RECYCLE_MAX_JOBS
+    assert RecyclePolicy(max_rss_bytes=1).recycle_reason(1) == RECYCLE_MAX_RSS
+    assert RecyclePolicy().recycle_reason(10**9) is None
+
+
+@pytest.mark.parametrize(
+    "recycle_reason, exit_code",
+    [(None, 0), (RECYCLE_MAX_JOBS, RECYCLE_EXIT_CODES[RECYCLE_MAX_JOBS])],
+)
+@pytest.mark.usefixtures("restore_signal_handlers")
+def test_worker_exit_code(recycle_reason: Optional[str], exit_code: int) -> None:
+    """The reason a worker stopped is passed to the supervisor through its exit code"""
+    with pytest.raises(SystemExit) as exc_info:
+        run_worker_process(lambda process_id, activity: recycle_reason, 0, None)
+    assert exc_info.value.code == exit_code
+
+
+def test_crashed_worker_is_restarted_with_growing_backoff(make_supervisor: Callable[..., WorkerSupervisor]) -> None:
+    started = FORK.Queue()
+
+    def crash(process_id: int, activity: Any) -> Optional[str]:
+        started.put(time.monotonic())
+        sys.exit(1)
+
+    supervisor = make_supervisor(crash, restart_base_delay=0.05, restart_max_delay=0.2)
+    _supervise_until(supervisor, lambda: supervisor.stats.restarts >= 5)
+    start_times: List[float] = [started.get(timeout=1) for _ in range(5)]
+    gaps = [later - earlier for earlier, later in zip(start_times, start_times[1:])]
+    assert all(gap >= min(0.2, 0.05 * 2**i) for i, gap in enumerate(gaps)), gaps
+    # The delay is capped at restart_max_delay rather than doubling to 0.4s
+    assert gaps[3] < 0.4, gaps
+    assert supervisor.stats.crashes >= 4
+    assert supervisor.stats.recycles == {}
+
+
+def test_backoff_resets_after_healthy_uptime(
+    make_supervisor: Callable[..., WorkerSupervisor], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(supervisor_module, "HEALTHY_UPTIME_SECONDS", 0.1)
+
+    def crash_after_a_while(process_id: int, activity: Any) -> Optional[str]:
+        time.sleep(0.2)
+        sys.exit(1)
+
+    supervisor = make_supervisor(crash_after_a_while, restart_base_delay=0.05)
+    _supervise_until(supervisor, lambda: supervisor.stats.crashes >= 3)
+    assert supervisor._slots[0].consecutive_crashes == 1
+
+
+def test_recycled_worker_is_replaced_immediately(make_supervisor: Callable[..., WorkerSupervisor]) -> None:
+    supervisor = make_supervisor(lambda process_id, activity: RECYCLE_MAX_JOBS, restart_base_delay=60)
+    _supervise_until(supervisor, lambda: supervisor.stats.recycles.get(RECYCLE_MAX_JOBS, 0) >= 3)
+    assert supervisor.stats.crashes == 0
+    assert supervisor.stats.restarts >= 3
+    assert supervisor._slots[0].consecutive_crashes == 0
+
+
+def test_worker_ignoring_sigterm_is_killed(make_supervisor: Callable[..., WorkerSupervisor]) -> None:
+    ready = FORK.Event()
+
+    def ignore_sigterm(process_id: int, activity: Any) -> Optional[str]:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        ready.set()
+        time.sleep(60)
+        return None
+
+    supervisor = make_supervisor(ignore_sigterm, stop_timeout=0.2)
+    stopped_at = time.monotonic()
+    _supervise_until(supervisor, lambda: ready.is_set() and bool(supervisor._slots[0].process))
+    assert time.monotonic() - stopped_at < 5
+    assert supervisor._slots[0].process is None
+
+
+def test_polling_stats_are_reported_per_worker(make_supervisor: Callable[..., WorkerSupervisor]) -> None:
+    def poll(process_id: int, activity: Any) -> Optional[str]:
+        scheduler = PollingScheduler()
+        scheduler.activity = activity
+        scheduler.record_empty_poll()
+        scheduler.record_job()
+        time.sleep(60)
+        return None
+
+    supervisor = make_supervisor(poll)
+    reported: List[Any] = []
+
+    def polled() -> bool:
+        reported.append(supervisor.polling_stats())
+        return 0 in reported[-1] and reported[-1][0].jobs_received == 1
+
+    _supervise_until(supervisor, polled)
+    stats = reported[-1][0]
+    assert (stats.empty_polls, stats.idle_poll_rate > 0, stats.last_time_to_first_job is not None) == (1, True, True)
+    # Stopped workers are no longer reported
+    assert supervisor.polling_stats() == {}
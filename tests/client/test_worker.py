@@ -0,0 +1,152 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import pytest
+
+from compute_modules.client.connection_pool import ResultPostError
+from compute_modules.client.internal_query_client import InternalQueryService
+from compute_modules.client.polling import PollingScheduler
+from compute_modules.client.quotas import FunctionQuotas
+from compute_modules.client.worker import PipelinedWorker
+from compute_modules.function_registry.types import FunctionOptions
+
+
+class FakeService:
+    """Stands in for InternalQueryService, serving jobs from a local queue"""
+
+    def __init__(self, num_jobs: int, execute_seconds: float = 0, report_seconds: float = 0) -> None:
+        self.logger = logging.getLogger("test_worker")
+        self.polling_scheduler = PollingScheduler(idle_max_delay=0.01)
+        self.jobs: Deque[Dict[str, Any]] = deque({"computeModuleJobV1": {"jobId": str(i)}} for i in range(num_jobs))
+        self.execute_seconds = execute_seconds
+        self.report_seconds = report_seconds
+        self.reported: List[str] = []
+        self.failed: List[str] = []
+        self.max_held = 0
+        self.function_quotas: Optional[FunctionQuotas] = None
+        self._held = 0
+        self._lock = threading.Lock()
+
+    def get_job_or_none(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if not self.jobs:
+                self.polling_scheduler.record_empty_poll()
+                return None
+            self._held += 1
+            self.max_held = max(self.max_held, self._held)
+            return self.jobs.popleft()
+
+    def execute_job(self, job: Dict[str, Any], received_at: Optional[float] = None) -> Tuple[str, Any]:
+        time.sleep(self.execute_seconds)
+        with self._lock:
+            self._held -= 1
+        return job["computeModuleJobV1"]["jobId"], "result"
+
+    def batch_options(self, query_type: str) -> None:
+        return None
+
+    get_failed_query = staticmethod(InternalQueryService.get_failed_query)
+
+    def report_job_result(self, job_id: str, result: Any, query_type: Optional[str] = None) -> None:
+        time.sleep(self.report_seconds)
+        if job_id == "3":
+            raise ResultPostError("Unable to post job result after 5 attempts")
+        if job_id == "5" and result == "result":
+            raise ValueError("Result rejected by a tracer")
+        (self.failed if "exception" in result else self.reported).append(job_id)
+
+
+def _run_until_done(worker: PipelinedWorker, service: FakeService) -> None:
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    while service.jobs:
+        time.sleep(0.01)
+    worker.stop()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+@pytest.mark.parametrize("prefetch_depth", [0, 1, 3])
+def test_prefetch_depth_bounds_held_jobs(prefetch_depth: int) -> None:
+    """A worker never holds more than prefetch_depth jobs on top of the one executing, and drains them on stop"""
+    service = FakeService(num_jobs=20, execute_seconds=0.005)
+    _run_until_done(PipelinedWorker(service, prefetch_depth=prefetch_depth), service)  # type: ignore[arg-type]
+    assert service.max_held == prefetch_depth + 1
+    # A failure to post one result does not stop the worker, & other errors fail the job instead of dropping it
+    assert sorted(service.reported, key=int) == [str(i) for i in range(20) if i not in (3, 5)]
+    assert service.failed == ["5"]
+
+
+def test_idle_polling_is_quiet(caplog: pytest.LogCaptureFixture) -> None:
+    """Polls that find no job are only logged at DEBUG level"""
+    service = FakeService(num_jobs=0)
+    worker = PipelinedWorker(service, prefetch_depth=1)  # type: ignore[arg-type]
+    thread = threading.Thread(target=worker.run)
+    with caplog.at_level(logging.INFO, logger="test_worker"):
+        thread.start()
+        time.sleep(0.1)
+        worker.stop()
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert caplog.records == []
+
+
+def test_report_overlaps_execution() -> None:
+    """Reporting a result happens in the background while the next job executes"""
+    service = FakeService(num_jobs=10, execute_seconds=0.02, report_seconds=0.02)
+    start = time.perf_counter()
+    _run_until_done(PipelinedWorker(service, prefetch_depth=1), service)  # type: ignore[arg-type]
+    assert time.perf_counter() - start < 10 * 0.04
+
+
+def test_jobs_without_free_slot_are_deferred() -> None:
+    """A job whose function has no free slot does not hold up the jobs of other functions, & starts once it has one"""
+    service = FakeService(num_jobs=0)
+    service.jobs.extend(
+        {"computeModuleJobV1": {"jobId": str(i), "queryType": query_type}}
+        for i, query_type in enumerate(["slow", "fast", "fast"])
+    )
+    quotas = FunctionQuotas(
+        multiprocessing.get_context("fork"),
+        {"slow": FunctionOptions(max_concurrency=1), "fast": FunctionOptions()},
+        capacity=2,
+        num_workers=2,
+    )
+    # Another worker is executing a job of the slow function
+    quotas.bind(1)
+    assert quotas.try_acquire("slow")
+    quotas.bind(0)
+    service.function_quotas = quotas
+    worker = PipelinedWorker(service, prefetch_depth=1)  # type: ignore[arg-type]
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while len(service.reported) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert service.reported == ["1", "2"]
+    assert quotas.usage()["slow"].deferred == 1
+    quotas.release_worker(1)
+    worker.stop()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert service.reported == ["1", "2", "0"]
+    assert quotas.usage()["slow"].executing == quotas.usage()["slow"].deferred == 0
@@ -0,0 +1,65 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import os
+from typing import Any, Callable, Dict, Iterator, Optional, Type
+from unittest import mock
+
+import pytest
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.client.internal_query_client import InternalQueryService
+from compute_modules.function_registry.types import FunctionOptions
+from compute_modules.logging import internal
+from compute_modules.logging.common import ComputeModulesAdapterManager
+
+ServiceFactory = Callable[..., InternalQueryService]
+
+
+@pytest.fixture
+def runtime() -> Iterator[LocalRuntime]:
+    with LocalRuntime() as runtime:
+        yield runtime
+
+
+@pytest.fixture
+def isolated_loggers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Loggers write to the stderr they were created with, so do not leak this test's captured stderr to later tests"""
+    monkeypatch.setattr(internal, "INTERNAL_LOGGER_ADAPTER", None)
+    monkeypatch.setattr(ComputeModulesAdapterManager, "adapters", {})
+
+
+@pytest.fixture
+def make_service(runtime: LocalRuntime, isolated_loggers: None) -> ServiceFactory:
+    """Creates query services for the given functions, pointed at the local runtime"""
+
+    def make(
+        functions: Dict[str, Callable[..., Any]],
+        function_options: Optional[Dict[str, FunctionOptions]] = None,
+        service_class: Type[InternalQueryService] = InternalQueryService,
+        function_output_types: Optional[Dict[str, Any]] = None,
+        **environ: str,
+    ) -> InternalQueryService:
+        with mock.patch.dict(os.environ, {**runtime.environ(), **environ}):
+            return service_class(
+                registered_functions=functions,
+                function_schemas=[],
+                function_schema_conversions={},
+                is_function_context_typed={name: False for name in functions},
+                function_options=function_options,
+                function_output_types=function_output_types,
+            )
+
+    return make
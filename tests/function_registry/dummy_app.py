@@ -16,9 +16,10 @@
 from dataclasses import dataclass
 from datetime import date, datetime
 from decimal import Decimal
-from typing import Dict, Optional, Set, Union
+from typing import Dict, List, Optional, Set, Union
 
 from compute_modules.context import QueryContext
+from compute_modules.function_registry.types import FloatArray, IntArray
 
 
 @dataclass
@@ -54,6 +55,13 @@ class DummyOutput:
     res2: Dict[str, float]
 
 
+@dataclass
+class ArrayInput:
+    values: FloatArray
+    counts: IntArray
+    rows: List[FloatArray]
+
+
 @dataclass
 class ClassWithBareDict:
     dict_field: dict  # type: ignore[type-arg]
@@ -78,3 +86,13 @@ def dummy_func_3(context: QueryContext, event) -> int:  # type: ignore[no-untype
 def dummy_func_4(context: QueryContext, event: ClassWithBareDict) -> int:
     """Example function with type hint for context & return type only"""
     return 1
+
+
+def dummy_batch_func(context: List[QueryContext], events: List[DummyInput]) -> List[DummyOutput]:
+    """Example batch function"""
+    return [dummy_func_1(item_context, event) for item_context, event in zip(context, events)]
+
+
+def dummy_array_func(context: QueryContext, event: ArrayInput) -> float:
+    """Example function with numeric array inputs"""
+    return sum(event.values) + sum(event.counts)
@@ -0,0 +1,106 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from compute_modules.context import QueryContext
+from compute_modules.function_registry.columns import Columns
+from compute_modules.function_registry.function_payload_converter import compile_payload_converter, convert_payload
+from compute_modules.function_registry.function_schema_parser import parse_function_schema
+from compute_modules.function_registry.types import PythonClassNode
+
+
+@dataclass
+class Point:
+    x: float
+    y: float
+    label: Optional[str]
+    tags: List[str]
+
+
+@dataclass
+class ColumnsInput:
+    points: Columns[Point]
+    rows: List[Point]
+
+
+def columns_func(context: QueryContext, event: ColumnsInput) -> int:
+    return len(event.points)
+
+
+RAW_POINTS: List[Dict[str, Any]] = [
+    {"x": 1, "y": 2.5, "label": "a", "tags": ["t"]},
+    {"x": 3.5, "y": 4, "label": None, "tags": []},
+    {"x": 5.0, "y": 6.0, "label": "c", "tags": ["u", "v"]},
+]
+
+
+def _class_node() -> PythonClassNode:
+    parse_result = parse_function_schema(columns_func, "columns_func")
+    assert parse_result.class_node is not None
+    return parse_result.class_node
+
+
+def test_columns_schema_is_that_of_a_list() -> None:
+    inputs = parse_function_schema(columns_func, "columns_func").function_schema["inputs"]
+    assert inputs[0]["name"] == "points"
+    assert inputs[0]["dataType"] == inputs[1]["dataType"]
+
+
+def test_columns_are_decoded_by_field() -> None:
+    payload = {"points": RAW_POINTS, "rows": RAW_POINTS}
+    class_node = _class_node()
+    for event in (convert_payload(payload, class_node), compile_payload_converter(class_node)(payload)):
+        points = event.points
+        assert isinstance(points, Columns)
+        assert len(points) == 3
+        assert points.column("x") == [1.0, 3.5, 5.0]
+        assert [type(x) for x in points.column("x")] == [float, float, float]
+        assert points.column("label") == ["a", None, "c"]
+        assert points.column("tags") == [["t"], [], ["u", "v"]]
+        # Rows are built on access, & match those of a list input
+        assert list(points) == event.rows
+        assert points[1] == event.rows[1]
+        assert points[-1] == event.rows[-1]
+        assert list(points[1:]) == event.rows[1:]
+
+
+def test_columns_of_no_rows() -> None:
+    event = compile_payload_converter(_class_node())({"points": [], "rows": []})
+    assert len(event.points) == 0
+    assert event.points.column("y") == []
+    assert list(event.points) == []
+
+
+def test_exception_columns_with_null_rows() -> None:
+    with pytest.raises(ValueError) as exc_info:
+        compile_payload_converter(_class_node())({"points": [RAW_POINTS[0], None], "rows": []})
+    assert "Rows of a Columns[Point] input cannot be null" in str(exc_info.value)
+
+
+def test_exception_columns_of_primitives() -> None:
+    @dataclass
+    class BadInput:
+        values: Columns[int]
+
+    def function(context: QueryContext, event: BadInput) -> int:
+        return 0
+
+    with pytest.raises(ValueError) as exc_info:
+        parse_function_schema(function, "function")
+    assert "Columns type hints must have a class parameter" in str(exc_info.value)
@@ -13,12 +13,14 @@
 #  limitations under the License.
 
 
+import dataclasses
 import datetime
 import decimal
+import typing
 
 import pytest
 
-from compute_modules.function_registry.function_payload_converter import convert_payload
+from compute_modules.function_registry.function_payload_converter import compile_payload_converter, convert_payload
 from compute_modules.function_registry.function_schema_parser import parse_function_schema
 from tests.function_registry.dummy_app import ChildClass, DummyInput, ParentClass, dummy_func_1
 
@@ -99,3 +101,149 @@ def test_convert_payload_error(
         convert_payload(BAD_RAW_PAYLOAD, parse_result.class_node)
     assert str(exc_info.value) == "Invalid isoformat string: 'do'"
     assert "Error converting do to type <built-in method fromisoformat" in caplog.text
+
+
+@dataclasses.dataclass
+class Item:
+    name: str
+    count: int
+    ratio: float
+    enabled: bool
+    tags: typing.List[str]
+    note: typing.Optional[str]
+
+
+@dataclasses.dataclass
+class Container:
+    items: typing.List[Item]
+    counts: typing.Dict[str, int]
+    ratios: typing.List[float]
+    flags: typing.Set[bool]
+    nested: typing.Dict[str, typing.List[Item]]
+    blobs: typing.List[bytes]
+    amounts: typing.Dict[int, decimal.Decimal]
+
+
+def container_func(context, event: Container) -> str:  # type: ignore[no-untyped-def]
+    return ""
+
+
+def _item(**overrides: typing.Any) -> typing.Dict[str, typing.Any]:
+    return {"name": "a", "count": 1, "ratio": 0.5, "enabled": True, "tags": ["x"], "note": None, **overrides}
+
+
+CONTAINER_PAYLOADS = [
+    {
+        "items": [_item(), _item(count=2.0, ratio=3, enabled=1, tags=["y", None])],
+        "counts": {"a": 1, "b": True, "c": None},
+        "ratios": [1, 2.5, True],
+        "flags": [True, False, 1],
+        "nested": {"n": [_item(note="note")], "empty": [], "none": None},
+        "blobs": ["YQ==", None],
+        "amounts": {"1": "1.5", "2": None},
+    },
+    {
+        "items": [],
+        "counts": {"a": 1, "b": 2},
+        "ratios": [1.5, 2.5],
+        "flags": [],
+        "nested": {},
+        "blobs": ["YQ=="],
+        "amounts": {"1": "1.5"},
+    },
+    {"items": None, "counts": None, "ratios": None, "flags": None, "nested": None, "blobs": None, "amounts": None},
+]
+
+
+def _as_comparable(value: typing.Any) -> typing.Any:
+    """Class equality does not compare the types of fields, which must match too (e.g. 1 vs 1.0 vs True)"""
+    if hasattr(value, "__dict__"):
+        return (type(value), _as_comparable(vars(value)))
+    if isinstance(value, dict):
+        return (type(value), [(_as_comparable(k), _as_comparable(v)) for k, v in value.items()])
+    if isinstance(value, (list, set)):
+        return (type(value), sorted(map(repr, map(_as_comparable, value))))
+    return (type(value), value)
+
+
+def test_compiled_converter_matches_convert_payload(expected_return_value: DummyInput) -> None:
+    parse_result = parse_function_schema(dummy_func_1, "dummy_func_1")
+    assert parse_result.class_node
+    converter = compile_payload_converter(parse_result.class_node)
+    assert _as_comparable(converter(RAW_PAYLOAD)) == _as_comparable(
+        convert_payload(RAW_PAYLOAD, parse_result.class_node)
+    )
+    assert _as_comparable(converter(RAW_PAYLOAD)) == _as_comparable(expected_return_value)
+
+
+@pytest.mark.parametrize("payload", CONTAINER_PAYLOADS)
+def test_compiled_converter_matches_convert_payload_edge_cases(payload: typing.Dict[str, typing.Any]) -> None:
+    parse_result = parse_function_schema(container_func, "container_func")
+    assert parse_result.class_node
+    converted = compile_payload_converter(parse_result.class_node)(payload)
+    assert _as_comparable(converted) == _as_comparable(convert_payload(payload, parse_result.class_node))
+
+
+def test_compiled_converter_error(caplog: pytest.LogCaptureFixture) -> None:
+    parse_result = parse_function_schema(dummy_func_1, "dummy_func_1")
+    assert parse_result.class_node
+    converter = compile_payload_converter(parse_result.class_node)
+    with pytest.raises(ValueError) as exc_info:
+        converter(BAD_RAW_PAYLOAD)
+    assert str(exc_info.value) == "Invalid isoformat string: 'do'"
+    assert "Error converting" in caplog.text
+
+
+@dataclasses.dataclass(frozen=True)
+class FrozenItem:
+    name: str
+    count: int = 0
+
+
+@dataclasses.dataclass
+class LazyInput:
+    items: typing.List[FrozenItem]
+    by_name: typing.Dict[str, FrozenItem]
+    dates: typing.List[datetime.date]
+    label: str = "default"
+
+
+def lazy_func(context, event: LazyInput) -> str:  # type: ignore[no-untyped-def]
+    return ""
+
+
+def test_lazy_converter_converts_fields_on_access() -> None:
+    parse_result = parse_function_schema(lazy_func, "lazy_func")
+    assert parse_result.class_node
+    payload = {
+        "items": [{"name": "a", "count": 1.0}],
+        "by_name": {"b": {"name": "b", "count": 2}},
+        "dates": ["not a date"],
+        "label": "label",
+    }
+    event = compile_payload_converter(parse_result.class_node, lazy=True)(payload)
+    assert isinstance(event, LazyInput)
+    assert "items" not in vars(event)
+    assert event.label == "label"
+    [item] = event.items
+    assert isinstance(item, FrozenItem)
+    assert (item.name, item.count, type(item.count)) == ("a", 1, int)
+    assert event.items is event.items
+    assert event.by_name["b"].count == 2
+    assert repr(event.by_name["b"]) == "FrozenItem(name='b', count=2)"
+    # Fields that are never accessed are never converted
+    with pytest.raises(ValueError):
+        event.dates
+
+
+def test_lazy_converter_matches_eager_converter(expected_return_value: DummyInput) -> None:
+    parse_result = parse_function_schema(dummy_func_1, "dummy_func_1")
+    assert parse_result.class_node
+    event = compile_payload_converter(parse_result.class_node, lazy=True)(RAW_PAYLOAD)
+    assert _as_comparable(event.parent_class.child.timestamp) == _as_comparable(
+        expected_return_value.parent_class.child.timestamp
+    )
+    assert event.parent_class.some_value == expected_return_value.parent_class.some_value
+    assert event.set_field == expected_return_value.set_field
+    assert event.map_field == expected_return_value.map_field
+    assert event.optional_field is None
@@ -0,0 +1,81 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import atexit
+from typing import Iterator, List
+
+import pytest
+
+from compute_modules.annotations import function
+from compute_modules.context import QueryContext
+from compute_modules.function_registry import function_registry
+from compute_modules.function_registry.types import FunctionOptions
+from compute_modules.startup import start_compute_module
+
+# Importing the annotations registers the Compute Module to start at exit, which needs a runtime to talk to
+atexit.unregister(start_compute_module)
+
+
+@pytest.fixture(autouse=True)
+def empty_registry(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    for name in ("REGISTERED_FUNCTIONS", "FUNCTION_SCHEMA_CONVERSIONS", "IS_FUNCTION_CONTEXT_TYPED"):
+        monkeypatch.setattr(function_registry, name, {})
+    monkeypatch.setattr(function_registry, "FUNCTION_OPTIONS", {})
+    monkeypatch.setattr(function_registry, "FUNCTION_SCHEMAS", [])
+    yield
+
+
+def test_function_decorator_registers_options() -> None:
+    @function(timeout=2.5)
+    def with_timeout(context: QueryContext, event: str) -> str:
+        return event
+
+    @function
+    def without_options(context: QueryContext, event: str) -> str:
+        return event
+
+    assert function_registry.REGISTERED_FUNCTIONS == {"with_timeout": with_timeout, "without_options": without_options}
+    assert function_registry.FUNCTION_OPTIONS["with_timeout"] == FunctionOptions(timeout=2.5)
+    assert function_registry.FUNCTION_OPTIONS["without_options"] == FunctionOptions()
+
+
+def test_function_decorator_registers_lazy_input() -> None:
+    @function(lazy_input=True)
+    def lazy(context: QueryContext, event: str) -> str:
+        return event
+
+    assert function_registry.FUNCTION_OPTIONS["lazy"] == FunctionOptions(lazy_input=True)
+
+
+def test_invalid_max_batch_size_is_rejected() -> None:
+    with pytest.raises(ValueError, match="max_batch_size must be >= 1"):
+
+        @function(batch=True, max_batch_size=0)
+        def batched(context: List[QueryContext], events: List[str]) -> List[str]:
+            return events
+
+
+def test_invalid_quotas_are_rejected() -> None:
+    with pytest.raises(ValueError, match="max_concurrency must be >= 1"):
+
+        @function(max_concurrency=0)
+        def unlimited(context: QueryContext, event: str) -> str:
+            return event
+
+    with pytest.raises(ValueError, match="cannot have a max_concurrency or weight"):
+
+        @function(batch=True, weight=2)
+        def batched(context: List[QueryContext], events: List[str]) -> List[str]:
+            return events
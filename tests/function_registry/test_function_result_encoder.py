@@ -0,0 +1,182 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import array
+import dataclasses
+import datetime
+import decimal
+import json
+from typing import Any, ClassVar, Dict, List, Optional, Set, TypedDict
+
+import pytest
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.client.metrics import COUNTER_FAILED_JOBS
+from compute_modules.context import QueryContext
+from compute_modules.function_registry.function_payload_converter import compile_payload_converter
+from compute_modules.function_registry.function_result_encoder import compile_result_encoder, encode_result
+from compute_modules.function_registry.function_schema_parser import parse_function_schema
+from compute_modules.function_registry.types import FloatArray
+from tests.conftest import ServiceFactory
+
+
+@dataclasses.dataclass
+class Event:
+    when: datetime.datetime
+    day: datetime.date
+    amount: decimal.Decimal
+    blob: bytes
+
+
+class Summary:
+    name: str
+    count: int
+    ratio: float
+    enabled: bool
+    tags: Set[str]
+    events: List[Event]
+    by_key: Dict[bytes, Event]
+    latest: Optional[Event]
+
+    def __init__(
+        self,
+        name: str,
+        count: int,
+        ratio: float,
+        enabled: bool,
+        tags: Set[str],
+        events: List[Event],
+        by_key: Dict[bytes, Event],
+        latest: Optional[Event],
+    ) -> None:
+        self.name = name
+        self.count = count
+        self.ratio = ratio
+        self.enabled = enabled
+        self.tags = tags
+        self.events = events
+        self.by_key = by_key
+        self.latest = latest
+
+
+class Counts(TypedDict):
+    day: datetime.date
+    total: int
+
+
+def summarize(context: QueryContext, event: Summary) -> Summary:
+    return event
+
+
+EVENT = Event(
+    when=datetime.datetime(2024, 9, 4, 23, 4, 55, 9000),
+    day=datetime.date(2024, 9, 4),
+    amount=decimal.Decimal("1.50"),
+    blob=b"YQ==",
+)
+ENCODED_EVENT = {"when": 1725491095009, "day": "2024-09-04", "amount": "1.50", "blob": "YQ=="}
+
+
+def test_results_are_encoded_like_inputs_are_decoded() -> None:
+    summary = Summary("né", 3, 0.5, True, {"a"}, [EVENT], {b"key": EVENT}, None)
+    body = compile_result_encoder(Summary)(summary)
+    assert json.loads(body) == {
+        "name": "né",
+        "count": 3,
+        "ratio": 0.5,
+        "enabled": True,
+        "tags": ["a"],
+        "events": [ENCODED_EVENT],
+        "by_key": {"key": ENCODED_EVENT},
+        "latest": None,
+    }
+    # Decoding the encoded result as an input gives back the same values
+    parse_result = parse_function_schema(summarize, "summarize")
+    assert parse_result.output_type is Summary
+    assert parse_result.class_node
+    decoded = compile_payload_converter(parse_result.class_node)(json.loads(body))
+    assert (decoded.name, decoded.tags, decoded.events, decoded.by_key) == ("né", {"a"}, [EVENT], {b"key": EVENT})
+
+
+def test_aware_timestamps_are_encoded_as_utc_millis() -> None:
+    when = datetime.datetime(2024, 9, 4, 23, 4, 55, 9999, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))
+    assert compile_result_encoder(datetime.datetime)(when) == b"1725483895009"
+
+
+@pytest.mark.parametrize(
+    "output_type, result, expected",
+    [
+        (Dict[str, int], {"a": 1}, {"a": 1}),
+        (List[float], [1, 2.5], [1, 2.5]),
+        (FloatArray, array.array("d", [1.5, 2]), [1.5, 2.0]),
+        (Counts, {"day": datetime.date(2024, 1, 2), "total": 3}, {"day": "2024-01-02", "total": 3}),
+        (Optional[Event], None, None),
+        # Results not of their declared type, e.g. cached results, are encoded based on their actual type
+        (Event, {"when": 1}, {"when": 1}),
+        (int, "not an int", "not an int"),
+        (Any, {1: EVENT}, {"1": ENCODED_EVENT}),
+    ],
+)
+def test_result_encoding(output_type: Any, result: Any, expected: Any) -> None:
+    assert json.loads(compile_result_encoder(output_type)(result)) == expected
+
+
+class Point:
+    ORIGIN: ClassVar[List[int]] = [0, 0]
+    DIMENSIONS: ClassVar = 2
+    x: int
+    y: int
+
+    def __init__(self, x: int, y: int) -> None:
+        self.x = x
+        self.y = y
+        self._norm = None
+
+
+
+def test_results_without_a_declared_type() -> None:
+    assert json.loads(encode_result({"events": [EVENT]})) == {"events": [ENCODED_EVENT]}
+    assert json.loads(encode_result([Point(1, 2)])) == [{"x": 1, "y": 2}]
+    with pytest.raises(TypeError):
+        encode_result(object())
+
+
+@pytest.mark.parametrize("result", [summarize, json, ValueError("not a result")])
+def test_objects_that_are_not_documented_types_are_rejected(result: Any) -> None:
+    with pytest.raises(TypeError):
+        encode_result(result)
+    with pytest.raises(TypeError):
+        compile_result_encoder(Point)(result)
+
+
+def test_class_variables_are_not_fields() -> None:
+    assert json.loads(compile_result_encoder(Point)(Point(1, 2))) == {"x": 1, "y": 2}
+
+
+@pytest.mark.parametrize("output_type", [None, Event])
+def test_results_that_cannot_be_serialized_fail_their_job(
+    runtime: LocalRuntime, make_service: ServiceFactory, output_type: Any
+) -> None:
+    def unserializable(context: Any, event: Any) -> Any:
+        return Event(when=object(), day=EVENT.day, amount=EVENT.amount, blob=EVENT.blob)  # type: ignore[arg-type]
+
+    output_types = {"unserializable": output_type} if output_type is not None else None
+    service = make_service({"unserializable": unserializable}, function_output_types=output_types)
+    runtime.enqueue_job("unserializable", {}, job_id="1")
+    job = service.get_job_or_none()
+    assert job is not None
+    service.handle_job(job)
+    assert "Failed to serialize result" in json.loads(runtime.results["1"])["exception"]
+    assert service.metrics.counter(COUNTER_FAILED_JOBS, "unserializable") == 1
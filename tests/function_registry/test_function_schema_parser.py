@@ -13,15 +13,22 @@
 #  limitations under the License.
 
 
-from typing import Optional
+import array
+from dataclasses import dataclass
+from typing import Any, Optional
 
 import pytest
 
+from compute_modules.context import QueryContext
+from compute_modules.function_registry.function_payload_converter import compile_payload_converter, convert_payload
 from compute_modules.function_registry.function_schema_parser import parse_function_schema
 from compute_modules.function_registry.types import ComputeModuleFunctionSchema, FunctionOutputType
 from tests.function_registry.dummy_app import (
+    ArrayInput,
     DummyInput,
     ParentClass,
+    dummy_array_func,
+    dummy_batch_func,
     dummy_func_1,
     dummy_func_2,
     dummy_func_3,
@@ -137,6 +144,95 @@ def test_function_schema_parser() -> None:
     assert parse_result.is_context_typed is False
 
 
+def test_batch_function_schema_is_that_of_an_item() -> None:
+    """The schema of a batch function describes a single job, not the lists the function is called with"""
+    parse_result = parse_function_schema(dummy_batch_func, "dummy_batch_func", batch=True)
+    assert parse_result.function_schema["inputs"] == EXPECTED_INPUTS
+    assert parse_result.function_schema["output"] == EXPECTED_OUTPUT_1
+    assert parse_result.class_node is not None
+    assert parse_result.class_node["constructor"] is DummyInput
+    assert parse_result.is_context_typed
+
+
+def test_array_inputs() -> None:
+    """Numeric arrays have the schema of lists & are decoded into array.array"""
+    parse_result = parse_function_schema(dummy_array_func, "dummy_array_func")
+    float_list = {"type": "list", "list": {"elementsType": {"type": "float", "float": {}}}}
+    assert [(i["name"], i["dataType"]) for i in parse_result.function_schema["inputs"]] == [
+        ("values", float_list),
+        ("counts", {"type": "list", "list": {"elementsType": {"type": "integer", "integer": {}}}}),
+        ("rows", {"type": "list", "list": {"elementsType": float_list}}),
+    ]
+    assert parse_result.class_node is not None
+    payload = {"values": [1, 2.5], "counts": [1, 2, 3], "rows": [[0.5], []]}
+    for event in (
+        convert_payload(payload, parse_result.class_node),
+        compile_payload_converter(parse_result.class_node)(payload),
+    ):
+        assert isinstance(event, ArrayInput)
+        assert event.values == array.array("d", [1.0, 2.5])
+        assert event.counts == array.array("q", [1, 2, 3])
+        assert event.rows == [array.array("d", [0.5]), array.array("d")]
+
+
+def test_int_array_inputs_accept_integers_sent_as_floats() -> None:
+    """Like the elements of List[int], integers sent as floats are converted to int"""
+    parse_result = parse_function_schema(dummy_array_func, "dummy_array_func")
+    assert parse_result.class_node is not None
+    payload = {"values": [], "counts": [1.0, 2, 3.0], "rows": []}
+    for event in (
+        convert_payload(payload, parse_result.class_node),
+        compile_payload_converter(parse_result.class_node)(payload),
+    ):
+        assert event.counts == array.array("q", [1, 2, 3])
+
+
+def test_ndarray_inputs() -> None:
+    numpy = pytest.importorskip("numpy")
+    npt = pytest.importorskip("numpy.typing")
+
+    @dataclass
+    class NDArrayInput:
+        values: npt.NDArray[numpy.float32]
+        flags: npt.NDArray[numpy.bool_]
+
+    def function(context: QueryContext, event: NDArrayInput) -> str:
+        return ""
+
+    parse_result = parse_function_schema(function, "function")
+    assert [i["dataType"]["list"]["elementsType"]["type"] for i in parse_result.function_schema["inputs"]] == [
+        "float",
+        "boolean",
+    ]
+    assert parse_result.class_node is not None
+    event = compile_payload_converter(parse_result.class_node)({"values": [1, 2.5], "flags": [True, False]})
+    assert event.values.dtype == numpy.float32
+    assert event.values.tolist() == [1.0, 2.5]
+    assert event.flags.tolist() == [True, False]
+
+
+def test_exception_ndarray_without_dtype() -> None:
+    pytest.importorskip("numpy")
+    npt = pytest.importorskip("numpy.typing")
+
+    @dataclass
+    class NDArrayInput:
+        values: npt.NDArray[Any]
+
+    def function(context: QueryContext, event: NDArrayInput) -> str:
+        return ""
+
+    with pytest.raises(ValueError) as exc_info:
+        parse_function_schema(function, "function")
+    assert "NDArray type hints must have one of the dtypes" in str(exc_info.value)
+
+
+def test_exception_batch_function_without_lists() -> None:
+    with pytest.raises(ValueError) as exc_info:
+        parse_function_schema(dummy_func_1, "dummy_func_1", batch=True)
+    assert "must annotate event as a List[...]" in str(exc_info.value)
+
+
 def test_function_schema_parser_no_type_hints() -> None:
     """Test 'happy' path, but on a function with no type hints"""
     parse_result = parse_function_schema(dummy_func_2, "dummy_func_2")
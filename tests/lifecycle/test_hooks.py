@@ -0,0 +1,105 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import gc
+import logging
+from typing import Iterator, List
+
+import pytest
+
+from compute_modules.lifecycle import hooks
+
+
+@pytest.fixture
+def preload_hooks(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setattr(hooks, "PRELOAD_HOOKS", [])
+    monkeypatch.setattr(hooks, "_preload_hooks_ran", False)
+    yield
+    gc.unfreeze()
+
+
+def test_preload_hooks_run_once_and_freeze_gc(preload_hooks: None) -> None:
+    calls: List[str] = []
+    hooks.add_preload_hook(lambda: calls.append("first"))
+    hooks.add_preload_hook(lambda: calls.append("second"))
+    hooks.run_preload_hooks()
+    hooks.run_preload_hooks()
+    assert calls == ["first", "second"]
+    assert gc.get_freeze_count() > 0
+    assert gc.isenabled()
+
+
+def test_gc_is_re_enabled_when_a_hook_fails(preload_hooks: None) -> None:
+    def failing_hook() -> None:
+        raise RuntimeError("Model not found")
+
+    hooks.add_preload_hook(failing_hook)
+    with pytest.raises(RuntimeError):
+        hooks.run_preload_hooks()
+    assert gc.isenabled()
+
+
+@pytest.fixture
+def worker_hooks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(hooks, "WORKER_START_HOOKS", {})
+    monkeypatch.setattr(hooks, "WORKER_STOP_HOOKS", [])
+    monkeypatch.setattr(hooks, "WORKER_RESOURCES", {})
+    monkeypatch.setattr(hooks, "get_internal_logger", lambda: logging.getLogger("test_hooks"))
+
+
+def test_worker_start_hooks_store_resources_by_name(worker_hooks: None) -> None:
+    def http_session() -> str:
+        return "session"
+
+    async def db_pool() -> str:
+        return "pool"
+
+    hooks.add_worker_start_hook(http_session)
+    hooks.add_worker_start_hook(db_pool)
+    hooks.run_worker_start_hooks(asyncio.run)
+    assert hooks.get_worker_resources() == {"http_session": "session", "db_pool": "pool"}
+
+
+def test_worker_start_hooks_cannot_create_the_same_resource(worker_hooks: None) -> None:
+    """Hooks with the same name, e.g. from different modules, would otherwise overwrite each other's resource"""
+
+    def client() -> str:
+        return "search"
+
+    hooks.add_worker_start_hook(client)
+    with pytest.raises(ValueError, match="already creates the resource client"):
+        hooks.add_worker_start_hook(lambda: "storage", name="client")
+    hooks.add_worker_start_hook(lambda: "storage", name="storage_client")
+    hooks.run_worker_start_hooks(asyncio.run)
+    assert hooks.get_worker_resources() == {"client": "search", "storage_client": "storage"}
+
+
+def test_worker_stop_hooks_run_in_reverse_despite_failures(worker_hooks: None) -> None:
+    calls: List[str] = []
+
+    def close_session() -> None:
+        calls.append("session")
+
+    def close_pool() -> None:
+        calls.append("pool")
+        raise RuntimeError("Pool already closed")
+
+    hooks.add_worker_stop_hook(close_session)
+    hooks.add_worker_stop_hook(close_pool)
+    hooks.WORKER_RESOURCES["http_session"] = "session"
+    asyncio.run(hooks.run_worker_stop_hooks_async())
+    assert calls == ["pool", "session"]
+    assert hooks.get_worker_resources() == {}
@@ -0,0 +1,140 @@
+#  Copyright 2024 Palantir Technologies, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Sequence
+
+import pytest
+
+from benchmarks.runtime_stand_in import LocalRuntime
+from compute_modules.client.async_query_client import AsyncInternalQueryService
+from compute_modules.tracing import Span, SpanExporter, add_span_exporter, get_current_span, start_span
+from compute_modules.tracing.exporters import SPAN_EXPORTERS
+from tests.conftest import ServiceFactory
+
+
+class _ListExporter(SpanExporter):
+    def __init__(self) -> None:
+        self.traces: List[List[Dict[str, Any]]] = []
+
+    def export(self, spans: Sequence[Span]) -> None:
+        self.traces.append([span.to_dict() for span in spans])
+
+
+def test_spans_of_sampled_job_are_written(tmp_path: Any, runtime: LocalRuntime, make_service: ServiceFactory) -> None:
+    def square(context: Dict[str, Any], event: Any) -> Any:
+        get_current_span().set_attribute("input", event)
+        with start_span("compute", method="multiply"):
+            result = event * event
+        if event < 0:
+            raise ValueError("Negative input")
+        return result
+
+    path = os.path.join(tmp_path, "spans.jsonl")
+    service = make_service({"square": square}, TRACE_FILE=path, TRACE_SAMPLE_RATE="1")
+    for i, event in enumerate([3, -1]):
+        runtime.enqueue_job("square", event, job_id=str(i))
+        job = service.get_job_or_none()
+        assert job is not None
+        service.handle_job(job)
+    with open(path) as f:
+        spans = [json.loads(line) for line in f]
+
+    by_job: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for span in spans:
+        by_job.setdefault(span["trace_id"], {})[span["name"]] = span
+    assert len(by_job) == 2
+    for trace in by_job.values():
+        assert set(trace) == {
+            "job",
+            "get_job_or_none",
+            "convert_payload",
+            "handler",
+            "compute",
+            "serialize_result",
+            "report_job_result",
+        }
+        root = trace["job"]
+        assert root["parent_id"] is None
+        assert root["attributes"]["query_type"] == "square"
+        assert root["attributes"]["payload_bytes"] > 0
+        assert root["attributes"]["pid"] == os.getpid()
+        assert trace["compute"]["parent_id"] == trace["handler"]["span_id"]
+        assert trace["handler"]["parent_id"] == root["span_id"]
+        assert trace["compute"]["attributes"] == {"method": "multiply"}
+        assert root["start_time"] <= trace["get_job_or_none"]["end_time"] <= trace["handler"]["start_time"]
+        assert trace["report_job_result"]["end_time"] <= root["end_time"]
+    handlers = {trace["job"]["attributes"]["job_id"]: trace["handler"] for trace in by_job.values()}
+    assert handlers["0"]["attributes"] == {"input": 3} and handlers["0"]["error"] is None
+    assert handlers["1"]["error"] == "ValueError: Negative input"
+
+
+def test_jobs_that_are_not_sampled_are_not_traced(
+    tmp_path: Any, runtime: LocalRuntime, make_service: ServiceFactory
+) -> None:
+    recording: List[bool] = []
+
+    def identity(context: Dict[str, Any], event: Any) -> Any:
+        recording.append(get_current_span().is_recording())
+        with start_span("ignored") as span:
+            span.set_attribute("ignored", True)
+        return event
+
+    path = os.path.join(tmp_path, "spans.jsonl")
+    service = make_service({"identity": identity}, TRACE_FILE=path, TRACE_SAMPLE_RATE="0")
+    runtime.enqueue_job("identity", 1)
+    job = service.get_job_or_none()
+    assert job is not None
+    service.handle_job(job)
+    assert recording == [False]
+    assert not os.path.exists(path)
+    assert not service.tracer._jobs
+
+
+def test_registered_exporter_receives_async_traces(runtime: LocalRuntime, make_service: ServiceFactory) -> None:
+    async def identity(context: Dict[str, Any], event: Any) -> Any:
+        with start_span("sleep"):
+            await asyncio.sleep(0.01)
+        return event
+
+    exporter = _ListExporter()
+    add_span_exporter(exporter)
+    try:
+        service = make_service({"identity": identity}, service_class=AsyncInternalQueryService, TRACE_SAMPLE_RATE="1")
+    finally:
+        SPAN_EXPORTERS.remove(exporter)
+    assert isinstance(service, AsyncInternalQueryService)
+
+    async def main() -> None:
+        job = await service.get_job_or_none_async()
+        await service.handle_job_async(job)
+
+    runtime.enqueue_job("identity", 1, job_id="job")
+    asyncio.run(main())
+    assert len(exporter.traces) == 1
+    spans = {span["name"]: span for span in exporter.traces[0]}
+    assert spans["sleep"]["parent_id"] == spans["handler"]["span_id"]
+    assert spans["sleep"]["duration_ms"] >= 10
+    assert spans["job"]["attributes"]["job_id"] == "job"
+
+
+def test_exporters_must_implement_export() -> None:
+    class IncompleteExporter(SpanExporter):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteExporter()  # type: ignore[abstract]